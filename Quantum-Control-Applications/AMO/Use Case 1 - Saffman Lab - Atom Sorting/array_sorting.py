@@ -3,6 +3,7 @@ from qm import QuantumMachinesManager
 from qm import SimulationConfig
 from qm import LoopbackInterface
 from config_array_sorting import *
+from rearrangement_planner import plan_2d_rearrangement, encode_schedule
 import matplotlib.pyplot as plt
 
 ########################################
@@ -13,9 +14,15 @@ piecewise_chirp = False  # Enables the piecewise chirp decomposition for minimal
 analog_occupation_matrix = False  # Reads the current occupation matrix via analog readout
 raw_adc_acquisition = True  # Acquires chirp tones to plot spectrograms - output should be connected to OPX analog input
 single_run = True  # Runs the sorting only once, else is infinite loop
+rearrangement_2d = False  # Sorts the full 2D array with the parallel moves planned by rearrangement_planner.py
+precomputed_chirp_table = False  # Reads the piecewise chirp rates from a precomputed table instead of computing them
 maximum_chirp_rate = None  # Maximum constant chirp rate in Hz/ns, None uses default pulse length from config
 if maximum_chirp_rate is not None and piecewise_chirp:
     raise ValueError("Warning: dynamic pulse duration with piecewise chirps is not implemented.")
+# Chirp pulse durations in ns tabulated in the precomputed chirp table (sorted in increasing order)
+chirp_table_durations = [constant_pulse_length]
+if precomputed_chirp_table and constant_pulse_length not in chirp_table_durations:
+    raise ValueError("The chirp pulse duration must be one of the tabulated durations.")
 # Initial occupation matrix in 2D
 atom_location_list = [
     list(map(int, np.random.choice([0, 1], size=number_of_columns, p=[0.4, 0.6]))) for i in range(number_of_rows)
@@ -420,6 +427,88 @@ def calculate_piecewise_chirp_rates(nb_of_tweezers_python, detunings, pulse_dura
     return chirp_rates
 
 
+def minimum_jerk_chirp_table(site_spacing, nb_of_sites, pulse_durations, nb_of_segments):
+    """
+    This function precomputes the piecewise chirp rates of the minimum jerk trajectory for all the possible moves, as
+    calculate_piecewise_chirp_rates() does in real-time. The table is flattened in order to be loaded in a QUA vector
+    and the chirp rates of a move are stored at the index
+    ((duration_index * (2 * nb_of_sites - 1) + distance + nb_of_sites - 1) * nb_of_segments + segment)
+    where distance is the signed move distance in sites.
+
+    :param site_spacing: A python variable for the frequency spacing between adjacent sites in Hz (float).
+    :param nb_of_sites: A python variable for the number of sites along the moving axis (int).
+    :param pulse_durations: A python list of the tabulated chirp pulse durations in ns (int).
+    :param nb_of_segments: A python variable for the number of segments contained in the picewise chirp (int).
+
+    :return: A python list of the chirp rates in mHz/ns (int).
+    """
+    tau = np.arange(1, nb_of_segments + 1) / nb_of_segments  # Normalized time
+    linear_piece = 30 * tau**2 - 60 * tau**3 + 30 * tau**4  # minimal jerk trajectory
+    distances = np.arange(-(nb_of_sites - 1), nb_of_sites)
+    table = [
+        np.outer(distances * int(site_spacing), linear_piece) / (int(duration) // 1000)  # /1000 to go to 'mHz/ns'
+        for duration in pulse_durations
+    ]
+    return [int(x) for x in np.round(np.array(table)).flatten()]
+
+
+def find_chirp_table_duration_index(pulse_duration, tabulated_durations):
+    """
+    This macro finds the index of the shortest tabulated chirp duration which is longer than the chirp pulse duration.
+    All the tabulated durations are scanned in order to keep a constant latency.
+
+    :param pulse_duration: A QUA variable for the chirp pulse duration in ns (int).
+    :param tabulated_durations: A 1D QUA vector for the tabulated chirp pulse durations in ns sorted in increasing order (int).
+
+    :return: A QUA variable for the duration index in the chirp table (int).
+    """
+    # QUA variables declaration
+    duration_index = declare(int)
+    i = declare(int)
+    # Default to the longest tabulated duration
+    assign(duration_index, tabulated_durations.length() - 1)
+    with for_(i, tabulated_durations.length() - 1, i >= 0, i - 1):
+        with if_(tabulated_durations[i] >= pulse_duration):
+            assign(duration_index, i)
+
+    return duration_index
+
+
+def lookup_piecewise_chirp_rates(
+    nb_of_tweezers_python, detunings, duration_index, chirp_table, site_spacing, nb_of_sites, nb_of_segments
+):
+    """
+    This macro gets the piecewise chirp rates of the minimum jerk trajectory from the table precomputed by
+    minimum_jerk_chirp_table(). It replaces calculate_piecewise_chirp_rates() with a constant latency since no
+    fixed-point arithmetic is performed in real-time.
+
+    :param nb_of_tweezers_python: A python variable for the number of available tweezers.
+    :param detunings: A 1D QUA vector for each tweezer detuning in Hz (int).
+    :param duration_index: A QUA variable for the duration index in the chirp table (int).
+    :param chirp_table: A 1D QUA vector for the precomputed chirp table in mHz/ns (int).
+    :param site_spacing: A python variable for the frequency spacing between adjacent sites in Hz (float).
+    :param nb_of_sites: A python variable for the number of sites along the moving axis (int).
+    :param nb_of_segments: A python variable for the number of segments contained in the picewise chirp (int).
+
+    :return: A Python 2D array whose rows are 1D QUA vectors for each tweezer piecewise chirp rate in mHz/ns
+    """
+    # QUA variables declaration
+    chirp_rates = [declare(int, value=[int(x) for x in np.zeros(nb_of_segments)]) for _ in range(nb_of_tweezers_python)]
+    table_index = declare(int)  # Index of the first segment of the current move in the chirp table
+    step = declare(int)
+    # Copy the chirp rates of the move corresponding to each tweezer detuning
+    for tweezer_index in range(nb_of_tweezers_python):
+        assign(
+            table_index,
+            (duration_index * (2 * nb_of_sites - 1) + detunings[tweezer_index] / int(site_spacing) + nb_of_sites - 1)
+            * nb_of_segments,
+        )
+        with for_(step, 0, step < nb_of_segments, step + 1):
+            assign(chirp_rates[tweezer_index][step], chirp_table[table_index + step])
+
+    return chirp_rates
+
+
 def set_tweezers_frequencies_and_phases(nb_of_tweezers_python, current_frequencies, row_frequency, tweezer_phases):
     """
     This macro sets the previously calculated frequencies and phases to the corresponding tweezers.
@@ -439,6 +528,73 @@ def set_tweezers_frequencies_and_phases(nb_of_tweezers_python, current_frequenci
         update_frequency("column_{}".format(index + 1), current_frequencies[index])
 
 
+def get_2d_move_step(
+    step_record, nb_of_tweezers_python, nb_of_row_tweezers_python, row_frequencies, column_frequencies
+):
+    """
+    This macro converts one step of the 2D move schedule received from the host into the amplitudes, initial
+    frequencies and detunings of the row and column tweezers. For moves along the rows, the row tweezers select the
+    rows to move in parallel and the column tweezers are chirped, and conversely for the moves along the columns.
+
+    :param step_record: A 1D QUA vector (input stream) for the step: [axis, number of lines, number of moves, lines..., sources..., destinations...] (int).
+    :param nb_of_tweezers_python: A python variable for the maximum number of available column tweezers, i.e. the size of the padded lists of step_record.
+    :param nb_of_row_tweezers_python: A python variable for the maximum number of available row tweezers.
+    :param row_frequencies: A 1D QUA vector for the frequencies of the rows in Hz (int).
+    :param column_frequencies: A 1D QUA vector for the frequencies of the columns in Hz (int).
+
+    :return: Six QUA 1D vectors for the amplitude, frequency and detuning of the row and column tweezers.
+    """
+    # QUA variables declaration
+    row_amplitudes = declare(fixed, size=nb_of_row_tweezers_python)
+    row_tweezer_frequencies = declare(int, size=nb_of_row_tweezers_python)
+    row_detunings = declare(int, size=nb_of_row_tweezers_python)
+    column_amplitudes = declare(fixed, size=nb_of_tweezers_python)
+    column_tweezer_frequencies = declare(int, size=nb_of_tweezers_python)
+    column_detunings = declare(int, size=nb_of_tweezers_python)
+    is_row_move = declare(bool)  # True if the atoms move along the rows
+    i = declare(int)
+    assign(is_row_move, step_record[0] == 0)
+    # Offsets of the lines, sources and destinations in the step record
+    lines = 3
+    sources = 3 + nb_of_tweezers_python
+    destinations = 3 + 2 * nb_of_tweezers_python
+    # Row tweezers: static on the selected rows or chirped from the source to the destination rows
+    with for_(i, 0, i < nb_of_row_tweezers_python, i + 1):
+        with if_(is_row_move):
+            assign(row_amplitudes[i], Util.cond(i < step_record[1], 1.0, 0.0))
+            assign(row_tweezer_frequencies[i], row_frequencies[step_record[lines + i]])
+            assign(row_detunings[i], 0)
+        with else_():
+            assign(row_amplitudes[i], Util.cond(i < step_record[2], 1.0, 0.0))
+            assign(row_tweezer_frequencies[i], row_frequencies[step_record[sources + i]])
+            assign(
+                row_detunings[i],
+                row_frequencies[step_record[destinations + i]] - row_frequencies[step_record[sources + i]],
+            )
+    # Column tweezers: chirped from the source to the destination columns or static on the selected columns
+    with for_(i, 0, i < nb_of_tweezers_python, i + 1):
+        with if_(is_row_move):
+            assign(column_amplitudes[i], Util.cond(i < step_record[2], 1.0, 0.0))
+            assign(column_tweezer_frequencies[i], column_frequencies[step_record[sources + i]])
+            assign(
+                column_detunings[i],
+                column_frequencies[step_record[destinations + i]] - column_frequencies[step_record[sources + i]],
+            )
+        with else_():
+            assign(column_amplitudes[i], Util.cond(i < step_record[1], 1.0, 0.0))
+            assign(column_tweezer_frequencies[i], column_frequencies[step_record[lines + i]])
+            assign(column_detunings[i], 0)
+
+    return (
+        row_amplitudes,
+        row_tweezer_frequencies,
+        row_detunings,
+        column_amplitudes,
+        column_tweezer_frequencies,
+        column_detunings,
+    )
+
+
 ###############
 # QUA program #
 ###############
@@ -474,6 +630,13 @@ with program() as atom_sorting:
     column_frequencies_qua = declare(int, value=[int(x) for x in column_if])
     # QUA variable containing the tweezer phases
     tweezer_phases_qua = declare(fixed, value=phases_list)
+    # QUA variables containing the precomputed minimum jerk chirp table and its tabulated durations
+    if piecewise_chirp and precomputed_chirp_table:
+        chirp_table_qua = declare(
+            int,
+            value=minimum_jerk_chirp_table(column_spacing, number_of_columns, chirp_table_durations, n_segment_python),
+        )
+        chirp_table_durations_qua = declare(int, value=[int(x) for x in chirp_table_durations])
 
     with while_(infinite_run):
         # Reset variables for new loop
@@ -530,8 +693,18 @@ with program() as atom_sorting:
                 chirp_pulse_duration_qua = calculate_pulse_length(
                     detuning_qua, constant_pulse_length, max_rate=maximum_chirp_rate
                 )
-                # Derive the chirp rates defined as piecewise or constant
-                if piecewise_chirp:
+                # Derive the chirp rates defined as piecewise (computed or read from the precomputed table) or constant
+                if piecewise_chirp and precomputed_chirp_table:
+                    piecewise_chirp_rates_qua = lookup_piecewise_chirp_rates(
+                        max_number_of_tweezers,
+                        detuning_qua,
+                        find_chirp_table_duration_index(chirp_pulse_duration_qua, chirp_table_durations_qua),
+                        chirp_table_qua,
+                        column_spacing,
+                        number_of_columns,
+                        n_segment_python,
+                    )
+                elif piecewise_chirp:
                     piecewise_chirp_rates_qua = calculate_piecewise_chirp_rates(
                         max_number_of_tweezers, detuning_qua, chirp_pulse_duration_qua, n_segment_python
                     )
@@ -599,6 +772,182 @@ with program() as atom_sorting:
         if raw_adc_acquisition:
             raw_adc.input2().save_all("raw_data")
 
+# --> Full 2D atom rearrangement program with the move schedule streamed from the host
+with program() as atom_sorting_2d:
+    # Variables that need resetting
+    received_full_array = declare(bool, value=False)  # Flag indicating the end of occupation matrix readout
+
+    # Debug variables
+    raw_adc = declare_stream(adc_trace=True)  # Raw ADC trace for spectrograms
+    data_stream = declare_stream()  # stream used to send the occupation matrix to the host
+    infinite_run = declare(bool, value=True)  # Flag used to perform the sorting only once instead of infinite_loop_()
+
+    # Input streams receiving the number of steps and each step of the schedule computed by the host
+    schedule_length = declare_input_stream(int, name="schedule_length")
+    schedule_step = declare_input_stream(int, name="schedule_step", size=3 + 3 * max_number_of_tweezers)
+    step = declare(int)
+    # QUA variable containing the row frequencies
+    row_frequencies_qua = declare(int, value=[int(x) for x in row_frequencies_list])
+    # QUA variable containing the column frequencies
+    column_frequencies_qua = declare(int, value=[int(x) for x in column_if])
+    # QUA variable containing the tweezer phases
+    tweezer_phases_qua = declare(fixed, value=phases_list)
+    # QUA variable containing the chirp pulse duration
+    move_duration_qua = declare(int)
+    # QUA variables containing the precomputed minimum jerk chirp tables of both AODs and their tabulated durations
+    if piecewise_chirp and precomputed_chirp_table:
+        row_chirp_table_qua = declare(
+            int, value=minimum_jerk_chirp_table(row_spacing, number_of_rows, chirp_table_durations, n_segment_python)
+        )
+        column_chirp_table_qua = declare(
+            int,
+            value=minimum_jerk_chirp_table(column_spacing, number_of_columns, chirp_table_durations, n_segment_python),
+        )
+        chirp_table_durations_qua = declare(int, value=[int(x) for x in chirp_table_durations])
+
+    with while_(infinite_run):
+        # Reset variables for new loop
+        assign(received_full_array, False)
+
+        ###############################################
+        # Measure occupation matrix from analog input #
+        ###############################################
+        # The occupation matrix is sent to the host through data_stream by analog_readout()
+        if analog_occupation_matrix:
+            atom_location_full, received_full_array = analog_readout(
+                number_of_rows, number_of_columns, threshold, received_full_array
+            )
+        else:
+            assign(received_full_array, True)
+
+        ################
+        # Atom sorting #
+        ################
+        with if_(received_full_array):
+            # Wait for the host to compute the move schedule
+            advance_input_stream(schedule_length)
+            with for_(step, 0, step < schedule_length, step + 1):
+                advance_input_stream(schedule_step)
+                # Get the amplitudes, frequencies and detunings of the row and column tweezers
+                (
+                    row_amplitude_qua,
+                    row_frequency_qua,
+                    row_detuning_qua,
+                    column_amplitude_qua,
+                    column_frequency_qua,
+                    column_detuning_qua,
+                ) = get_2d_move_step(
+                    schedule_step, max_number_of_tweezers, n_row_tweezers, row_frequencies_qua, column_frequencies_qua
+                )
+                # Derive the chirp pulse duration from the largest detuning of both AODs
+                row_pulse_duration_qua = calculate_pulse_length(
+                    row_detuning_qua, constant_pulse_length, max_rate=maximum_chirp_rate
+                )
+                column_pulse_duration_qua = calculate_pulse_length(
+                    column_detuning_qua, constant_pulse_length, max_rate=maximum_chirp_rate
+                )
+                assign(
+                    move_duration_qua,
+                    Util.cond(
+                        row_pulse_duration_qua > column_pulse_duration_qua,
+                        row_pulse_duration_qua,
+                        column_pulse_duration_qua,
+                    ),
+                )
+                # Derive the chirp rates defined as piecewise (computed or read from the precomputed table) or constant
+                if piecewise_chirp and precomputed_chirp_table:
+                    duration_index_qua = find_chirp_table_duration_index(move_duration_qua, chirp_table_durations_qua)
+                    row_chirp_rates_qua = lookup_piecewise_chirp_rates(
+                        n_row_tweezers,
+                        row_detuning_qua,
+                        duration_index_qua,
+                        row_chirp_table_qua,
+                        row_spacing,
+                        number_of_rows,
+                        n_segment_python,
+                    )
+                    column_chirp_rates_qua = lookup_piecewise_chirp_rates(
+                        max_number_of_tweezers,
+                        column_detuning_qua,
+                        duration_index_qua,
+                        column_chirp_table_qua,
+                        column_spacing,
+                        number_of_columns,
+                        n_segment_python,
+                    )
+                elif piecewise_chirp:
+                    row_chirp_rates_qua = calculate_piecewise_chirp_rates(
+                        n_row_tweezers, row_detuning_qua, move_duration_qua, n_segment_python
+                    )
+                    column_chirp_rates_qua = calculate_piecewise_chirp_rates(
+                        max_number_of_tweezers, column_detuning_qua, move_duration_qua, n_segment_python
+                    )
+                else:
+                    row_chirp_rates_qua = calculate_chirp_rates(n_row_tweezers, row_detuning_qua, move_duration_qua)
+                    column_chirp_rates_qua = calculate_chirp_rates(
+                        max_number_of_tweezers, column_detuning_qua, move_duration_qua
+                    )
+                # Assign the frequencies and phases to the tweezers
+                tweezers = [(f"row_{i + 1}", i, row_amplitude_qua, row_chirp_rates_qua) for i in range(n_row_tweezers)]
+                tweezers += [
+                    (f"column_{i + 1}", i, column_amplitude_qua, column_chirp_rates_qua)
+                    for i in range(max_number_of_tweezers)
+                ]
+                for i in range(n_row_tweezers):
+                    update_frequency(f"row_{i + 1}", row_frequency_qua[i])
+                for i in range(max_number_of_tweezers):
+                    update_frequency(f"column_{i + 1}", column_frequency_qua[i])
+                for element, index, _, _ in tweezers:
+                    reset_frame(element)
+                    frame_rotation(tweezer_phases_qua[index], element)
+                # Convert the chirp pulse duration in clock cycles
+                assign(move_duration_qua, move_duration_qua >> 2)
+                # align all tweezers
+                align(*elements)
+                # Wait to calculate as much as possible before playing the pulses to minimize gaps
+                if maximum_chirp_rate is not None:
+                    wait(200)
+                # ramp up power of the row and column tweezers
+                for element, index, amplitude_qua, _ in tweezers:
+                    play("blackman_up" * amp(amplitude_qua[index]), element)
+                # chirp tweezers, the static ones have a zero chirp rate
+                for element, index, amplitude_qua, chirp_rates_qua in tweezers:
+                    if piecewise_chirp:
+                        play(
+                            "constant" * amp(amplitude_qua[index]),
+                            element,
+                            chirp=(chirp_rates_qua[index], "mHz/nsec"),
+                        )  # chirp is 1D vector
+                    elif maximum_chirp_rate is None:
+                        play(
+                            "constant" * amp(amplitude_qua[index]),
+                            element,
+                            chirp=(chirp_rates_qua[index], "mHz/nsec"),
+                        )
+                    else:
+                        play(
+                            "constant" * amp(amplitude_qua[index]),
+                            element,
+                            duration=move_duration_qua,
+                            chirp=(chirp_rates_qua[index], "mHz/nsec"),
+                        )
+                # ramp down power of the row and column tweezers
+                for element, index, amplitude_qua, _ in tweezers:
+                    play("blackman_down" * amp(amplitude_qua[index]), element)
+                # Measure raw adc trace for spectrograms
+                if raw_adc_acquisition:
+                    measure("readout", "detector", raw_adc)
+            # Exit the infinite loop in case just a single sorting sequence is needed, or if the occupation matrix is
+            # fixed since a single schedule is then streamed by the host
+            if single_run or not analog_occupation_matrix:
+                assign(infinite_run, False)
+
+    with stream_processing():
+        if analog_occupation_matrix:
+            data_stream.save_all("data")
+        if raw_adc_acquisition:
+            raw_adc.input2().save_all("raw_data")
+
 #####################################
 #  Open Communication with the QOP  #
 #####################################
@@ -610,23 +959,47 @@ if not Simulation:
     # Open a quantum machine
     qm = qmm.open_qm(config)
 
-    job = qm.execute(atom_sorting)  # order_atoms
-    # job = qm.execute(freq_calibration)
-    res = job.result_handles
+    if rearrangement_2d:
+        job = qm.execute(atom_sorting_2d)
+        res = job.result_handles
+        run = 0
+        while True:
+            # Get the current occupation matrix, either from the analog readout or from the python definition
+            if analog_occupation_matrix:
+                res.data.wait_for_values((run + 1) * number_of_rows * number_of_columns)
+                occupation = res.data.fetch_all()["value"][run * number_of_rows * number_of_columns :]
+                occupation = np.reshape(occupation[: number_of_rows * number_of_columns], (number_of_rows, -1))
+            else:
+                occupation = atom_location_list
+            # Compute the parallel move schedule and stream it to the OPX
+            schedule = plan_2d_rearrangement(occupation, atom_target_list, n_row_tweezers, max_number_of_tweezers)
+            print(f"Run {run}: {len(schedule)} parallel moves")
+            job.push_to_input_stream("schedule_length", len(schedule))
+            for record in encode_schedule(schedule, max_number_of_tweezers):
+                job.push_to_input_stream("schedule_step", record)
+            run += 1
+            if single_run or not analog_occupation_matrix:
+                break
+    else:
+        job = qm.execute(atom_sorting)  # order_atoms
+        # job = qm.execute(freq_calibration)
+        res = job.result_handles
     res.wait_for_all_values()
 
     # Print atom displacement fo reach row: each pair is current --> target
-    row_count = 0
-    assign = res.get("data").fetch_all()["value"]
-
-    for item in assign:
-        if item == -1:
-            print(f"\nrow {row_count}")
-            row_count += 1
-        else:
-            print(f"{item} ", end="")
-
-    if raw_adc_acquisition:
+    if not rearrangement_2d:
+        row_count = 0
+        assign = res.get("data").fetch_all()["value"]
+
+        for item in assign:
+            if item == -1:
+                print(f"\nrow {row_count}")
+                row_count += 1
+            else:
+                print(f"{item} ", end="")
+
+    # The spectrograms are plotted row by row, so only for the row by row sorting
+    if raw_adc_acquisition and not rearrangement_2d:
         fs = 14
         raw1 = res.raw_data.fetch_all()["value"]
         plt.figure(figsize=(25, 12))
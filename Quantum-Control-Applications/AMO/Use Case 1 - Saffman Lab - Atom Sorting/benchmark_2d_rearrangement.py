@@ -0,0 +1,93 @@
+"""
+Benchmark of the 2D rearrangement planner against the row by row sorting of array_sorting.py.
+
+Random occupation matrices are drawn for several loading probabilities and sorted towards the target pattern with both
+strategies. The fill fraction of the target and the total move time (Blackman ramps + chirps) are reported and plotted.
+"""
+
+import numpy as np
+import matplotlib.pyplot as plt
+from config_array_sorting import (
+    number_of_rows,
+    number_of_columns,
+    max_number_of_tweezers,
+    n_row_tweezers,
+    column_spacing,
+    blackman_pulse_length,
+    constant_pulse_length,
+)
+from rearrangement_planner import (
+    plan_2d_rearrangement,
+    row_by_row_schedule,
+    apply_schedule,
+    schedule_duration,
+    fill_fraction,
+)
+
+###################
+# The Parameters  #
+###################
+n_shots = 1000  # Number of random occupation matrices per loading probability
+loading_probabilities = np.arange(0.4, 0.85, 0.05)
+maximum_chirp_rate = None  # Maximum constant chirp rate in Hz/ns, None uses the default pulse length from config
+rng = np.random.default_rng(seed=0)
+
+# Target occupation matrix, same as in array_sorting.py
+goal = [
+    ["1", "X", "X", "X", "X", "X", "1"],
+    ["X", "1", "X", "X", "X", "1", "X"],
+    ["X", "X", "1", "1", "1", "X", "X"],
+    ["X", "X", "1", "1", "1", "X", "X"],
+    ["X", "X", "1", "1", "1", "X", "X"],
+    ["X", "1", "X", "X", "X", "1", "X"],
+    ["1", "X", "X", "X", "X", "X", "1"],
+]
+target = np.array([[1 if site == "1" else 0 for site in row] for row in goal])
+
+###############
+# Benchmark   #
+###############
+results = {"row by row": ([], [], []), "2D": ([], [], [])}
+for p in loading_probabilities:
+    fill = {key: [] for key in results}
+    duration = {key: [] for key in results}
+    for _ in range(n_shots):
+        occupation = (rng.random((number_of_rows, number_of_columns)) < p).astype(int)
+        schedules = {
+            "row by row": row_by_row_schedule(occupation, target, max_number_of_tweezers),
+            "2D": plan_2d_rearrangement(occupation, target, n_row_tweezers, max_number_of_tweezers),
+        }
+        for key, schedule in schedules.items():
+            fill[key].append(fill_fraction(apply_schedule(occupation, schedule), target))
+            duration[key].append(
+                schedule_duration(
+                    schedule, column_spacing, blackman_pulse_length, constant_pulse_length, maximum_chirp_rate
+                )
+            )
+    for key in results:
+        results[key][0].append(np.mean(fill[key]))
+        results[key][1].append(np.mean(np.array(fill[key]) == 1))
+        results[key][2].append(np.mean(duration[key]) * 1e-6)
+        print(
+            f"p = {p:.2f} - {key:>10}: fill fraction = {results[key][0][-1]:.4f}, "
+            f"defect-free = {results[key][1][-1]:.3f}, move time = {results[key][2][-1]:.2f} ms"
+        )
+
+############
+# Plotting #
+############
+plt.figure(figsize=(12, 5))
+plt.subplot(121)
+for key, (fill_mean, defect_free, _) in results.items():
+    plt.plot(loading_probabilities, fill_mean, "o-", label=f"{key} - fill fraction")
+    plt.plot(loading_probabilities, defect_free, "x--", label=f"{key} - defect-free probability")
+plt.xlabel("Loading probability")
+plt.legend()
+plt.subplot(122)
+for key, (fill_mean, _, move_time) in results.items():
+    plt.plot(move_time, fill_mean, "o-", label=key)
+plt.xlabel("Total move time [ms]")
+plt.ylabel("Fill fraction")
+plt.legend()
+plt.tight_layout()
+plt.show()
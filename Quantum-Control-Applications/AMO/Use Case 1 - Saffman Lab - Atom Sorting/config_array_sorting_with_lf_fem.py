@@ -54,6 +54,9 @@ number_of_rows = 7
 max_number_of_tweezers = 7
 # Number of configured tweezers, if it increases don't forget to update the "align" in the QUA program
 n_tweezers = 7
+# Number of configured row tweezers used by the 2D rearrangement to move atoms along the columns and to select several
+# rows in parallel, it is limited by the number of available pulse processors
+n_row_tweezers = 4
 n_segment_python = 50
 # --> Chirp pulse
 # Amplitude of each individual tweezer
@@ -321,3 +324,16 @@ for i in range(1, n_tweezers + 1):
             "constant": "constant_pulse",
         },
     }
+# Iteratively add the row tweezers used by the 2D rearrangement
+for i in range(1, n_row_tweezers + 1):
+    config["elements"][f"row_{i}"] = {
+        "singleInput": {
+            "port": (con, fem, row_channel),
+        },
+        "intermediate_frequency": row_selector_if,
+        "operations": {
+            "blackman_up": "blackman_up_pulse",
+            "blackman_down": "blackman_down_pulse",
+            "constant": "constant_pulse",
+        },
+    }
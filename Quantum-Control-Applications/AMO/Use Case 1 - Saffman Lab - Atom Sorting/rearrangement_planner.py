@@ -0,0 +1,291 @@
+"""
+Host-side planner for the full 2D atom rearrangement.
+
+The planner derives a parallel move schedule in two phases:
+1. Column balancing: atoms are moved along the columns so that every row holds at least as many atoms as its target.
+2. Row compression: every row is then sorted with collision-free, order preserving 1D moves.
+
+Each step of the schedule is a dictionary with the following keys:
+* "axis": "row" if the atoms move along the rows (column tones are chirped), "column" if they move along the columns
+  (row tones are chirped).
+* "lines": the indices of the rows (resp. columns) selected by the static tones. Several lines are moved in parallel
+  when they share the exact same moves.
+* "moves": the list of (source, destination) site indices along the moving axis.
+"""
+
+import numpy as np
+
+
+def _match_1d(atoms, targets):
+    """
+    Finds the order preserving assignment between the atoms and the targets of a 1D line that minimizes the largest
+    displacement (then the total displacement). Unused atoms are only skipped if they are neither crossed by a moving
+    atom nor located on a target site, such that moving all the assigned atoms simultaneously is collision free.
+
+    :param atoms: Sorted list of the occupied sites (int).
+    :param targets: Sorted list of the target sites (int).
+
+    :return: List of (source, destination) pairs, one per used atom.
+    """
+    n, k = len(atoms), len(targets)
+    if k > n:
+        # Not enough atoms: fill the targets closest to the available atoms and leave the others empty
+        pairs = _match_1d(targets, atoms)
+        return [(a, t) for t, a in pairs]
+    inf = (np.inf, np.inf)
+    # cost[i][j]: best (max, sum) displacement having used atoms[:i] to fill targets[:j]
+    cost = [[inf] * (k + 1) for _ in range(n + 1)]
+    choice = [[None] * (k + 1) for _ in range(n + 1)]
+    cost[0][0] = (0, 0)
+    for i in range(n):
+        for j in range(k + 1):
+            if cost[i][j] == inf:
+                continue
+            # Skip atom i if it is not in the way of the neighbouring moves
+            if (j == 0 or targets[j - 1] < atoms[i]) and (j == k or targets[j] > atoms[i]):
+                if cost[i][j] < cost[i + 1][j]:
+                    cost[i + 1][j] = cost[i][j]
+                    choice[i + 1][j] = "skip"
+            # Assign atom i to target j
+            if j < k:
+                d = abs(atoms[i] - targets[j])
+                new = (max(cost[i][j][0], d), cost[i][j][1] + d)
+                if new < cost[i + 1][j + 1]:
+                    cost[i + 1][j + 1] = new
+                    choice[i + 1][j + 1] = "use"
+    if cost[n][k] == inf:
+        # Every atom must then be used: fall back to the plain order preserving assignment of the leftmost atoms
+        return list(zip(atoms[:k], targets))
+    pairs = []
+    i, j = n, k
+    while i > 0:
+        if choice[i][j] == "use":
+            pairs.append((atoms[i - 1], targets[j - 1]))
+            j -= 1
+        i -= 1
+    return pairs[::-1]
+
+
+def _split_in_steps(pairs, max_tones):
+    """
+    Splits the moves of a 1D line into steps using at most max_tones moving tweezers each.
+    Atoms moving to the right are processed from right to left and atoms moving to the left from left to right, which
+    guarantees that a moving atom never reaches a site still occupied by an atom that has not moved yet.
+
+    :param pairs: List of (source, destination) pairs from an order preserving assignment.
+    :param max_tones: Maximum number of moving tweezers available (int).
+
+    :return: List of steps, each being a list of (source, destination) pairs sorted by source.
+    """
+    right = sorted([p for p in pairs if p[1] > p[0]], reverse=True)
+    left = sorted([p for p in pairs if p[1] < p[0]])
+    steps = []
+    while right or left:
+        n_right = min(len(right), max_tones)
+        n_left = min(len(left), max_tones - n_right)
+        steps.append(sorted(right[:n_right] + left[:n_left]))
+        right, left = right[n_right:], left[n_left:]
+    return steps
+
+
+def plan_1d_moves(line_occupation, line_target, max_tones):
+    """
+    Plans the collision-free moves sorting one line (row or column) of the array.
+
+    :param line_occupation: 1D occupation of the line (0 or 1).
+    :param line_target: 1D target occupation of the line (0 or 1).
+    :param max_tones: Maximum number of moving tweezers available (int).
+
+    :return: List of steps, each being a list of (source, destination) pairs.
+    """
+    atoms = [int(x) for x in np.flatnonzero(line_occupation)]
+    targets = [int(x) for x in np.flatnonzero(line_target)]
+    return _split_in_steps(_match_1d(atoms, targets), max_tones)
+
+
+def balance_rows(occupation, target):
+    """
+    Derives the column by column occupation after the column balancing phase, i.e. moves atoms along the columns from
+    the rows having more atoms than needed to the rows lacking atoms, favouring the shortest transfers.
+
+    :param occupation: 2D occupation matrix (rows x columns) of 0 and 1.
+    :param target: 2D target matrix (rows x columns) of 0 and 1.
+
+    :return: 2D occupation matrix after column balancing.
+    """
+    balanced = np.array(occupation, dtype=int).copy()
+    excess = balanced.sum(axis=1) - np.asarray(target, dtype=int).sum(axis=1)
+    while np.any(excess < 0) and np.any(excess > 0):
+        best = None
+        for d in np.flatnonzero(excess < 0):
+            for s in np.flatnonzero(excess > 0):
+                # Columns where an atom can be transferred from the surplus row s to the deficient row d
+                columns = np.flatnonzero((balanced[s] == 1) & (balanced[d] == 0))
+                if len(columns) and (best is None or abs(s - d) < best[0]):
+                    best = (abs(s - d), s, d, columns[0])
+        if best is None:
+            break
+        _, s, d, c = best
+        balanced[s, c], balanced[d, c] = 0, 1
+        excess[s] -= 1
+        excess[d] += 1
+    return balanced
+
+
+def _merge_parallel_steps(axis, line_steps, max_line_tones):
+    """
+    Merges the steps of different lines that share the exact same moves so that they are played simultaneously.
+
+    :param axis: "row" or "column".
+    :param line_steps: Dictionary mapping each line index to its ordered list of steps.
+    :param max_line_tones: Maximum number of static tones available for selecting the lines (int).
+
+    :return: List of schedule steps.
+    """
+    schedule = []
+    depth = max([len(steps) for steps in line_steps.values()], default=0)
+    for layer in range(depth):
+        groups = {}
+        for line, steps in line_steps.items():
+            if layer < len(steps):
+                groups.setdefault(tuple(steps[layer]), []).append(line)
+        for moves, lines in groups.items():
+            for i in range(0, len(lines), max_line_tones):
+                schedule.append({"axis": axis, "lines": lines[i : i + max_line_tones], "moves": list(moves)})
+    return schedule
+
+
+def plan_2d_rearrangement(occupation, target, max_row_tones, max_column_tones):
+    """
+    Computes the parallel move schedule bringing the occupation matrix to the target matrix.
+
+    :param occupation: 2D occupation matrix (rows x columns) of 0 and 1.
+    :param target: 2D target matrix (rows x columns) of 0 and 1.
+    :param max_row_tones: Maximum number of simultaneous tones on the row AOD (int).
+    :param max_column_tones: Maximum number of simultaneous tones on the column AOD (int).
+
+    :return: List of schedule steps (see module docstring).
+    """
+    occupation = np.array(occupation, dtype=int)
+    target = np.array(target, dtype=int)
+    balanced = balance_rows(occupation, target)
+    # Column balancing: the rows are chirped, the columns are static
+    column_steps = {}
+    for c in range(occupation.shape[1]):
+        if np.any(balanced[:, c] != occupation[:, c]):
+            column_steps[c] = plan_1d_moves(occupation[:, c], balanced[:, c], max_row_tones)
+    # Row compression: the columns are chirped, the rows are static
+    row_steps = {}
+    for r in range(occupation.shape[0]):
+        steps = plan_1d_moves(balanced[r], target[r], max_column_tones)
+        if steps:
+            row_steps[r] = steps
+    return _merge_parallel_steps("column", column_steps, max_column_tones) + _merge_parallel_steps(
+        "row", row_steps, max_row_tones
+    )
+
+
+def apply_schedule(occupation, schedule):
+    """
+    Applies a move schedule to an occupation matrix and checks that no atom is lost or collides with another one.
+
+    :param occupation: 2D occupation matrix (rows x columns) of 0 and 1.
+    :param schedule: List of schedule steps.
+
+    :return: 2D occupation matrix after the rearrangement.
+    """
+    occupation = np.array(occupation, dtype=int).copy()
+    for step in schedule:
+        view = occupation if step["axis"] == "row" else occupation.T
+        for line in step["lines"]:
+            sources = [s for s, _ in step["moves"]]
+            if not np.all(view[line, sources] == 1):
+                raise ValueError(f"No atom to move in {step['axis']} {line} at sites {sources}.")
+            view[line, sources] = 0
+            destinations = [d for _, d in step["moves"]]
+            if np.any(view[line, destinations] == 1):
+                raise ValueError(f"Atom collision in {step['axis']} {line} at sites {destinations}.")
+            view[line, destinations] = 1
+    return occupation
+
+
+def schedule_duration(schedule, site_spacing, ramp_duration, chirp_duration, max_rate=None):
+    """
+    Estimates the total duration of a move schedule, following the pulse sequence played by array_sorting.py: every
+    step ramps the tweezers up, chirps them and ramps them down.
+
+    :param schedule: List of schedule steps.
+    :param site_spacing: Frequency spacing between adjacent sites in Hz (float).
+    :param ramp_duration: Duration of each Blackman ramp in ns (float).
+    :param chirp_duration: Default chirp pulse duration in ns (float).
+    :param max_rate: Maximum chirp rate in Hz/ns. Default is None which corresponds to using chirp_duration.
+
+    :return: Total duration in ns (float).
+    """
+    total = 0.0
+    for step in schedule:
+        if max_rate is None:
+            duration = chirp_duration
+        else:
+            max_detuning = max([abs(d - s) for s, d in step["moves"]]) * abs(site_spacing)
+            duration = max(16, max_detuning / max_rate)
+        total += 2 * ramp_duration + duration
+    return total
+
+
+def encode_schedule(schedule, nb_of_tweezers):
+    """
+    Encodes a move schedule into fixed size integer records that can be pushed to the QUA input stream.
+    Each record is [axis, number of lines, number of moves, lines..., sources..., destinations...] where axis is 0 for
+    the moves along the rows and 1 for the moves along the columns, and the lists are zero padded to nb_of_tweezers.
+
+    :param schedule: List of schedule steps.
+    :param nb_of_tweezers: Maximum number of tones per AOD, i.e. the size of the padded lists (int).
+
+    :return: List of records (list of int).
+    """
+    records = []
+    for step in schedule:
+
+        def pad(values):
+            return [int(v) for v in values] + [0] * (nb_of_tweezers - len(values))
+
+        records.append(
+            [0 if step["axis"] == "row" else 1, len(step["lines"]), len(step["moves"])]
+            + pad(step["lines"])
+            + pad([s for s, _ in step["moves"]])
+            + pad([d for _, d in step["moves"]])
+        )
+    return records
+
+
+def row_by_row_schedule(occupation, target, max_column_tones):
+    """
+    Reproduces the schedule of the row by row sorting of array_sorting.py, where each row is sorted with its own atoms
+    only, in a single chirp, and all the rows are played one after the other.
+
+    :param occupation: 2D occupation matrix (rows x columns) of 0 and 1.
+    :param target: 2D target matrix (rows x columns) of 0 and 1.
+    :param max_column_tones: Maximum number of simultaneous tones on the column AOD (int).
+
+    :return: List of schedule steps.
+    """
+    schedule = []
+    for r in range(len(occupation)):
+        # A single chirp per row, the atoms which do not fit in the available tweezers are left in place
+        steps = plan_1d_moves(occupation[r], target[r], max_column_tones)
+        schedule.append({"axis": "row", "lines": [r], "moves": steps[0] if steps else []})
+    return schedule
+
+
+def fill_fraction(occupation, target):
+    """
+    Fraction of the target sites that are occupied.
+
+    :param occupation: 2D occupation matrix (rows x columns) of 0 and 1.
+    :param target: 2D target matrix (rows x columns) of 0 and 1.
+
+    :return: Fill fraction (float).
+    """
+    target = np.asarray(target, dtype=bool)
+    return float(np.asarray(occupation, dtype=bool)[target].sum() / max(target.sum(), 1))
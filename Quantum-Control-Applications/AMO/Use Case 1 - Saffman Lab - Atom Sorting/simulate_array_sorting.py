@@ -0,0 +1,116 @@
+"""
+Offline evaluation of the row by row sorting of array_sorting.py with the vectorized simulator of sorting_simulator.py.
+
+Millions of random loading configurations are processed without hardware nor QUA simulator in order to compare the
+tweezer assignment strategies and tune the parameters of config_array_sorting.py. The distributions of the number of
+moves and of the sequence duration are reported and plotted, together with the fill fraction, the lost atoms and the
+final frequency error of the chirps.
+"""
+
+import time
+import numpy as np
+import matplotlib.pyplot as plt
+from config_array_sorting import (
+    number_of_rows,
+    number_of_columns,
+    max_number_of_tweezers,
+    column_spacing,
+    blackman_pulse_length,
+    constant_pulse_length,
+    n_segment_python,
+    threshold,
+)
+from sorting_simulator import simulate_sorting
+
+###################
+# The Parameters  #
+###################
+n_shots = 1_000_000  # Number of random loading configurations
+chunk_size = 200_000  # Number of shots simulated at once to limit the memory usage
+loading_probability = 0.6  # Probability of loading an atom in each site
+maximum_chirp_rate = None  # Maximum constant chirp rate in Hz/ns, None uses the default pulse length from config
+# Analog readout model, set to None for a perfect readout
+readout = {"threshold": threshold, "atom_level": -0.003, "empty_level": 0.0, "noise_std": 0.0005}
+rng = np.random.default_rng(seed=0)
+
+# Target occupation matrix, same as in array_sorting.py
+goal = [
+    ["1", "X", "X", "X", "X", "X", "1"],
+    ["X", "1", "X", "X", "X", "1", "X"],
+    ["X", "X", "1", "1", "1", "X", "X"],
+    ["X", "X", "1", "1", "1", "X", "X"],
+    ["X", "X", "1", "1", "1", "X", "X"],
+    ["X", "1", "X", "X", "X", "1", "X"],
+    ["1", "X", "X", "X", "X", "X", "1"],
+]
+target = np.array([[1 if site == "1" else 0 for site in row] for row in goal])
+
+# Strategies to compare: (collision_free, piecewise chirp segments)
+strategies = {
+    "simple, linear chirps": (False, None),
+    "collision free, linear chirps": (True, None),
+    "collision free, piecewise chirps": (True, n_segment_python if maximum_chirp_rate is None else None),
+}
+
+##############
+# Simulation #
+##############
+results = {}
+for name, (collision_free, nb_of_segments) in strategies.items():
+    start = time.time()
+    chunks = []
+    for i in range(0, n_shots, chunk_size):
+        occupation = rng.random((min(chunk_size, n_shots - i), number_of_rows, number_of_columns)) < loading_probability
+        chunks.append(
+            simulate_sorting(
+                occupation.astype(int),
+                target,
+                max_number_of_tweezers,
+                column_spacing,
+                blackman_pulse_length,
+                constant_pulse_length,
+                collision_free=collision_free,
+                max_rate=maximum_chirp_rate,
+                nb_of_segments=nb_of_segments,
+                readout=readout,
+                rng=rng,
+            )
+        )
+    results[name] = {key: np.concatenate([chunk[key] for chunk in chunks]) for key in chunks[0]}
+    res = results[name]
+    print(f"{name}: {n_shots} shots simulated in {time.time() - start:.2f} s")
+    print(f"    moves per shot: mean = {res['moves'].mean():.2f}, 99th percentile = {np.percentile(res['moves'], 99)}")
+    print(
+        f"    sequence duration: mean = {res['duration'].mean() * 1e-6:.3f} ms, "
+        f"99th percentile = {np.percentile(res['duration'], 99) * 1e-6:.3f} ms"
+    )
+    print(
+        f"    fill fraction = {res['fill_fraction'].mean():.4f}, defect-free = {res['defect_free'].mean():.4f}, "
+        f"lost atoms per shot = {res['lost_atoms'].mean():.3f}, readout errors per shot = "
+        f"{res['readout_errors'].mean():.3f}, stuck assignments = {res['stuck'].mean():.2e}"
+    )
+    print(f"    maximum final chirp frequency error = {res['max_frequency_error'].max():.1f} Hz")
+
+############
+# Plotting #
+############
+plt.figure(figsize=(15, 5))
+plt.subplot(131)
+for name, res in results.items():
+    plt.hist(res["moves"], bins=np.arange(res["moves"].max() + 2) - 0.5, histtype="step", label=name)
+plt.xlabel("Number of moves per shot")
+plt.ylabel("Counts")
+plt.legend()
+plt.subplot(132)
+for name, res in results.items():
+    plt.hist(res["duration"] * 1e-6, bins=100, histtype="step", label=name)
+plt.xlabel("Sequence duration [ms]")
+plt.ylabel("Counts")
+plt.subplot(133)
+for name, res in results.items():
+    plt.hist(res["fill_fraction"], bins=np.linspace(0, 1, 51), histtype="step", label=name)
+plt.xlabel("Fill fraction")
+plt.ylabel("Counts")
+plt.yscale("log")
+plt.tight_layout()
+plt.show()
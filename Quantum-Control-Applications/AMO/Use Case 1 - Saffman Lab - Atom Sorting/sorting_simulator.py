@@ -0,0 +1,251 @@
+"""
+Vectorized host-side simulator of the row by row sorting pipeline of array_sorting.py.
+
+The occupation images of many shots are processed at once, following the same steps as the QUA program:
+1. analog_readout(): the analog level sent for each site is integrated with some noise and compared to the threshold.
+2. find_number_of_tweezers() and assign_tweezers_to_atoms() or assign_tweezers_to_atoms_collision_free(): the tweezers
+   are assigned to the measured atoms of each row.
+3. calculate_pulse_length(), calculate_chirp_rates() and calculate_piecewise_chirp_rates(): the chirps are derived,
+   including the integer rounding of the chirp rates in mHz/ns.
+4. The atoms are moved according to the true occupation, which gives the final occupation, the lost atoms and the
+   total sequence duration.
+
+All arrays have the shots as first dimension, followed by the rows and the columns of the array.
+"""
+
+import numpy as np
+
+
+def simulate_analog_readout(occupation, readout_threshold, atom_level, empty_level, noise_std, rng):
+    """
+    Simulates the analog readout of the occupation matrix: the integrated signal is lower than the threshold when
+    there is an atom.
+
+    :param occupation: 3D array (shots x rows x columns) of the true occupation (0 or 1).
+    :param readout_threshold: Analog threshold discriminating between atom and no-atom (float).
+    :param atom_level: Mean integrated signal for an occupied site (float).
+    :param empty_level: Mean integrated signal for an empty site (float).
+    :param noise_std: Standard deviation of the integrated signal (float).
+    :param rng: numpy random Generator.
+
+    :return: 3D array of the measured occupation (0 or 1).
+    """
+    data = np.where(occupation == 1, atom_level, empty_level) + noise_std * rng.standard_normal(occupation.shape)
+    return (data < readout_threshold).astype(int)
+
+
+def _nth_site(line, n):
+    """
+    Position of the n-th occupied site of each line, or -1 if there are not enough occupied sites.
+
+    :param line: 2D array (lines x sites) of 0 and 1.
+    :param n: Rank of the occupied site (int).
+
+    :return: 1D array of positions (int).
+    """
+    rank = np.cumsum(line, axis=1) - 1
+    found = (line == 1) & (rank == n)
+    return np.where(found.any(axis=1), found.argmax(axis=1), -1)
+
+
+def assign_tweezers(measured, target, max_nb_of_tweezers, collision_free=True):
+    """
+    Assigns the tweezers to the measured atoms of each row as the QUA macros do.
+
+    :param measured: 2D array (lines x columns) of the measured occupation of each row (0 or 1).
+    :param target: 2D array (lines x columns) of the target occupation of each row (0 or 1).
+    :param max_nb_of_tweezers: Maximum number of available tweezers (int).
+    :param collision_free: Uses the logic of assign_tweezers_to_atoms_collision_free() if True, else the one of
+        assign_tweezers_to_atoms().
+
+    :return: Three arrays: the source and destination columns (lines x tweezers, -1 for unused tweezers) and a boolean
+        flag per line which is True when the collision free logic cannot assign all the tweezers (the QUA loop would
+        not exit).
+    """
+    n_lines, n_columns = measured.shape
+    columns = np.arange(n_columns)
+    nb_of_tweezers = np.minimum(np.minimum(measured.sum(axis=1), target.sum(axis=1)), max_nb_of_tweezers)
+    # Number of atoms located to the right of each site, site included
+    atoms_to_the_right = np.cumsum(measured[:, ::-1], axis=1)[:, ::-1]
+    sources = -np.ones((n_lines, max_nb_of_tweezers), dtype=int)
+    destinations = -np.ones((n_lines, max_nb_of_tweezers), dtype=int)
+    stuck = np.zeros(n_lines, dtype=bool)
+    previous_atom = -np.ones(n_lines, dtype=int)
+    for j in range(max_nb_of_tweezers):
+        active = (j < nb_of_tweezers) & ~stuck
+        target_index = _nth_site(target, j)
+        if not collision_free:
+            sources[active, j] = _nth_site(measured, j)[active]
+            destinations[active, j] = target_index[active]
+            continue
+        remaining = (nb_of_tweezers - j)[:, None]
+        # Closest suitable atom on the left of the target, target site included
+        left = (
+            (columns <= target_index[:, None])
+            & (columns > previous_atom[:, None])
+            & (atoms_to_the_right >= remaining)
+            & (measured == 1)
+        )
+        left_atom = np.where(left.any(axis=1), n_columns - 1 - left[:, ::-1].argmax(axis=1), -1)
+        # Else, closest atom on the right
+        right = (columns >= np.maximum(previous_atom, target_index)[:, None] + 1) & (measured == 1)
+        right_atom = np.where(right.any(axis=1), right.argmax(axis=1), -1)
+        atom = np.where(left_atom >= 0, left_atom, right_atom)
+        stuck |= active & (atom < 0)
+        active &= atom >= 0
+        sources[active, j] = atom[active]
+        destinations[active, j] = target_index[active]
+        previous_atom = np.where(active, atom, previous_atom)
+    return sources, destinations, stuck
+
+
+def move_atoms(occupation, sources, destinations):
+    """
+    Moves the atoms of each row according to the tweezer assignment. A tweezer placed on an empty site (readout error)
+    moves nothing, while an atom reaching or crossing a site occupied by an atom which does not move is lost together
+    with the static atom. Two moving atoms reaching the same site are lost as well.
+
+    :param occupation: 2D array (lines x columns) of the true occupation of each row (0 or 1).
+    :param sources: 2D array (lines x tweezers) of the source columns (-1 for unused tweezers).
+    :param destinations: 2D array (lines x tweezers) of the destination columns (-1 for unused tweezers).
+
+    :return: The final occupation (lines x columns) and the number of lost atoms per line.
+    """
+    n_lines, n_columns = occupation.shape
+    columns = np.arange(n_columns)
+    lines = np.broadcast_to(np.arange(n_lines)[:, None], sources.shape)
+    carried = (sources >= 0) & (occupation[lines, np.maximum(sources, 0)] == 1)
+    static = occupation.copy()
+    static[lines[carried], sources[carried]] = 0
+    # Static atoms on the sites swept by each moving atom, source excluded
+    low = np.minimum(sources, destinations)[:, :, None]
+    high = np.maximum(sources, destinations)[:, :, None]
+    swept = carried[:, :, None] & (columns >= low) & (columns <= high) & (columns != sources[:, :, None])
+    collisions = swept & (static[:, None, :] == 1)
+    blocked = collisions.any(axis=2)
+    hit = collisions.any(axis=1)
+    arrived = np.zeros_like(occupation)
+    np.add.at(arrived, (lines[carried & ~blocked], destinations[carried & ~blocked]), 1)
+    final = (static == 1) & ~hit | (arrived == 1)
+    lost = blocked.sum(axis=1) + hit.sum(axis=1) + np.where(arrived > 1, arrived, 0).sum(axis=1)
+    return final.astype(int), lost
+
+
+def chirp_frequency_errors(nb_of_sites, site_spacing, pulse_duration, nb_of_segments=None):
+    """
+    Final frequency error of the chirps due to the integer rounding of the chirp rates in mHz/ns, for each signed move
+    distance from -(nb_of_sites - 1) to nb_of_sites - 1.
+
+    :param nb_of_sites: Number of sites along the moving axis (int).
+    :param site_spacing: Frequency spacing between adjacent sites in Hz (float).
+    :param pulse_duration: Chirp pulse duration in ns (int).
+    :param nb_of_segments: Number of segments of the piecewise chirp (int). Default is None for the linear chirp.
+
+    :return: 1D array of the final frequency errors in Hz.
+    """
+    detunings = np.arange(-(nb_of_sites - 1), nb_of_sites) * int(site_spacing)
+    # The chirp rates are derived in mHz/ns by dividing by the pulse duration in µs (at least 1 µs)
+    duration_us = max(int(pulse_duration) // 1000, 1)
+    if nb_of_segments is None:
+        rates = np.trunc(detunings / duration_us)
+        return detunings - rates * pulse_duration / 1000
+    tau = np.arange(1, nb_of_segments + 1) / nb_of_segments
+    linear_piece = 30 * tau**2 - 60 * tau**3 + 30 * tau**4
+    rates = np.trunc(np.trunc(np.outer(detunings, linear_piece)) / duration_us)
+    return detunings - rates.sum(axis=1) * pulse_duration / nb_of_segments / 1000
+
+
+def simulate_sorting(
+    occupation,
+    target,
+    max_nb_of_tweezers,
+    site_spacing,
+    ramp_duration,
+    pulse_duration,
+    collision_free=True,
+    max_rate=None,
+    nb_of_segments=None,
+    readout=None,
+    rng=None,
+):
+    """
+    Simulates the full row by row sorting sequence for a batch of shots.
+
+    :param occupation: 3D array (shots x rows x columns) of the true occupation (0 or 1).
+    :param target: 2D array (rows x columns) of the target occupation (0 or 1).
+    :param max_nb_of_tweezers: Maximum number of available tweezers (int).
+    :param site_spacing: Frequency spacing between adjacent columns in Hz (float).
+    :param ramp_duration: Duration of each Blackman ramp in ns (float).
+    :param pulse_duration: Default chirp pulse duration in ns (int).
+    :param collision_free: Uses the collision free assignment if True.
+    :param max_rate: Maximum chirp rate in Hz/ns. Default is None which corresponds to using pulse_duration.
+    :param nb_of_segments: Number of segments of the piecewise chirp. Default is None for linear chirps.
+    :param readout: Dictionary with the "threshold", "atom_level", "empty_level" and "noise_std" of the analog readout.
+        Default is None for a perfect readout.
+    :param rng: numpy random Generator used for the readout noise.
+
+    :return: Dictionary of 1D arrays (one value per shot) with the number of moving tweezers "moves", the sequence
+        "duration" in ns, the "fill_fraction" and "defect_free" flag of the target, the number of "readout_errors"
+        and "lost_atoms", the "stuck" flag of the collision free logic and the "max_frequency_error" in Hz.
+    """
+    if max_rate is not None and nb_of_segments is not None:
+        raise ValueError("Dynamic pulse duration with piecewise chirps is not implemented.")
+    occupation = np.asarray(occupation, dtype=int)
+    n_shots, n_rows, n_columns = occupation.shape
+    target = np.asarray(target, dtype=int)
+    if readout is None:
+        measured = occupation
+    else:
+        measured = simulate_analog_readout(
+            occupation,
+            readout["threshold"],
+            readout["atom_level"],
+            readout["empty_level"],
+            readout["noise_std"],
+            rng if rng is not None else np.random.default_rng(),
+        )
+    # A row only has 2**n_columns possible true and measured occupations, so each distinct combination of true row,
+    # measured row and row index (for the target) is processed only once
+    weights = 1 << np.arange(n_columns)
+    keys = (
+        (occupation @ weights) + ((measured @ weights) << n_columns) + (np.arange(n_rows)[None, :] << (2 * n_columns))
+    ).flatten()
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    lines_true = occupation.reshape(-1, n_columns)[first]
+    lines_measured = measured.reshape(-1, n_columns)[first]
+    lines_target = target[first % n_rows]
+    sources, destinations, stuck = assign_tweezers(lines_measured, lines_target, max_nb_of_tweezers, collision_free)
+    final, lost = move_atoms(lines_true, sources, destinations)
+    distances = np.where(sources >= 0, destinations - sources, 0)
+    # Chirp pulse duration of each row as derived by calculate_pulse_length()
+    if max_rate is None:
+        durations = np.full(len(distances), int(pulse_duration))
+    else:
+        max_detuning = np.abs(distances).max(axis=1) * abs(int(site_spacing))
+        durations = np.where(max_detuning < 16, 16, (max_detuning / max_rate).astype(int))
+    # The played duration is a multiple of the clock cycle
+    durations = durations // 4 * 4
+    if max_rate is None:
+        errors = np.abs(chirp_frequency_errors(n_columns, site_spacing, pulse_duration, nb_of_segments))
+        max_error = errors[distances + n_columns - 1].max(axis=1)
+    else:
+        max_error = np.zeros(len(distances))
+        for duration in np.unique(durations):
+            rows = durations == duration
+            errors = np.abs(chirp_frequency_errors(n_columns, site_spacing, duration))
+            max_error[rows] = errors[distances[rows] + n_columns - 1].max(axis=1)
+    # Back to one value per row of each shot
+    inverse = inverse.reshape(n_shots, n_rows)
+    final, lost, stuck = final[inverse], lost[inverse], stuck[inverse]
+    moves, durations, max_error = (distances != 0).sum(axis=1)[inverse], durations[inverse], max_error[inverse]
+    filled = (final == 1) & (target == 1)
+    return {
+        "moves": moves.sum(axis=1),
+        "duration": (2 * ramp_duration + durations).sum(axis=1),
+        "fill_fraction": filled.sum(axis=(1, 2)) / max(target.sum(), 1),
+        "defect_free": filled.sum(axis=(1, 2)) == target.sum(),
+        "readout_errors": (measured != occupation).sum(axis=(1, 2)),
+        "lost_atoms": lost.sum(axis=1),
+        "stuck": stuck.any(axis=1),
+        "max_frequency_error": max_error.max(axis=1),
+    }
@@ -4,12 +4,16 @@ import matplotlib.pyplot as plt
 from configuration import *
 from qualang_tools.results import progress_counter, fetching_tool
 import datetime
+from time_tag_correlations import histogram, beat_note_spectrum, beat_note_frequency, threshold_sweep
 
 ###################
 # The QUA program #
 ###################
 
 n_avg = 6e6 * 6
+# Number of shots whose raw time tags are streamed to the computer. Each time tag takes 8 bytes in memory and in the saved
+# file, so that the raw tags of all the shots would take hundreds of MB per acquisition
+n_raw = 100_000
 
 resolution = 50  # ps
 t_vec = np.arange(0, meas_len * 1e3, 1)
@@ -22,7 +26,9 @@ AC_len = 250  # 1 us
 with program() as calib_delays:
     times = declare(int, size=100)  # 'size' defines the max number of photons to be counted
     times_st = declare_stream()  # stream for 'times'
+    raw_times_st = declare_stream()  # stream for the raw time tags of the first n_raw shots
     counts = declare(int)  # variable to save the total number of photons
+    counts_st = declare_stream()  # stream for 'counts'
     i = declare(int)  # variable used to save data
     n = declare(int)  # variable used in for loop for averaging
     n_st = declare_stream()  # stream for 'iteration'
@@ -42,6 +48,11 @@ with program() as calib_delays:
 
         with for_(i, 0, i < counts, i + 1):
             save(times[i], times_st)  # save time tags to stream
+        # Raw time tags and number of time tags of the first n_raw shots
+        with if_(n < n_raw):
+            with for_(i, 0, i < counts, i + 1):
+                save(times[i], raw_times_st)
+            save(counts, counts_st)
 
         save(n, n_st)  # save number of iteration inside for_loop
 
@@ -49,40 +60,98 @@ with program() as calib_delays:
         times_st.histogram([[i, i + (resolution - 1)] for i in range(0, meas_len * int(1e3), resolution)]).save(
             "times_hist"
         )
+        # Raw time tags and number of time tags per shot, to analyze the data again without acquiring it again
+        raw_times_st.save_all("times")
+        counts_st.save_all("counts")
         n_st.save("iteration")
 
 #####################################
 #  Open Communication with the QOP  #
 #####################################
 qmm = QuantumMachinesManager(host=qop_ip, port=qop_port, cluster_name=cluster_name, octave=octave_config)
-# Update signal threshold before opening the quantum machine
-new_signal_threshold = 600
-config["elements"]["SNSPD"]["outputPulseParameters"]["signalThreshold"] = new_signal_threshold
-# Open a quantum machine
-qm = qmm.open_qm(config)
-# Execute the QUA program
-job = qm.execute(calib_delays)
-
-# Get results from QUA program
-results = fetching_tool(job, data_list=["times_hist", "iteration"], mode="live")
-# Live plotting
-fig = plt.figure()
-interrupt_on_close(fig, job)  # Interrupts the job when closing the figure
-
-while results.is_processing():
-    # Fetch results
-    times_hist, iteration = results.fetch_all()
-    # Progress bar
-    progress_counter(iteration, n_avg, start_time=results.get_start_time())
-    # Plot data
-    plt.cla()
-    plt.plot(t_vec[::resolution] + resolution / 2, times_hist / 1000 / (resolution / u.s) / iteration)
-    plt.xlabel("t [ps]")
-    plt.ylabel(f"counts [kcps / {resolution}ps]")
-    plt.pause(0.1)
-
-# Save results
-timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
-np.savez(
-    timestamp + "_high_res_beatnote", t_vec, times_hist, resolution, iteration, new_signal_threshold, ttl_wait, AC_len
-)
+# Signal thresholds of the detector to compare, one acquisition being performed for each of them
+signal_thresholds = [600]
+acquisitions = {}
+for new_signal_threshold in signal_thresholds:
+    # Update signal threshold before opening the quantum machine
+    config["elements"]["SNSPD"]["outputPulseParameters"]["signalThreshold"] = new_signal_threshold
+    # Open a quantum machine
+    qm = qmm.open_qm(config)
+    # Execute the QUA program
+    job = qm.execute(calib_delays)
+
+    # Get results from QUA program
+    results = fetching_tool(job, data_list=["times_hist", "iteration"], mode="live")
+    # Live plotting
+    fig = plt.figure()
+    interrupt_on_close(fig, job)  # Interrupts the job when closing the figure
+
+    while results.is_processing():
+        # Fetch results
+        times_hist, iteration = results.fetch_all()
+        # Progress bar
+        progress_counter(iteration, n_avg, start_time=results.get_start_time())
+        # Plot data
+        plt.cla()
+        plt.plot(t_vec[::resolution] + resolution / 2, times_hist / 1000 / (resolution / u.s) / iteration)
+        plt.xlabel("t [ps]")
+        plt.ylabel(f"counts [kcps / {resolution}ps]")
+        plt.title(f"Signal threshold = {new_signal_threshold}")
+        plt.pause(0.1)
+
+    # Raw time tags in ps and number of time tags of each of the first n_raw shots
+    tags = job.result_handles.get("times").fetch_all()["value"]
+    counts = job.result_handles.get("counts").fetch_all()["value"]
+    acquisitions[new_signal_threshold] = (tags, counts)
+
+    # Save results
+    timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+    np.savez(
+        timestamp + "_high_res_beatnote",
+        t_vec,
+        times_hist,
+        resolution,
+        iteration,
+        new_signal_threshold,
+        ttl_wait,
+        AC_len,
+        tags=tags,
+        counts=counts,
+    )
+
+# Analysis of the raw time tags: the binning and the beat-note frequency can be changed without acquiring again
+window = meas_len * 1e3  # detection window in ps
+plt.figure()
+for new_signal_threshold, (tags, counts) in acquisitions.items():
+    plt.subplot(121)
+    t, hist = histogram(tags, window, bin_width=25)
+    plt.plot(t, hist / len(counts), label=f"threshold = {new_signal_threshold}")
+    plt.subplot(122)
+    frequencies, spectrum = beat_note_spectrum(tags, window, bin_width=10)
+    plt.semilogy(frequencies / u.MHz, spectrum, label=f"threshold = {new_signal_threshold}")
+plt.subplot(121)
+plt.xlabel("t [ps]")
+plt.ylabel("counts per shot / 25ps")
+plt.legend()
+plt.subplot(122)
+plt.xlabel("Frequency [MHz]")
+plt.ylabel("Power spectrum [shot noise]")
+plt.legend()
+plt.tight_layout()
+# Beat-note frequency from the spectrum of the first acquisition, ignoring the slow envelope of the detection window, and
+# refined beyond the 1 / window resolution of the spectrum
+frequency = beat_note_frequency(acquisitions[signal_thresholds[0]][0], window, min_frequency=100 * u.MHz)
+print(f"Beat-note frequency: {frequency / u.MHz:.2f} MHz")
+if len(signal_thresholds) > 1:
+    # The time tags are weighted by a Hann window to avoid the leakage of the constant part of the counts
+    sweep = threshold_sweep(acquisitions, frequency, window=window)
+    plt.figure()
+    plt.subplot(121)
+    plt.plot(sweep["threshold"], sweep["counts_per_shot"], "o-")
+    plt.xlabel("Signal threshold")
+    plt.ylabel("Counts per shot")
+    plt.subplot(122)
+    plt.plot(sweep["threshold"], sweep["visibility"], "o-")
+    plt.xlabel("Signal threshold")
+    plt.ylabel(f"Visibility at {frequency / u.MHz:.2f} MHz")
+    plt.tight_layout()
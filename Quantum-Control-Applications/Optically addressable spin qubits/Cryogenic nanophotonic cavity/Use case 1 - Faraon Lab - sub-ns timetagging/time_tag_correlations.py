@@ -0,0 +1,228 @@
+"""
+Analysis of raw high resolution time tags: histograms, g2 correlations, beat-note spectra and threshold sweeps.
+
+The stream processing histogram fixes the binning at the time of the acquisition. Here the raw time tags of each shot
+(in ps, as returned by time_tagging.high_res) are saved together with the number of tags of each shot, so that the
+binning, the correlation window and the beat-note frequency can be changed afterwards without acquiring again.
+
+Each detector is described by two arrays:
+    - tags: the time tags of all the shots one after the other, in ps from the start of the detection window,
+    - counts: the number of time tags of each shot, used to find the tags detected during the same shot.
+
+The processing is vectorized and split into chunks of tags, so that the memory does not grow with the number of tags:
+    - histogram and beat_note_spectrum bin the tags with np.bincount and compute the spectrum of the binned counts by FFT,
+    - cross_correlation histograms the delays between all the pairs of tags detected during the same shot, and g2
+      normalizes it by the coincidences expected from the mean intensity profiles of the detectors,
+    - demodulate projects the tags on a given frequency, refined by beat_note_frequency beyond the resolution of the
+      spectrum, from which threshold_sweep compares acquisitions made with several signal thresholds of the detector.
+"""
+
+import numpy as np
+from scipy.optimize import minimize_scalar
+from scipy.signal import fftconvolve
+
+
+def histogram(tags, window: float, bin_width: float = 50) -> tuple:
+    """Histogram of the time tags.
+
+    :param tags: Time tags in ps.
+    :param window: Duration of the detection window in ps. The time tags outside of [0, window) are discarded.
+    :param bin_width: Width of the bins in ps.
+    :return: the centers of the bins in ps and the number of time tags in each bin.
+    """
+    nb_of_bins = int(np.ceil(window / bin_width))
+    index = np.floor_divide(np.asarray(tags), bin_width).astype(np.int64)
+    index = index[(index >= 0) & (index < nb_of_bins)]
+    return (np.arange(nb_of_bins) + 0.5) * bin_width, np.bincount(index, minlength=nb_of_bins)
+
+
+def cross_correlation(
+    tags_a,
+    counts_a,
+    tags_b=None,
+    counts_b=None,
+    max_delay: float = 5_000,
+    bin_width: float = 50,
+    chunk_size: int = 1_000_000,
+) -> tuple:
+    """Histogram of the delays t_b - t_a between the time tags of two detectors detected during the same shot.
+
+    :param tags_a: Time tags of the first detector in ps.
+    :param counts_a: Number of time tags of each shot of the first detector.
+    :param tags_b: Time tags of the second detector in ps. Default is None for the autocorrelation of the first
+        detector, where each time tag is not paired with itself.
+    :param counts_b: Number of time tags of each shot of the second detector.
+    :param max_delay: Largest absolute delay in ps.
+    :param bin_width: Width of the delay bins in ps, the bins being centered on multiples of the bin width.
+    :param chunk_size: Number of time tags of the first detector processed at once.
+    :return: the delays in ps and the number of pairs of time tags in each delay bin.
+    """
+    auto = tags_b is None
+    if auto:
+        tags_b, counts_b = tags_a, counts_a
+    tags_a, tags_b = np.asarray(tags_a), np.asarray(tags_b)
+    counts_a, counts_b = np.asarray(counts_a, dtype=np.int64), np.asarray(counts_b, dtype=np.int64)
+    if len(counts_a) != len(counts_b):
+        raise ValueError("The two detectors must have the same number of shots.")
+    half = int(max_delay // bin_width)
+    coincidences = np.zeros(2 * half + 1, dtype=np.int64)
+    # Shot of each time tag of the first detector, and first time tag of each shot of the second detector
+    shots = np.repeat(np.arange(len(counts_a)), counts_a)
+    start_b = np.cumsum(counts_b) - counts_b
+    for start in range(0, len(tags_a), chunk_size):
+        a = np.arange(start, min(start + chunk_size, len(tags_a)))
+        # Pair each time tag of the first detector with all the time tags of the second one in the same shot
+        nb_of_pairs = counts_b[shots[a]]
+        i = np.repeat(a, nb_of_pairs)
+        j = np.arange(nb_of_pairs.sum()) - np.repeat(np.cumsum(nb_of_pairs) - nb_of_pairs, nb_of_pairs)
+        j += np.repeat(start_b[shots[a]], nb_of_pairs)
+        if auto:
+            i, j = i[i != j], j[i != j]
+        index = np.floor((tags_b[j] - tags_a[i]) / bin_width + 0.5).astype(np.int64) + half
+        coincidences += np.bincount(index[(index >= 0) & (index <= 2 * half)], minlength=2 * half + 1)
+    return np.arange(-half, half + 1) * bin_width, coincidences
+
+
+def g2(
+    tags_a,
+    counts_a,
+    tags_b=None,
+    counts_b=None,
+    window: float = 100_000,
+    max_delay: float = 5_000,
+    bin_width: float = 50,
+    chunk_size: int = 1_000_000,
+) -> tuple:
+    """Second order correlation function between two detectors, or autocorrelation of one detector.
+
+    The coincidences of the same shot are normalized by the coincidences expected for uncorrelated detections with the
+    same mean intensity profiles, computed from the histograms of the two detectors, so that g2 = 1 for coherent light
+    whatever the shape of the detection window.
+
+    :param window: Duration of the detection window in ps.
+    :return: the delays in ps and g2 at each delay, NaN where no coincidence is expected.
+    """
+    delays, coincidences = cross_correlation(tags_a, counts_a, tags_b, counts_b, max_delay, bin_width, chunk_size)
+    if tags_b is None:
+        tags_b = tags_a
+    _, hist_a = histogram(tags_a, window, bin_width)
+    _, hist_b = histogram(tags_b, window, bin_width)
+    # Correlation of the histograms: sum over t of hist_a(t) * hist_b(t + delay), divided by the number of shots
+    expected = fftconvolve(hist_b, hist_a[::-1]) / len(counts_a)
+    lags = np.arange(len(expected)) - (len(hist_a) - 1)
+    expected = np.interp(delays / bin_width, lags, expected, left=0, right=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return delays, np.where(expected > 1e-12, coincidences / expected, np.nan)
+
+
+def beat_note_spectrum(tags, window: float, bin_width: float = 10) -> tuple:
+    """Power spectrum of the time tags, normalized to the shot noise so that uncorrelated detections give 1 on average.
+
+    :param tags: Time tags in ps.
+    :param window: Duration of the detection window in ps.
+    :param bin_width: Width of the bins in ps, setting the largest frequency of the spectrum to 1 / (2 * bin_width).
+    :return: the frequencies in Hz and the power spectrum.
+    """
+    _, counts = histogram(tags, window, bin_width)
+    spectrum = np.abs(np.fft.rfft(counts)) ** 2 / max(counts.sum(), 1)
+    return np.fft.rfftfreq(len(counts), bin_width * 1e-12), spectrum
+
+
+def peak_frequency(frequencies, spectrum, min_frequency: float = 0.0) -> float:
+    """Frequency of the largest peak of a spectrum above a minimum frequency, refined by parabolic interpolation.
+
+    The interpolation is biased by a fraction of the frequency resolution for spectra computed over a rectangular
+    window, use beat_note_frequency to get an accurate frequency from the time tags.
+    """
+    frequencies, spectrum = np.asarray(frequencies), np.asarray(spectrum)
+    k = np.flatnonzero(frequencies >= min_frequency)[0] + np.argmax(spectrum[frequencies >= min_frequency])
+    if 0 < k < len(spectrum) - 1:
+        left, center, right = spectrum[k - 1 : k + 2]
+        denominator = left - 2 * center + right
+        shift = 0.5 * (left - right) / denominator if denominator != 0 else 0.0
+        return frequencies[k] + shift * (frequencies[1] - frequencies[0])
+    return frequencies[k]
+
+
+def beat_note_frequency(
+    tags, window: float, min_frequency: float = 0.0, bin_width: float = 10, chunk_size: int = 1_000_000
+) -> float:
+    """Beat-note frequency maximizing the amplitude of the demodulated time tags.
+
+    The largest peak of the spectrum only gives the frequency within the resolution 1 / window (10 MHz for a 100 ns
+    window), which biases the visibility and the phase obtained by demodulation. The frequency is refined by maximizing
+    abs(demodulate(tags, f, window=window)) within one frequency bin around the peak, without binning the time tags.
+
+    :param tags: Time tags in ps.
+    :param window: Duration of the detection window in ps.
+    :param min_frequency: Frequency in Hz above which the peak is searched, to ignore the envelope of the window.
+    :param bin_width: Width of the bins in ps used to compute the spectrum.
+    :param chunk_size: Number of time tags processed at once.
+    :return: the beat-note frequency in Hz.
+    """
+    frequencies, spectrum = beat_note_spectrum(tags, window, bin_width)
+    frequency = peak_frequency(frequencies, spectrum, min_frequency)
+    resolution = frequencies[1] - frequencies[0]
+    result = minimize_scalar(
+        lambda f: -np.abs(demodulate(tags, f, chunk_size, window)),
+        bounds=(frequency - resolution, frequency + resolution),
+        method="bounded",
+        options={"xatol": resolution * 1e-4},
+    )
+    return result.x
+
+
+def demodulate(tags, frequency: float, chunk_size: int = 1_000_000, window: float = None) -> complex:
+    """Mean of exp(-2i * pi * frequency * t) over the time tags, without binning.
+
+    For counts modulated as 1 + V * cos(2 * pi * frequency * t + phase) over a window containing many periods, the
+    modulus is V / 2 and the argument is the phase of the modulation. Over a rectangular window, the constant part of
+    the counts leaks into the result by about 1 / (pi * frequency * window), which biases the visibility and the phase
+    by several percents for a few periods per window. Giving the window weights the time tags by a Hann window, which
+    suppresses this leakage.
+
+    :param tags: Time tags in ps.
+    :param frequency: Demodulation frequency in Hz.
+    :param chunk_size: Number of time tags processed at once.
+    :param window: Duration of the detection window in ps for the Hann weighting. Default is None for equal weights.
+    :return: the complex amplitude, 0 if there are no time tags.
+    """
+    tags = np.asarray(tags)
+    if len(tags) == 0:
+        return 0j
+    total, weights = 0j, 0.0
+    for start in range(0, len(tags), chunk_size):
+        t = tags[start : start + chunk_size]
+        if window is None:
+            w = np.ones(len(t))
+        else:
+            w = np.where((t >= 0) & (t < window), 1 - np.cos(2 * np.pi * t / window), 0)
+        total += (w * np.exp(-2j * np.pi * frequency * 1e-12 * t)).sum()
+        weights += w.sum()
+    return total / weights if weights > 0 else 0j
+
+
+def threshold_sweep(acquisitions: dict, frequency: float, chunk_size: int = 1_000_000, window: float = None) -> dict:
+    """Count rate and beat-note visibility of acquisitions made with different signal thresholds of the detector.
+
+    :param acquisitions: (tags, counts) of each acquisition, by signal threshold.
+    :param frequency: Beat-note frequency in Hz.
+    :param chunk_size: Number of time tags processed at once.
+    :param window: Duration of the detection window in ps, to weight the time tags by a Hann window (see demodulate).
+        Default is None for equal weights.
+    :return: dictionary of arrays with the sorted "threshold", the mean number of time tags per shot "counts_per_shot",
+        the "visibility" and the "phase" of the modulation at the beat-note frequency.
+    """
+    thresholds = sorted(acquisitions)
+    counts_per_shot, amplitudes = [], []
+    for threshold in thresholds:
+        tags, counts = acquisitions[threshold]
+        counts_per_shot.append(np.sum(counts) / max(len(counts), 1))
+        amplitudes.append(demodulate(tags, frequency, chunk_size, window))
+    amplitudes = np.array(amplitudes)
+    return {
+        "threshold": np.array(thresholds),
+        "counts_per_shot": np.array(counts_per_shot),
+        "visibility": 2 * np.abs(amplitudes),
+        "phase": np.angle(amplitudes),
+    }
@@ -1,13 +1,15 @@
 """
 Plays a MW pulse during a laser pulse, while performing time tagging throughout the sequence. This allows measuring all
 the delays in the system, as well as the NV initialization duration.
-This version process the data in Python, which makes it slower but works better when the counts are high.
+This version process the data in Python, which works better when the counts are high: the time tags are fetched by
+chunks and binned with numpy (see time_tag_histogram.py), so that the bins can have any width.
 """
 
 from qm import QuantumMachinesManager
 from qm.qua import *
 import matplotlib.pyplot as plt
 from configuration import *
+from time_tag_histogram import TimeTagHistogram
 
 ###################
 # The QUA program #
@@ -21,7 +23,7 @@ n_avg = 1e6
 
 buffer_len = 10
 meas_len = (laser_len_cycles + 2 * initial_delay_cycles) * 4  # total measurement length (ns)
-t_vec = np.arange(0, meas_len, 1)
+bin_width = 1  # Width of the bins of the histogram (ns)
 
 assert (laser_len_cycles - mw_len_cycles) > 4, "The MW must be shorter than the laser pulse"
 
@@ -66,8 +68,7 @@ times_handle = res_handles.get("times")
 iteration_handle = res_handles.get("iteration")
 times_handle.wait_for_values(1)
 iteration_handle.wait_for_values(1)
-counts_vec = np.zeros(meas_len, int)
-old_count = 0
+histogram = TimeTagHistogram(meas_len, bin_width=bin_width)
 
 # Live plotting
 fig = plt.figure()
@@ -78,21 +79,15 @@ b_last = not b_cont
 
 while b_cont or b_last:
     plt.cla()
-    new_count = times_handle.count_so_far()
     iteration = iteration_handle.fetch_all() + 1
     # Progress bar
     progress_counter(iteration, n_avg)
 
-    if new_count > old_count:
-        times = times_handle.fetch(slice(old_count, new_count))["value"]
-        for i in range(new_count - old_count):
-            for j in range(buffer_len):
-                counts_vec[times[i][j]] += 1
-        old_count = new_count
+    histogram.fetch(times_handle)
 
-    plt.plot(t_vec + 0.5, counts_vec / 1000 / (1 * 1e-9) / iteration)
+    plt.plot(histogram.bin_centers, histogram.counts[0] / 1000 / (histogram.bin_widths * 1e-9) / iteration)
     plt.xlabel("t [ns]")
-    plt.ylabel(f"counts [kcps / 1ns]")
+    plt.ylabel("counts [kcps]")
     plt.title("Delays")
     plt.pause(0.1)
 
@@ -0,0 +1,106 @@
+"""
+Histogram of time tags accumulated in Python while the program is running.
+
+The time tags saved with save_all are fetched by chunks from the position reached at the previous fetch, and are binned
+with a lookup table and np.bincount instead of being counted one by one, so that millions of tags per second can be
+processed on a single core:
+    - the bin of each time tag in ns is precomputed for the whole measurement window, which handles bins of any widths
+      (e.g. fine bins on the rising edge of the laser pulse and coarse bins elsewhere) at the same cost as uniform bins,
+    - the tags of all the detectors are counted with a single call to np.bincount,
+    - the last tags of each detector are kept in a preallocated ring buffer, so that they can be re-binned or correlated
+      without fetching them again and without the memory growing with the acquisition time.
+"""
+
+import numpy as np
+
+
+class TimeTagHistogram:
+    def __init__(
+        self,
+        meas_len: int,
+        bin_width: int = 1,
+        bin_edges=None,
+        nb_of_detectors: int = 1,
+        buffer_size: int = 1_000_000,
+    ):
+        """Histogram of the time tags of one or several detectors.
+
+        :param meas_len: Duration of the time tagging window in ns. The time tags must be within [0, meas_len).
+        :param bin_width: Width of the bins in ns, used when bin_edges is None.
+        :param bin_edges: Edges of the bins in ns, increasing, for bins of variable widths. The time tags outside of
+            [bin_edges[0], bin_edges[-1]) are discarded. Default is None for bins of constant width.
+        :param nb_of_detectors: Number of detectors, each one having its own histogram.
+        :param buffer_size: Number of time tags kept in the ring buffer of each detector.
+        """
+        if bin_edges is None:
+            # The last bin is clipped to the end of the window when bin_width does not divide meas_len
+            bin_edges = np.r_[np.arange(0, meas_len, bin_width), meas_len]
+        self.bin_edges = np.asarray(bin_edges)
+        self.nb_of_bins = len(self.bin_edges) - 1
+        self.nb_of_detectors = nb_of_detectors
+        # Bin of each time tag of the window, the tags outside of the bins being sent to an overflow bin
+        self._lookup = np.searchsorted(self.bin_edges, np.arange(meas_len), side="right") - 1
+        self._lookup[(self._lookup < 0) | (self._lookup >= self.nb_of_bins)] = self.nb_of_bins
+        self.counts = np.zeros((nb_of_detectors, self.nb_of_bins), dtype=np.int64)
+        # Ring buffer of the last time tags of each detector
+        self._buffer = np.zeros((nb_of_detectors, buffer_size), dtype=np.int64)
+        self.nb_of_tags = np.zeros(nb_of_detectors, dtype=np.int64)
+        # Number of values of each result handle already fetched
+        self._offsets = {}
+
+    @property
+    def bin_centers(self) -> np.ndarray:
+        return (self.bin_edges[:-1] + self.bin_edges[1:]) / 2
+
+    @property
+    def bin_widths(self) -> np.ndarray:
+        return np.diff(self.bin_edges)
+
+    def add(self, *tags) -> None:
+        """Add time tags to the histograms.
+
+        :param tags: Time tags in ns of each detector, as arrays of any shape.
+        """
+        tags = [np.asarray(t, dtype=np.int64).ravel() for t in tags]
+        if len(tags) != self.nb_of_detectors:
+            raise ValueError(f"Expected the time tags of {self.nb_of_detectors} detectors, got {len(tags)}.")
+        # Index of the bin of each tag in the flattened histograms of all the detectors, overflow bins included
+        index = np.concatenate([self._lookup[t] + k * (self.nb_of_bins + 1) for k, t in enumerate(tags)])
+        counts = np.bincount(index, minlength=self.nb_of_detectors * (self.nb_of_bins + 1))
+        self.counts += counts.reshape(self.nb_of_detectors, self.nb_of_bins + 1)[:, :-1]
+        for k, t in enumerate(tags):
+            self._write(k, t)
+
+    def _write(self, detector: int, tags: np.ndarray) -> None:
+        size = self._buffer.shape[1]
+        nb_of_tags = len(tags)
+        # Only the last tags are kept when there are more tags than the size of the buffer
+        tags = tags[-size:]
+        start = (self.nb_of_tags[detector] + nb_of_tags - len(tags)) % size
+        end = min(start + len(tags), size)
+        self._buffer[detector, start:end] = tags[: end - start]
+        self._buffer[detector, : len(tags) - (end - start)] = tags[end - start :]
+        self.nb_of_tags[detector] += nb_of_tags
+
+    def recent(self, detector: int = 0) -> np.ndarray:
+        """Last time tags of a detector kept in the ring buffer, from the oldest to the newest."""
+        size = self._buffer.shape[1]
+        n = self.nb_of_tags[detector]
+        if n <= size:
+            return self._buffer[detector, :n].copy()
+        return np.roll(self._buffer[detector], -(n % size))
+
+    def fetch(self, *handles) -> int:
+        """Fetch the time tags saved since the previous call and add them to the histograms.
+
+        :param handles: Result handle of the time tags of each detector (e.g. job.result_handles.get("times")).
+        :return: the number of new time tags.
+        """
+        tags = []
+        for handle in handles:
+            start = self._offsets.get(handle, 0)
+            stop = handle.count_so_far()
+            tags.append(handle.fetch(slice(start, stop))["value"] if stop > start else np.zeros(0, dtype=np.int64))
+            self._offsets[handle] = stop
+        self.add(*tags)
+        return sum(np.size(t) for t in tags)
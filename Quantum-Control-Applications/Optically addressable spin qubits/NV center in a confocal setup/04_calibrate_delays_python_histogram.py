@@ -2,7 +2,8 @@
         CALIBRATE DELAYS
 The program consists in playing a mw pulse during a laser pulse and while performing time tagging throughout the sequence.
 This allows measuring all the delays in the system, as well as the NV initialization duration.
-This version processes the data in Python, which makes it slower but works better when the counts are high.
+This version processes the data in Python, which works better when the counts are high: the time tags are fetched by
+chunks and binned with numpy (see time_tag_histogram.py), so that the bins can have any width.
 
 Next steps before going to the next node:
     - Update the initial laser delay (laser_delay_1) and initialization length (initialization_len_1) in the configuration.
@@ -14,6 +15,7 @@ from qm import QuantumMachinesManager
 from qm.qua import *
 import matplotlib.pyplot as plt
 from configuration import *
+from time_tag_histogram import TimeTagHistogram
 from qm import SimulationConfig
 
 ###################
@@ -28,7 +30,7 @@ n_avg = 1_000_000
 
 buffer_len = 10  # The size of each chunk of data handled by the stream processing
 meas_len = initialization_len + 2 * laser_delay  # total measurement length (ns)
-t_vec = np.arange(0, meas_len, 1)
+bin_width = 1  # Width of the bins of the histogram (ns)
 
 assert (initialization_len - mw_len) > 4, "The MW must be shorter than the laser pulse"
 
@@ -92,8 +94,7 @@ else:
     times_handle.wait_for_values(1)
     iteration_handle.wait_for_values(1)
     # Data processing initialization
-    counts_vec = np.zeros(meas_len, int)
-    old_count = 0
+    histogram = TimeTagHistogram(meas_len, bin_width=bin_width)
 
     # Live plotting
     fig = plt.figure()
@@ -104,21 +105,15 @@ else:
 
     while b_cont or b_last:
         plt.cla()
-        new_count = times_handle.count_so_far()
         iteration = iteration_handle.fetch_all() + 1
         # Progress bar
         progress_counter(iteration, n_avg)
         # Populate the histogram
-        if new_count > old_count:
-            times = times_handle.fetch(slice(old_count, new_count))["value"]
-            for i in range(new_count - old_count):
-                for j in range(buffer_len):
-                    counts_vec[times[i][j]] += 1
-            old_count = new_count
+        histogram.fetch(times_handle)
         # Plot the histogram
-        plt.plot(t_vec + 0.5, counts_vec / 1000 / (1 * 1e-9) / iteration)
+        plt.plot(histogram.bin_centers, histogram.counts[0] / 1000 / (histogram.bin_widths * 1e-9) / iteration)
         plt.xlabel("t [ns]")
-        plt.ylabel(f"counts [kcps / 1ns]")
+        plt.ylabel("counts [kcps]")
         plt.title("Delays")
         plt.pause(0.1)
 
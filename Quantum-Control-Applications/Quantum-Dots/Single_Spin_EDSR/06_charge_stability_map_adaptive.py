@@ -0,0 +1,159 @@
+"""
+        ADAPTIVE CHARGE STABILITY MAP with the OPX
+The goal of the script is to acquire large charge stability maps quickly by measuring only a fraction of the points.
+The transition lines only cover a small part of the map, so the points are chosen by the host while the program runs:
+a coarse grid is measured first, then the regions where the signal varies the most are refined down to the resolution of
+the map (see adaptive_scan.py). The voltages of the next points are sent to the running program by batches through
+input streams, and the full map is reconstructed by interpolation of the measured points.
+
+The number of measured points, and hence the acquisition time, is set by the refinement threshold and can be limited
+with max_points. The refinement can be tested offline on a synthetic map with simulate = True.
+
+Prerequisites:
+    - Readout calibration (resonance frequency for RF reflectometry).
+    - Connect the two plunger gates (AC line of the bias-tees) to the OPX.
+
+Before proceeding to the next node:
+    - Identify the different charge occupation regions
+"""
+
+from qm.qua import *
+from qm import QuantumMachinesManager
+from configuration import *
+from qualang_tools.plot import interrupt_on_close
+import matplotlib.pyplot as plt
+from macros import RF_reflectometry_macro
+from adaptive_scan import AdaptiveSampler
+
+###################
+# The QUA program #
+###################
+n_avg = 100
+# Gates swept along the fast (x) and slow (y) axes
+x_gate = "P1"
+y_gate = "P2"
+# Voltages in Volt. Because of the bias-tee, it is important that the voltages swept by the OPX are centered around 0.
+x_values = np.linspace(-0.2, 0.2, 401)
+y_values = np.linspace(-0.2, 0.2, 401)
+# Adaptive refinement
+initial_step = 16  # Spacing in pixels of the initial coarse grid
+threshold = 0.1  # Relative variation of the signal above which a region is refined
+max_points = len(x_values) * len(y_values) // 10  # Maximum number of measured points
+batch_size = 500  # Number of points sent to the OPX at once
+
+with program() as adaptive_charge_stability:
+    n = declare(int)  # QUA integer used as an index for the averaging loop
+    k = declare(int)  # QUA integer used as an index to loop over the points of the batch
+    I = declare(fixed)  # QUA variable for the measured 'I' quadrature
+    Q = declare(fixed)  # QUA variable for the measured 'Q' quadrature
+    I_st = declare_stream()
+    Q_st = declare_stream()
+    # Number of points of the next batch, 0 to end the acquisition, and their voltages
+    nb_of_points = declare_input_stream(int, name="nb_of_points")
+    x_batch = declare_input_stream(fixed, name="x_batch", size=batch_size)
+    y_batch = declare_input_stream(fixed, name="y_batch", size=batch_size)
+
+    # Wait for the first batch of points
+    advance_input_stream(nb_of_points)
+    with while_(nb_of_points > 0):
+        advance_input_stream(x_batch)
+        advance_input_stream(y_batch)
+        with for_(k, 0, k < nb_of_points, k + 1):
+            # Update the dc offsets of the gates
+            set_dc_offset(x_gate, "single", x_batch[k])
+            set_dc_offset(y_gate, "single", y_batch[k])
+            align()
+            with for_(n, 0, n < n_avg, n + 1):  # The averaging loop
+                # RF reflectometry: the voltage measured by the analog input 2 is recorded, demodulated at the readout
+                # frequency and the integrated quadratures are stored in "I" and "Q"
+                RF_reflectometry_macro(I=I, Q=Q, I_st=I_st, Q_st=Q_st)
+                # Wait at each iteration in order to ensure that the data will not be transferred faster than 1 sample
+                # per µs to the stream processing.
+                wait(1_000 * u.ns)  # in ns
+        # Wait for the next batch of points
+        advance_input_stream(nb_of_points)
+    # Bring the gates back to zero
+    set_dc_offset(x_gate, "single", 0.0)
+    set_dc_offset(y_gate, "single", 0.0)
+
+    # Stream processing section used to process the data before saving it
+    with stream_processing():
+        # Average the data of each point and keep all of them, in the order in which they are measured
+        I_st.buffer(n_avg).map(FUNCTIONS.average()).save_all("I")
+        Q_st.buffer(n_avg).map(FUNCTIONS.average()).save_all("Q")
+
+
+def plot_map(sampler):
+    plt.subplot(121)
+    plt.cla()
+    plt.title(f"Measured points: {sampler.nb_of_measured / sampler.values.size * 100:.1f} %")
+    points = sampler.points
+    plt.plot(x_values[points[:, 1]], y_values[points[:, 0]], ".", markersize=1)
+    plt.xlim(x_values[0], x_values[-1])
+    plt.ylim(y_values[0], y_values[-1])
+    plt.xlabel(f"{x_gate} voltage [V]")
+    plt.ylabel(f"{y_gate} voltage [V]")
+    plt.subplot(122)
+    plt.cla()
+    plt.title(r"Reconstructed $R=\sqrt{I^2 + Q^2}$ [V]")
+    plt.pcolor(x_values, y_values, sampler.reconstruct())
+    plt.xlabel(f"{x_gate} voltage [V]")
+    plt.ylabel(f"{y_gate} voltage [V]")
+    plt.tight_layout()
+    plt.pause(0.1)
+
+
+sampler = AdaptiveSampler(x_values, y_values, initial_step=initial_step, threshold=threshold, max_points=max_points)
+
+#####################################
+#  Open Communication with the QOP  #
+#####################################
+qmm = QuantumMachinesManager(host=qop_ip, port=qop_port, cluster_name=cluster_name, octave=octave_config)
+
+###########################
+# Run or Simulate Program #
+###########################
+simulate = False
+
+if simulate:
+    # Emulates the adaptive acquisition on a synthetic charge stability map, to tune the refinement parameters
+    def synthetic_map(x, y):
+        slope = sum(np.exp(-(((x + 0.4 * y) * 10 - i + 0.3) ** 2) / 0.005) for i in range(-3, 4))
+        return slope + 0.6 * sum(np.exp(-(((y + 0.3 * x) * 10 - i) ** 2) / 0.005) for i in range(-3, 4))
+
+    plt.figure()
+    points = sampler.next_points(batch_size)
+    while len(points) > 0:
+        sampler.update(points, synthetic_map(*sampler.voltages(points)))
+        points = sampler.next_points(batch_size)
+    plot_map(sampler)
+
+else:
+    # Open the quantum machine
+    qm = qmm.open_qm(config)
+    # Send the QUA program to the OPX, which compiles and executes it
+    job = qm.execute(adaptive_charge_stability)
+    handles = [job.result_handles.get("I"), job.result_handles.get("Q")]
+    # Live plotting
+    fig = plt.figure()
+    interrupt_on_close(fig, job)  # Interrupts the job when closing the figure
+    nb_of_measured = 0
+    points = sampler.next_points(batch_size)
+    while len(points) > 0 and job.result_handles.is_processing():
+        # Send the voltages of the next points, padded to the size of the input streams
+        x, y = sampler.voltages(points)
+        job.push_to_input_stream("x_batch", np.pad(x, (0, batch_size - len(points))).tolist())
+        job.push_to_input_stream("y_batch", np.pad(y, (0, batch_size - len(points))).tolist())
+        job.push_to_input_stream("nb_of_points", len(points))
+        # Wait for the averaged results of the batch
+        for handle in handles:
+            handle.wait_for_values(nb_of_measured + len(points))
+        I, Q = [handle.fetch(slice(nb_of_measured, nb_of_measured + len(points)))["value"] for handle in handles]
+        nb_of_measured += len(points)
+        # Convert results into Volts and refine the regions where the amplitude varies the most
+        S = u.demod2volts(I + 1j * Q, reflectometry_readout_length)
+        sampler.update(points, np.abs(S))
+        plot_map(sampler)
+        points = sampler.next_points(batch_size)
+    # End the acquisition
+    job.push_to_input_stream("nb_of_points", 0)
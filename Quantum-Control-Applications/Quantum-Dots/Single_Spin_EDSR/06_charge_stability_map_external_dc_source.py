@@ -2,7 +2,9 @@
         CHARGE STABILITY MAP - fast and slow axes: external source (DC)
 The goal of the script is to acquire the charge stability map.
 Here the charge stability diagram is acquired by sweeping the voltages using an external DC source (QDAC or else).
-This is done by pausing the QUA program, updating the voltages in Python using the instrument API and resuming the QUA program.
+The whole list of voltage points is preloaded into the external source, which steps to the next point on every digital
+trigger sent by the OPX, so that the QUA program runs without any pause/resume round-trip with Python (see
+triggered_sweep.py). A local mock of the source can be used to test the script without hardware.
 
 The OPX is simply measuring, either via dc current sensing or RF reflectometry, the charge occupation of the dot.
 On top of the DC voltage sweeps, the OPX can output a continuous square wave (Coulomb pulse) through the AC line of the
@@ -14,7 +16,8 @@ A single-point averaging is performed and the data is extracted while the progra
 Prerequisites:
     - Readout calibration (resonance frequency for RF reflectometry and sensor operating point for DC current sensing).
     - Setting the parameters of the external DC source using its driver.
-    - Connect the two plunger gates (DC line of the bias-tee) to the external dc source.
+    - Connect the two plunger gates (DC line of the bias-tee) to the external dc source and a digital marker from the OPX
+      to its external trigger port.
     - (optional) Connect the OPX to the fast line of the plunger gates for playing the Coulomb pulse and calibrate the
       lever arm.
 
@@ -27,11 +30,12 @@ from qm.qua import *
 from qm import QuantumMachinesManager
 from qm import SimulationConfig
 from configuration import *
-from qualang_tools.results import progress_counter, fetching_tool, wait_until_job_is_paused
+from qualang_tools.results import progress_counter, fetching_tool
 from qualang_tools.plot import interrupt_on_close
 from qualang_tools.addons.variables import assign_variables_to_element
 import matplotlib.pyplot as plt
 from macros import RF_reflectometry_macro, DC_current_sensing_macro
+from triggered_sweep import TriggeredSweep, MockTriggeredInstrument
 
 ###################
 # The QUA program #
@@ -47,6 +51,12 @@ N = (int((readout_len + 1_000 + 0 * 1 * u.ms) / (2 * step_length)) + 1) * n_avg
 voltage_values_slow = np.linspace(-1.5, 1.5, n_points_slow)
 voltage_values_fast = np.linspace(-1.5, 1.5, n_points_fast)
 
+# External DC source stepping through the (slow, fast) voltage points on the triggers sent by "qdac_trigger1"
+# TODO: replace the mock with the external dc source, e.g. QDAC2Sweep(qdac, channels=[2, 1], trigger_port="ext1")
+source = MockTriggeredInstrument(nb_of_channels=2)
+# Wait for the voltages to settle after each trigger (depends on the voltage source bandwidth)
+sweep = TriggeredSweep(source, [voltage_values_slow, voltage_values_fast], "qdac_trigger1", settle_time=1 * u.ms)
+
 with program() as charge_stability_prog:
     n = declare(int)  # QUA integer used as an index for the averaging loop
     counter = declare(int)  # QUA integer used as an index for the Coulomb pulse
@@ -61,13 +71,10 @@ with program() as charge_stability_prog:
     assign_variables_to_element("tank_circuit", I, Q)
     assign_variables_to_element("TIA", dc_signal)
 
-    with for_(i, 0, i < n_points_slow + 1, i + 1):
+    with for_(i, 0, i < n_points_slow, i + 1):
         with for_(j, 0, j < n_points_fast, j + 1):
-            # Pause the OPX to update the external DC voltages in Python
-            pause()
-
-            # Wait for the voltages to settle (depends on the voltage source bandwidth)
-            wait(1 * u.ms)
+            # Trigger the external source to output the next voltage point and wait for the voltages to settle
+            sweep.step("P1", "tank_circuit", "TIA")
 
             # Play the Coulomb pulse continuously for the whole sequence
             #      ____      ____      ____      ____
@@ -118,33 +125,29 @@ if simulate:
     # Simulates the QUA program for the specified duration
     simulation_config = SimulationConfig(duration=50_000)  # In clock cycles = 4ns
     job = qmm.simulate(config, charge_stability_prog, simulation_config)
-    job.get_simulated_samples().con1.plot()
+    samples = job.get_simulated_samples().con1
+    samples.plot()
+    # Replay the simulated triggers on the mock source to check the voltage points it outputs
+    sweep.load()
+    plt.figure()
+    plt.plot(source.replay(samples.digital["1"]))
+    plt.xlabel("Time [ns]")
+    plt.ylabel("Source voltage [V]")
 
 else:
+    # Preload the voltage points into the external source
+    sweep.load()
     # Open the quantum machine
     qm = qmm.open_qm(config)
     # Send the QUA program to the OPX, which compiles and executes it
     job = qm.execute(charge_stability_prog)
+    # Get results from QUA program and initialize live plotting
+    results = fetching_tool(job, data_list=["I", "Q", "dc_signal", "iteration"], mode="live")
     # Live plotting
     fig = plt.figure()
     interrupt_on_close(fig, job)  # Interrupts the job when closing the figure
-    for i in range(n_points_slow):  # Loop over y-voltages
-        # Set voltage
-        # TODO: update slow axis voltage with external dc source
-        # qdac.write(f"sour{qdac_channel_slow}:volt {voltage_values_slow[i]}")
-        for j in range(n_points_fast):  # Loop over x-voltages
-            # Set voltage
-            # TODO: update fast axis voltage with external dc source
-            # qdac.write(f"sour{qdac_channel_fast}:volt {voltage_values_fast[j]}")
-            # Resume the QUA program (escape the 'pause' statement)
-            job.resume()
-            # Wait until the program reaches the 'pause' statement again, indicating that the QUA program is done
-            wait_until_job_is_paused(job)
-        if i == 0:
-            # Get results from QUA program and initialize live plotting
-            results = fetching_tool(job, data_list=["I", "Q", "dc_signal", "iteration"], mode="live")
-
-        # Fetch the data from the last OPX run corresponding to the current slow axis iteration
+    while results.is_processing():
+        # Fetch the lines acquired so far
         I, Q, DC_signal, iteration = results.fetch_all()
         # Convert results into Volts
         S = u.demod2volts(I + 1j * Q, reflectometry_readout_length)
@@ -152,18 +155,18 @@ else:
         phase = np.angle(S)  # Phase
         DC_signal = u.demod2volts(DC_signal, readout_len)
         # Progress bar
-        progress_counter(iteration, n_points_slow)
+        progress_counter(iteration, n_points_slow, start_time=results.start_time)
         # Plot data
         plt.subplot(121)
         plt.cla()
         plt.title(r"$R=\sqrt{I^2 + Q^2}$ [V]")
-        plt.pcolor(voltage_values_fast, voltage_values_slow[: iteration + 1], R)
+        plt.pcolor(voltage_values_fast, voltage_values_slow[: len(R)], R)
         plt.xlabel("Fast voltage axis [V]")
         plt.ylabel("Slow voltage axis [V]")
         plt.subplot(122)
         plt.cla()
         plt.title("Phase [rad]")
-        plt.pcolor(voltage_values_fast, voltage_values_slow[: iteration + 1], phase)
+        plt.pcolor(voltage_values_fast, voltage_values_slow[: len(phase)], phase)
         plt.xlabel("Fast voltage axis [V]")
         plt.ylabel("Slow voltage axis [V]")
         plt.tight_layout()
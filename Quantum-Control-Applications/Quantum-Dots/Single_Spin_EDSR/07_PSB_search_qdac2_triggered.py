@@ -31,7 +31,7 @@ from configuration import *
 from qualang_tools.results import progress_counter, fetching_tool
 from qualang_tools.plot import interrupt_on_close
 from qualang_tools.addons.variables import assign_variables_to_element
-from qdac2_driver import QDACII, load_voltage_list
+from qdac2_driver import QDACII, load_voltage_lists
 import matplotlib.pyplot as plt
 from macros import RF_reflectometry_macro, DC_current_sensing_macro
 
@@ -124,26 +124,29 @@ qmm = QuantumMachinesManager(host=qop_ip, port=qop_port, cluster_name=cluster_na
 # Create the qdac instrument
 qdac = QDACII("Ethernet", IP_address="127.0.0.1", port=5025)  # Using Ethernet protocol
 # qdac = QDACII("USB", USB_device=4)  # Using USB protocol
-# Set up the qdac and load the voltage list
-load_voltage_list(
+# Set up the qdac and load the voltage lists of both channels at once
+load_voltage_lists(
     qdac,
-    channel=1,
-    dwell=2e-6,
-    slew_rate=2e7,
-    trigger_port="ext1",
-    output_range="low",
-    output_filter="med",
-    voltage_list=voltage_values_fast,
-)
-load_voltage_list(
-    qdac,
-    channel=2,
-    dwell=2e-6,
-    slew_rate=2e7,
-    trigger_port="ext2",
-    output_range="high",
-    output_filter="med",
-    voltage_list=voltage_values_slow,
+    [
+        dict(
+            channel=1,
+            dwell=2e-6,
+            slew_rate=2e7,
+            trigger_port="ext1",
+            output_range="low",
+            output_filter="med",
+            voltage_list=voltage_values_fast,
+        ),
+        dict(
+            channel=2,
+            dwell=2e-6,
+            slew_rate=2e7,
+            trigger_port="ext2",
+            output_range="high",
+            output_filter="med",
+            voltage_list=voltage_values_slow,
+        ),
+    ],
 )
 
 ###########################
@@ -10,7 +10,8 @@ the bias-tee. Alternatively one can obtain the same result by changing the offse
 
 In the current implementation, the qubit pulse is played using both the baking tool, that allows for playing arbitrarily
 short pulses with 1ns resolution, and real-time pulse manipulation of the OPX for playing arbitrarily long pulse without
-any memory issue.
+any memory issue (see duration_sweep.py). Only the remainders of the durations modulo 4ns are baked, so that the
+memory and compilation time do not depend on the number and range of the durations.
 Also note that the qubit pulses are played at the end of the "idle" level whose duration is fixed.
 
 Prerequisites:
@@ -30,9 +31,9 @@ from configuration import *
 from qualang_tools.results import progress_counter, fetching_tool
 from qualang_tools.plot import interrupt_on_close
 from qualang_tools.loops import from_array
-from qualang_tools.bakery import baking
 import matplotlib.pyplot as plt
 from macros import RF_reflectometry_macro, DC_current_sensing_macro
+from duration_sweep import DurationSweep
 
 
 ###################
@@ -52,45 +53,13 @@ seq.add_points("initialization", level_init, duration_init)
 seq.add_points("idle", level_manip, duration_manip)
 seq.add_points("readout", level_readout, duration_readout)
 
-# Bake the Rabi pulses
-pi_list = []
-pi_list_4ns = []
-for t in range(16):  # Create the different baked sequences
-    t = int(t)
-    with baking(config, padding_method="left") as b:  # don't use padding to assure error if timing is incorrect
-        if t == 0:
-            wf_I = [0.0] * 16
-            wf_Q = [0.0] * 16  # Otherwise the baked pulse will be empty
-        else:
-            wf_I = [pi_amp] * t
-            wf_Q = [0.0] * t  # The baked waveforms (only the "I" quadrature)
-
-        # Add the baked operation to the config
-        b.add_op("pi_baked", "qubit", [wf_I, wf_Q])
-        # Baked sequence
-        b.wait(16 - t, "qubit")  # Wait time to take gaps into account and always play right before reading out
-        b.play("pi_baked", "qubit")  # Play the qubit pulse
-
-    if t < 4:
-        with baking(config, padding_method="left") as b4ns:  # don't use padding to assure error if timing is incorrect
-            wf_I = [pi_amp] * t
-            wf_Q = [0.0] * t  # The baked waveforms (only the "I" quadrature)
-
-            # Add the baked operation to the config
-            b4ns.add_op("pi_baked2", "qubit", [wf_I, wf_Q])
-            # Baked sequence
-            b4ns.wait(32 - t, "qubit")  # Wait time to take gaps into account and always play right before reading out
-            b4ns.play("pi_baked2", "qubit")  # Play the qubit pulse
-    # Append the baking object in the list to call it from the QUA program
-    pi_list.append(b)
-    pi_list_4ns.append(b4ns)
-
+# Rabi pulse swept with 1ns resolution: the remainder of the duration modulo 4ns is baked and the rest is played in
+# real-time, so that the number of baked waveforms does not depend on the sweep
+rabi_pulse = DurationSweep(config, {"qubit": pi_amp})
 
 with program() as Rabi_prog:
     n = declare(int)  # QUA integer used as an index for the averaging loop
     t = declare(int)  # QUA variable for the qubit pulse duration
-    t_cycles = declare(int)  # QUA variable for the qubit pulse duration
-    t_left_ns = declare(int)  # QUA variable for the remainder
     f = declare(int)  # QUA variable for the qubit drive amplitude
     n_st = declare_stream()  # Stream for the iteration number (progress bar)
     with for_(n, 0, n < n_avg, n + 1):  # The averaging loop
@@ -104,28 +73,9 @@ with program() as Rabi_prog:
                     seq.add_step(voltage_point_name="readout")
                     seq.add_compensation_pulse(duration=duration_compensation_pulse)
 
-                # Short qubit pulse: baking only
-                with if_(t < 16):
-                    # switch case to select the baked waveform corresponding to the burst duration
-                    with switch_(t, unsafe=True):
-                        for ii in range(16):
-                            with case_(ii):
-                                # Drive the singlet-triplet qubit using an exchange pulse at the end of the manipulation step
-                                wait((duration_init - delay_before_readout) * u.ns - 4 - 9, "qubit")
-                                pi_list[ii].run()
-
-                # Long qubit pulse: baking and play combined
-                with else_():
-                    assign(t_cycles, t >> 2)  # Right shift by 2 is a quick way to divide by 4
-                    assign(t_left_ns, t - (t_cycles << 2))  # left shift by 2 is a quick way to multiply by 4
-                    # switch case to select the baked waveform corresponding to the burst duration
-                    with switch_(t_left_ns, unsafe=True):
-                        for ii in range(4):
-                            with case_(ii):
-                                # Drive the singlet-triplet qubit using an exchange pulse at the end of the manipulation step
-                                wait((duration_init - delay_before_readout) * u.ns - t_cycles - 4 - 29, "qubit")
-                                pi_list_4ns[ii].run()
-                                play("pi", "qubit", duration=t_cycles)
+                # Drive the qubit by playing the MW pulse at the end of the manipulation step
+                # The delay of the real-time computations is compensated in the macro (see duration_sweep.py)
+                rabi_pulse.play(t, end_time=(duration_init - delay_before_readout) * u.ns)
 
                 # Measure the dot right after the qubit manipulation
                 wait(duration_init * u.ns, "tank_circuit", "TIA")
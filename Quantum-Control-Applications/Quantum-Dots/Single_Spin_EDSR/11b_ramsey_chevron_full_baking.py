@@ -9,8 +9,10 @@ A compensation pulse can be added to the long timescale sequence in order to ens
 the bias-tee. Alternatively one can obtain the same result by changing the offset of the slow line of the bias-tee.
 
 In the current implementation, the qubit pulses are played using the baking tool that allows for playing arbitrarily short
-pulses with 1ns resolution. The drawback is that the pulses must be loaded to the OPX before the program starts (kind of
-like an AWG), which quickly hit the waveform memory limit of the OPX (~65k samples per pulse processor).
+pulses with 1ns resolution. Instead of loading the full sequence for each idle time to the OPX before the program starts
+(kind of like an AWG), which quickly hits the waveform memory limit of the OPX (~65k samples per pulse processor), only
+the first pi/2 pulse followed by the remainder of the idle time modulo 4ns is baked and the rest of the idle time is
+set in real-time (see duration_sweep.py), so that the memory does not depend on the number and range of the idle times.
 Also note that the qubit pulses are played at the end of the global "idle" level whose duration is fixed.
 
 Prerequisites:
@@ -31,10 +33,10 @@ from configuration import *
 from qualang_tools.results import progress_counter, fetching_tool
 from qualang_tools.plot import interrupt_on_close
 from qualang_tools.loops import from_array
-from qualang_tools.bakery import baking
 from qualang_tools.addons.variables import assign_variables_to_element
 import matplotlib.pyplot as plt
 from macros import RF_reflectometry_macro, DC_current_sensing_macro
+from duration_sweep import DurationSweep
 
 
 ###################
@@ -44,7 +46,6 @@ from macros import RF_reflectometry_macro, DC_current_sensing_macro
 n_avg = 100
 # Pulse duration sweep in ns
 durations = np.arange(0, 101, 1)
-assert max(durations) % 4 == 0
 # Qubit detuning with respect to qubit_IF in Hz
 detunings = np.arange(-10 * u.MHz, 10 * u.MHz, 100 * u.kHz)
 
@@ -54,23 +55,11 @@ seq.add_points("initialization", level_init, duration_init)
 seq.add_points("idle", level_manip, duration_manip)
 seq.add_points("readout", level_readout, duration_readout)
 
-# Bake the Rabi pulses
-pi_list = []
-for t in durations:  # Create the different baked sequences
-    t = int(t)
-    with baking(config, padding_method="left") as b:  # don't use padding to assure error if timing is incorrect
-        # Add the baked operation to the config
-        wf_I = [pi_half_amp] * pi_half_length
-        wf_Q = [0.0] * pi_half_length  # The baked waveforms (only the "I" quadrature)
-        b.add_op("pi_half_baked", "qubit", [wf_I, wf_Q])
-
-        # Baked sequence
-        b.wait(max(durations) - t, "qubit")
-        b.play("pi_half_baked", "qubit")  # Play the qubit pulse
-        b.wait(t, "qubit")
-        b.play("pi_half_baked", "qubit")  # Play the qubit pulse
-    # Append the baking object in the list to call it from the QUA program
-    pi_list.append(b)
+# Idle time between the two pi/2 pulses swept with 1ns resolution: the first pi/2 pulse and the remainder of the idle
+# time modulo 4ns are baked and the rest is waited in real-time, so that the number of baked waveforms does not depend
+# on the sweep
+pi_half_wf = [pi_half_amp] * pi_half_length
+ramsey = DurationSweep(config, {"qubit": 0.0}, before={"qubit": pi_half_wf}, after={"qubit": pi_half_wf})
 
 with program() as Ramsey_chevron:
     n = declare(int)  # QUA integer used as an index for the averaging loop
@@ -89,7 +78,7 @@ with program() as Ramsey_chevron:
         save(n, n_st)
         with for_(*from_array(f, detunings)):  # Loop over the qubit pulse amplitude
             update_frequency("qubit", f + qubit_IF)
-            with for_(t, 0, t < len(durations), t + 1):  # Loop over the qubit pulse duration
+            with for_(*from_array(t, durations)):  # Loop over the idle time
                 with strict_timing_():  # Ensure that the sequence will be played without gap
                     # Navigate through the charge stability map
                     seq.add_step(voltage_point_name="initialization")
@@ -97,25 +86,14 @@ with program() as Ramsey_chevron:
                     seq.add_step(voltage_point_name="readout")
                     seq.add_compensation_pulse(duration=duration_compensation_pulse)
 
-                    # Drive the singlet-triplet qubit using an exchange pulse at the end of the manipulation step
-                    # switch case to select the baked waveform corresponding to the burst duration
-                    with switch_(t, unsafe=True):
-                        for ii in range(len(durations)):
-                            with case_(ii):
-                                # Drive the qubit by playing the MW pulse at the end of the manipulation step
-                                wait(
-                                    (duration_init + duration_manip - 2 * pi_half_length) * u.ns
-                                    - max(durations) // 4
-                                    - 4,
-                                    "qubit",
-                                )
-                                wait(4, "qubit")  # Need 4 because of a gap
-                                pi_list[ii].run()
-
-                    # Measure the dot right after the qubit manipulation
-                    wait((duration_init + duration_manip) * u.ns, "tank_circuit", "TIA")
-                    I, Q, I_st, Q_st = RF_reflectometry_macro(I=I, Q=Q)
-                    dc_signal, dc_signal_st = DC_current_sensing_macro(dc_signal=dc_signal)
+                # Drive the qubit by playing the MW pulses at the end of the manipulation step
+                # The delay of the real-time computations is compensated in the macro (see duration_sweep.py)
+                ramsey.play(t, end_time=(duration_init + duration_manip - pi_half_length) * u.ns)
+
+                # Measure the dot right after the qubit manipulation
+                wait((duration_init + duration_manip) * u.ns, "tank_circuit", "TIA")
+                I, Q, I_st, Q_st = RF_reflectometry_macro(I=I, Q=Q)
+                dc_signal, dc_signal_st = DC_current_sensing_macro(dc_signal=dc_signal)
 
                 # Ramp the background voltage to zero to avoid propagating floating point errors
                 seq.ramp_to_zero()
@@ -0,0 +1,161 @@
+"""
+Multiplexed charge stability maps: several gate pairs swept and several reflectometry resonators read in one program.
+
+All the maps share the same averaging and voltage loops: at each point of the grid, the OPX sets the voltage of every
+swept gate with set_dc_offset and measures all the resonators simultaneously, each one being demodulated at its own
+intermediate frequency on the same output and input lines (frequency multiplexing). Each map is streamed to its own
+buffers ("I_<name>" and "Q_<name>"), so that the maps of all the dots of a device are acquired at once.
+
+* add_sensors adds to the configuration the readout elements of the multiplexed resonators, copied from an existing one.
+* MultiplexedChargeStability describes the maps and provides the QUA macros of the scan and of its stream processing.
+
+A gate can take part in several maps (e.g. a plunger gate shared by two double dots), as long as it is swept along
+the same axis with the same voltages.
+"""
+
+import copy
+import numpy as np
+from qm.qua import *
+from qualang_tools.units import unit
+from macros import RF_reflectometry_macro
+
+u = unit(coerce_to_integer=True)
+
+
+def add_sensors(configuration: dict, intermediate_frequencies: dict, template: str = "tank_circuit") -> list:
+    """Add readout elements demodulated at their own intermediate frequency, copied from an existing resonator element
+    so that they share its input and output lines, operations and time of flight.
+
+    :param configuration: The OPX configuration, modified in place.
+    :param intermediate_frequencies: Intermediate frequency in Hz of each readout element, by name. The template element
+        itself can be listed to update its frequency.
+    :param template: Name of the resonator element to copy.
+    :return: the names of the readout elements.
+    """
+    elements = configuration["elements"]
+    for name, intermediate_frequency in intermediate_frequencies.items():
+        if name != template:
+            elements[name] = copy.deepcopy(elements[template])
+        elements[name]["intermediate_frequency"] = intermediate_frequency
+    return list(intermediate_frequencies)
+
+
+class MultiplexedChargeStability:
+    def __init__(
+        self,
+        maps: list,
+        n_avg: int,
+        settle_time: int = 0,
+        wait_time: int = 1000,
+        operation: str = "readout",
+        element_output: str = "out1",
+    ):
+        """Charge stability maps acquired simultaneously.
+
+        :param maps: One dictionary per map with its "name", the gates swept along the fast and slow axes "x_gate" and
+            "y_gate", their voltages in V "x_values" and "y_values", and the readout element "sensor". All the maps
+            must have the same number of points along each axis.
+        :param n_avg: Number of averaging iterations.
+        :param settle_time: Time in ns waited after setting the voltages before measuring.
+        :param wait_time: Time in ns waited after each point so that the data is not streamed faster than the stream
+            processing can process it. It must be increased with the number of sensors.
+        :param operation: Readout operation of the sensors.
+        :param element_output: Output of the sensors used for the demodulation.
+        """
+        self.maps = [dict(m) for m in maps]
+        self.n_avg = n_avg
+        self.settle_time = settle_time
+        self.wait_time = wait_time
+        self.operation = operation
+        self.element_output = element_output
+        self.shape = (len(self.maps[0]["y_values"]), len(self.maps[0]["x_values"]))
+        # Voltages of each gate along each axis
+        self.x_gates, self.y_gates = {}, {}
+        for m in self.maps:
+            if (len(m["y_values"]), len(m["x_values"])) != self.shape:
+                raise ValueError(f"The map {m['name']} must have {self.shape} points like the other maps.")
+            for axis, gates in (("x", self.x_gates), ("y", self.y_gates)):
+                values = np.asarray(m[f"{axis}_values"], dtype=float)
+                gate = m[f"{axis}_gate"]
+                if gate in gates and not np.array_equal(gates[gate], values):
+                    raise ValueError(f"The gate {gate} is swept with different voltages by several maps.")
+                gates[gate] = values
+        if set(self.x_gates) & set(self.y_gates):
+            raise ValueError("A gate cannot be swept along both axes.")
+        sensors = [m["sensor"] for m in self.maps]
+        if len(set(sensors)) != len(sensors):
+            raise ValueError("Each map must be read by its own sensor.")
+        self._streams = None
+
+    @property
+    def names(self) -> list:
+        return [m["name"] for m in self.maps]
+
+    @property
+    def gates(self) -> list:
+        return list(self.x_gates) + list(self.y_gates)
+
+    @property
+    def sensors(self) -> list:
+        return [m["sensor"] for m in self.maps]
+
+    @property
+    def result_names(self) -> list:
+        """Names of the saved results, to be fetched with fetching_tool."""
+        return [f"{q}_{name}" for name in self.names for q in ("I", "Q")] + ["iteration"]
+
+    def scan(self) -> None:
+        """QUA macro performing the averaging loop over the voltage grid and measuring all the sensors at each point."""
+        n = declare(int)  # QUA integer used as an index for the averaging loop
+        i = declare(int)  # QUA integer used as an index along the fast axis
+        j = declare(int)  # QUA integer used as an index along the slow axis
+        n_st = declare_stream()  # Stream for the iteration number (progress bar)
+        # Voltages of each gate, indexed in real-time
+        x_tables = {gate: declare(fixed, value=values.tolist()) for gate, values in self.x_gates.items()}
+        y_tables = {gate: declare(fixed, value=values.tolist()) for gate, values in self.y_gates.items()}
+        I = [declare(fixed) for _ in self.maps]
+        Q = [declare(fixed) for _ in self.maps]
+        I_st = [declare_stream() for _ in self.maps]
+        Q_st = [declare_stream() for _ in self.maps]
+
+        with for_(n, 0, n < self.n_avg, n + 1):
+            with for_(j, 0, j < self.shape[0], j + 1):
+                for gate, table in y_tables.items():
+                    set_dc_offset(gate, "single", table[j])
+                with for_(i, 0, i < self.shape[1], i + 1):
+                    for gate, table in x_tables.items():
+                        set_dc_offset(gate, "single", table[i])
+                    # All the sensors measure at the same time, each one demodulating at its own frequency
+                    align(*self.gates, *self.sensors)
+                    if self.settle_time >= 16:
+                        wait(self.settle_time * u.ns, *self.sensors)
+                    for k, m in enumerate(self.maps):
+                        RF_reflectometry_macro(
+                            self.operation, m["sensor"], self.element_output, I[k], Q[k], I_st[k], Q_st[k]
+                        )
+                    # Wait at each iteration in order to ensure that the data will not be transferred faster than the
+                    # stream processing can process it.
+                    wait(self.wait_time * u.ns, *self.sensors)
+            # Bring the gates back to zero at the end of each map
+            for gate in self.gates:
+                set_dc_offset(gate, "single", 0.0)
+            save(n, n_st)
+        self._streams = (I_st, Q_st, n_st)
+
+    def stream_processing(self) -> None:
+        """QUA macro saving the averaged maps, to be called in the stream_processing section after scan."""
+        if self._streams is None:
+            raise RuntimeError("The scan must be played before declaring its stream processing.")
+        I_st, Q_st, n_st = self._streams
+        for k, name in enumerate(self.names):
+            I_st[k].buffer(self.shape[1]).buffer(self.shape[0]).average().save(f"I_{name}")
+            Q_st[k].buffer(self.shape[1]).buffer(self.shape[0]).average().save(f"Q_{name}")
+        n_st.save("iteration")
+
+    def unpack(self, results: list) -> dict:
+        """Complex demodulated signal I + 1j * Q of each map, by name, from the results fetched with result_names.
+
+        :param results: Results fetched in the order of result_names.
+        :return: dictionary of the maps of shape (len(y_values), len(x_values)).
+        """
+        return {name: results[2 * k] + 1j * results[2 * k + 1] for k, name in enumerate(self.names)}
@@ -4,6 +4,7 @@ from qualang_tools.units import unit
 from set_octave import OctaveUnit, octave_declaration
 from qm.qua._dsl import QuaVariable, QuaExpression
 from qm.qua import declare, assign, play, fixed, Cast, amp, wait, ramp, ramp_to_zero
+from qm.qua import declare_input_stream, advance_input_stream
 from typing import Union
 
 #######################
@@ -62,9 +63,12 @@ class OPX_virtual_gate_sequence:
         self.average_power = [0 for _ in self._elements]
         self._expression = None
         self._expression2 = None
+        # Step operations of each (element, duration), shared by all the steps and scaled in real-time with amp()
+        self._operations = {}
         # Add to the config the step operation (length=16ns & amp=0.25V)
         for el in self._elements:
             self._config["elements"][el]["operations"]["step"] = "step_pulse"
+            self._operations[(el, 16)] = "step"
         self._config["pulses"]["step_pulse"] = {
             "operation": "control",
             "length": 16,
@@ -72,33 +76,44 @@ class OPX_virtual_gate_sequence:
         }
         self._config["waveforms"]["step_wf"] = {"type": "constant", "sample": 0.25}
 
-    def _check_name(self, name, key):
-        if name in key:
-            return self._check_name(name + "%", key)
-        else:
-            return name
-
-    def _add_op_to_config(self, el: str, name: str, amplitude: float, length: int) -> str:
-        """Add an operation to an element when the amplitude is fixed to release the number of real-time operations on
-        the OPX.
+    def _get_step_operation(self, el: str, length: int) -> str:
+        """Get the constant amplitude (0.25V) operation of a given duration, which is added to the configuration only the
+        first time. All the steps of a given element and duration share the same operation, the voltage level being set
+        in real-time with amp(), so that the size of the configuration does not grow with the length of the sequence.
 
-        :param el: the element to which we want to add the operation.
-        :param name: name of the operation.
-        :param amplitude: Amplitude of the pulse in V.
+        :param el: the element to which the operation belongs.
         :param length: Duration of the pulse in ns.
-        :return : The name of the created operation.
+        :return : The name of the operation.
         """
-        op_name = self._check_name(name, self._config["elements"][el]["operations"])
-        pulse_name = self._check_name(f"{el}_{op_name}_pulse", self._config["pulses"])
-        wf_name = self._check_name(f"{el}_{op_name}_wf", self._config["waveforms"])
-        self._config["elements"][el]["operations"][op_name] = pulse_name
-        self._config["pulses"][pulse_name] = {
-            "operation": "control",
-            "length": length,
-            "waveforms": {"single": wf_name},
-        }
-        self._config["waveforms"][wf_name] = {"type": "constant", "sample": amplitude}
-        return op_name
+        key = (el, length)
+        if key not in self._operations:
+            op_name = f"step_{length}ns"
+            pulse_name = f"step_{length}ns_pulse"
+            self._config["pulses"][pulse_name] = {
+                "operation": "control",
+                "length": length,
+                "waveforms": {"single": "step_wf"},
+            }
+            self._config["elements"][el]["operations"][op_name] = pulse_name
+            self._operations[key] = op_name
+        return self._operations[key]
+
+    def _play_step(self, el: str, amplitude, length: int = 16, duration=None) -> None:
+        """Play a voltage step on a sticky element by scaling the shared step operation in real-time.
+        A step with a fixed amplitude of 0V is replaced by a wait command.
+
+        :param el: the element playing the step.
+        :param amplitude: Amplitude of the step in V (python float or QUA fixed), must be within [-0.5, 0.5) V.
+        :param length: Duration of the step operation in ns.
+        :param duration: Duration of the step in clock cycles (4ns) if it is stretched in real-time. Default is None.
+        """
+        if not self.is_QUA(amplitude):
+            if amplitude == 0:
+                wait(length >> 2 if duration is None else duration, el)
+                return
+            if not -0.5 <= amplitude < 0.5:
+                raise ValueError(f"The voltage step on {el} must be within [-0.5, 0.5) V, got {amplitude} V.")
+        play(self._get_step_operation(el, length) * amp(amplitude * 4), el, duration=duration)
 
     @staticmethod
     def _check_duration(duration: int):
@@ -163,7 +178,7 @@ class OPX_virtual_gate_sequence:
                 )
 
         if voltage_point_name is not None and duration is None:
-            _duration = self._voltage_points[voltage_point_name]["duration"]
+            _duration = self._get_point(voltage_point_name)["duration"]
         elif duration is not None:
             _duration = duration
         else:
@@ -173,7 +188,7 @@ class OPX_virtual_gate_sequence:
 
         for i, gate in enumerate(self._elements):
             if voltage_point_name is not None and level is None:
-                voltage_level = self._voltage_points[voltage_point_name]["coordinates"][i]
+                voltage_level = self._get_point(voltage_point_name)["coordinates"][i]
             elif level is not None:
                 voltage_point_name = "unregistered_value"
                 voltage_level = level[i]
@@ -191,35 +206,17 @@ class OPX_virtual_gate_sequence:
                     if self.is_QUA(_duration):
                         play("step" * amp((voltage_level - self.current_level[i]) * 4), gate)
                         wait((_duration - 16) >> 2, gate)
-                    # if constant duration --> new operation and play(*amp(..))
+                    # if constant duration --> step operation of this duration and play(*amp(..))
                     else:
-                        operation = self._add_op_to_config(
-                            gate,
-                            "step",
-                            amplitude=0.25,
-                            length=_duration,
-                        )
-                        play(operation * amp((voltage_level - self.current_level[i]) * 4), gate)
-
-                # Fixed amplitude but dynamic duration --> new operation and play(duration=..)
+                        self._play_step(gate, voltage_level - self.current_level[i], length=_duration)
+
+                # Fixed amplitude but dynamic duration --> 16ns step operation and play(*amp(..), duration=..)
                 elif isinstance(_duration, (QuaVariable, QuaExpression)):
-                    operation = self._add_op_to_config(
-                        gate,
-                        voltage_point_name,
-                        amplitude=voltage_level - self.current_level[i],
-                        length=16,
-                    )
-                    play(operation, gate, duration=_duration >> 2)
-
-                # Fixed amplitude and duration --> new operation and play()
+                    self._play_step(gate, voltage_level - self.current_level[i], duration=_duration >> 2)
+
+                # Fixed amplitude and duration --> step operation of this duration and play(*amp(..))
                 else:
-                    operation = self._add_op_to_config(
-                        gate,
-                        voltage_point_name,
-                        amplitude=voltage_level - self.current_level[i],
-                        length=_duration,
-                    )
-                    play(operation, gate)
+                    self._play_step(gate, voltage_level - self.current_level[i], length=_duration)
 
             # Play a ramp
             else:
@@ -234,26 +231,32 @@ class OPX_virtual_gate_sequence:
 
             self.current_level[i] = voltage_level
 
-    def add_compensation_pulse(self, duration: int) -> None:
+    def add_compensation_pulse(self, duration: int, amplitudes: list = None) -> None:
         """Add a compensation pulse of the specified duration whose amplitude is derived from the previous operations.
 
-        :param duration: Duration of the compensation pulse in clock cycles (4ns). Must be larger than 4 clock cycles.
+        :param duration: Duration of the compensation pulse in ns. Must be a multiple of 4ns and larger than 16ns.
+        :param amplitudes: Level of the compensation pulse for each gate in V, as python floats or QUA variables, for
+            instance derived with compensation.plan_compensation(). If not provided, the amplitudes are derived from the
+            voltage-time integral of the previous operations.
         """
         self._check_duration(duration)
+        if amplitudes is not None and len(amplitudes) != len(self._elements):
+            raise TypeError(
+                "the provided amplitudes must be a list of same length as the number of elements involved in the virtual gate."
+            )
         for i, gate in enumerate(self._elements):
-            if not self.is_QUA(self.average_power[i]):
+            if amplitudes is not None:
+                compensation_amp = amplitudes[i]
+                self._play_step(gate, compensation_amp - self.current_level[i], length=duration)
+            elif not self.is_QUA(self.average_power[i]):
                 compensation_amp = -self.average_power[i] / duration
-                operation = self._add_op_to_config(
-                    gate, "compensation", amplitude=compensation_amp - self.current_level[i], length=duration
-                )
-                play(operation, gate)
+                self._play_step(gate, compensation_amp - self.current_level[i], length=duration)
             else:
-                operation = self._add_op_to_config(gate, "compensation", amplitude=0.25, length=duration)
                 compensation_amp = declare(fixed)
                 eval_average_power = declare(int)
                 assign(eval_average_power, self.average_power[i])
                 assign(compensation_amp, -Cast.mul_fixed_by_int(1 / duration, eval_average_power))
-                play(operation * amp((compensation_amp - self.current_level[i]) * 4), gate)
+                self._play_step(gate, compensation_amp - self.current_level[i], length=duration)
             self.current_level[i] = compensation_amp
 
     def ramp_to_zero(self, duration: int = None):
@@ -282,6 +285,68 @@ class OPX_virtual_gate_sequence:
         self._voltage_points[name]["coordinates"] = coordinates
         self._voltage_points[name]["duration"] = duration
 
+    def _get_point(self, name: str) -> dict:
+        """Get the coordinates and duration of a voltage point, as QUA variables if declared as parameters."""
+        point = self._voltage_points[name]
+        return point.get("parameters", point)
+
+    def declare_parameters(self, points: list = None, durations: bool = False) -> None:
+        """Declare the coordinates (and optionally the durations) of the registered voltage points as QUA input streams,
+        so that a single compiled program can be re-targeted to new voltage points from Python with push_parameters().
+        Must be called at the beginning of the QUA program. The steps played with the voltage_point_name of these points
+        then use the QUA variables, which are loaded with the last pushed values by calling update_parameters().
+
+        :param points: Names of the voltage points to parameterize. Default is None which parameterizes all of them.
+        :param durations: If True, the durations of the voltage points are parameterized too (must then be larger than 32ns).
+        """
+        for name in self._voltage_points if points is None else points:
+            parameters = {
+                "coordinates": [
+                    declare_input_stream(fixed, name=self._stream_name(name, gate)) for gate in self._elements
+                ],
+                "duration": self._voltage_points[name]["duration"],
+            }
+            if durations:
+                parameters["duration"] = declare_input_stream(int, name=self._stream_name(name, "duration"))
+            self._voltage_points[name]["parameters"] = parameters
+
+    def update_parameters(self) -> None:
+        """Load in QUA the values pushed from Python with push_parameters() for all the declared parameters.
+        The program waits at this point until new values have been pushed for every parameter."""
+        for point in self._voltage_points.values():
+            if "parameters" in point:
+                for variable in point["parameters"]["coordinates"]:
+                    advance_input_stream(variable)
+                if self.is_QUA(point["parameters"]["duration"]):
+                    advance_input_stream(point["parameters"]["duration"])
+
+    def push_parameters(self, job, **points) -> None:
+        """Push new values of the declared parameters to a running job, to be loaded with update_parameters().
+        The points which are not provided keep their previous values, which are pushed again.
+
+        Example: seq.push_parameters(job, readout=[0.12, -0.12], initialization=([0.1, -0.1], 2500))
+
+        :param job: The running job.
+        :param points: For each voltage point to update, its new coordinates in V or a tuple (coordinates, duration).
+        """
+        for name, values in points.items():
+            coordinates, duration = values if isinstance(values, tuple) else (values, None)
+            if len(coordinates) != len(self._elements):
+                raise TypeError(f"The coordinates of {name} must be a list of length {len(self._elements)}.")
+            self._voltage_points[name]["coordinates"] = list(coordinates)
+            if duration is not None:
+                self._voltage_points[name]["duration"] = duration
+        for name, point in self._voltage_points.items():
+            if "parameters" in point:
+                for gate, level in zip(self._elements, point["coordinates"]):
+                    job.push_to_input_stream(self._stream_name(name, gate), float(level))
+                if self.is_QUA(point["parameters"]["duration"]):
+                    job.push_to_input_stream(self._stream_name(name, "duration"), int(point["duration"]))
+
+    @staticmethod
+    def _stream_name(point: str, parameter: str) -> str:
+        return f"{point}_{parameter}"
+
 
 ######################
 #       READOUT      #
@@ -0,0 +1,158 @@
+"""
+Sweep of the duration of a pulse with 1ns resolution, without baking one waveform per duration.
+
+The OPX can only stretch pulses in real-time by whole clock cycles (4ns) and from 4 clock cycles (16ns), so that the
+durations with 1ns resolution are usually obtained by baking one waveform per duration, which quickly fills the
+waveform memory and lengthens the compilation. Here a duration t = 4 * c + r ns is split into a number of clock cycles
+c and a remainder r < 4ns:
+    - the first r ns of the pulse, preceded by the samples played before it (e.g. a first pi/2 pulse), are baked once
+      for each of the 4 remainders, the baked pulse ending at the end of the waveform,
+    - the following c clock cycles are played in real-time with play(..., duration=c), or with wait(c) for a free
+      evolution, followed by the baked samples played after the pulse (e.g. a second pi/2 pulse),
+    - the durations shorter than 16ns are completed with 3 baked waveforms of 4, 8 and 12ns instead.
+At most 8 short waveforms are thus added to the configuration whatever the number and range of the durations, and
+the pulse always ends at the same time so that it can be played right before stepping to the readout point (see
+OPX_virtual_gate_sequence).
+"""
+
+import numpy as np
+from qm.qua import *
+from qualang_tools.bakery import baking
+
+
+def _block_length(nb_of_samples: int) -> int:
+    """Shortest waveform length, multiple of 4 and longer than 16ns, holding the given number of samples."""
+    return max(16, -(-nb_of_samples // 4) * 4)
+
+
+class DurationSweep:
+    def __init__(
+        self,
+        configuration: dict,
+        levels: dict,
+        before: dict = None,
+        after: dict = None,
+        name: str = "duration_sweep",
+    ):
+        """Pulse whose duration is swept in real-time with 1ns resolution.
+
+        :param configuration: The OPX configuration, modified in place.
+        :param levels: Amplitude in V of the swept pulse, by element. A level of 0 sweeps a free evolution. For the
+            elements with I and Q inputs, the real and imaginary parts of the level are played on I and Q.
+        :param before: Samples played right before the swept pulse, by element (e.g. a first pi/2 pulse). Default is
+            None for no samples.
+        :param after: Samples played right after the swept pulse, by element (e.g. a second pi/2 pulse). Default is None
+            for no samples.
+        :param name: Name of the constant operation added to the elements for the real-time part of the pulse.
+        """
+        self._config = configuration
+        self.name = name
+        self.elements = list(levels)
+        self.levels = {el: complex(level) for el, level in levels.items()}
+        before = {el: np.asarray((before or {}).get(el, []), dtype=complex) for el in self.elements}
+        after = {el: np.asarray((after or {}).get(el, []), dtype=complex) for el in self.elements}
+        # Baked samples before the swept pulse, with its first 0 to 3ns, ending at the end of the waveform
+        self.head_length = _block_length(max(len(wf) for wf in before.values()) + 3)
+        self._heads = [
+            self._bake({el: np.r_[before[el], [self.levels[el]] * r] for el in self.elements}, self.head_length)
+            for r in range(4)
+        ]
+        # Baked samples after the swept pulse, preceded by 0 to 12ns of the pulse for the durations shorter than 16ns
+        self._tails = [
+            self._bake({el: np.r_[[self.levels[el]] * 4 * c, after[el]] for el in self.elements}) for c in range(4)
+        ]
+        # Constant operation stretched in real-time
+        for el in self.elements:
+            if self.levels[el] == 0:
+                continue
+            pulse = f"{name}_{el}_pulse"
+            if self._has_iq(el):
+                waveforms = {"I": f"{name}_{el}_I_wf", "Q": f"{name}_{el}_Q_wf"}
+                samples = {"I": self.levels[el].real, "Q": self.levels[el].imag}
+            else:
+                waveforms = {"single": f"{name}_{el}_wf"}
+                samples = {"single": self.levels[el].real}
+            for key, wf in waveforms.items():
+                self._config["waveforms"][wf] = {"type": "constant", "sample": samples[key]}
+            self._config["pulses"][pulse] = {"operation": "control", "length": 16, "waveforms": waveforms}
+            self._config["elements"][el]["operations"][name] = pulse
+
+    def _has_iq(self, el: str) -> bool:
+        return any(key in self._config["elements"][el] for key in ["mixInputs", "RF_inputs", "MWInput"])
+
+    def _bake(self, samples: dict, length: int = None):
+        """Bake the samples of each element, left-padded with zeros to the given length if any, and right-padded to
+        the shortest valid waveform length otherwise, in which case nothing is baked if there are no samples."""
+        if length is None:
+            if all(len(wf) == 0 for wf in samples.values()):
+                return None
+            length = _block_length(max(len(wf) for wf in samples.values()))
+            samples = {el: np.r_[wf, np.zeros(length - len(wf))] for el, wf in samples.items()}
+        else:
+            samples = {el: np.r_[np.zeros(length - len(wf)), wf] for el, wf in samples.items()}
+        with baking(self._config, padding_method="none") as b:
+            for el, wf in samples.items():
+                b.add_op(
+                    f"{self.name}_baked",
+                    el,
+                    [wf.real.tolist(), wf.imag.tolist()] if self._has_iq(el) else wf.real.tolist(),
+                )
+                b.play(f"{self.name}_baked", el)
+        return b
+
+    def _run(self, b, amplitudes: dict) -> None:
+        if b is not None:
+            b.run(amp_array=None if amplitudes is None else list(amplitudes.items()))
+
+    def play(
+        self,
+        duration,
+        end_time,
+        amplitudes: dict = None,
+        short_latency: int = 9,
+        long_latency: int = 25,
+    ) -> None:
+        """QUA macro playing the pulse for a duration given in real-time.
+
+        The duration is decomposed into clock cycles and remainder before the pulse, and a switch case selects the
+        baked waveforms. These real-time computations delay the pulse by a few clock cycles, which are subtracted from
+        end_time. The delay is larger for the durations from 16ns, whose waiting time and stretched pulse are computed
+        in real-time, so that each branch has its own correction. The default values are the corrections measured with
+        the previous implementation of the scripts. They must be checked with the simulator, since they depend on the
+        QOP version: the end of the pulse must not move between 15ns and 16ns.
+
+        :param duration: Duration of the swept pulse in ns (QUA int or python int), must be positive.
+        :param end_time: Time in clock cycles (4ns) between the start of the macro and the end of the swept pulse, must
+            be larger than head_length / 4 + duration / 4 + long_latency + 4.
+        :param amplitudes: Amplitude pre-factor of the whole sequence, by element (python or QUA fixed in [-2, 2)),
+            applied in real-time with amp(). Default is None.
+        :param short_latency: Delay in clock cycles of the pulse due to the real-time computations, for the durations
+            shorter than 16ns (baked waveforms only).
+        :param long_latency: Delay in clock cycles of the pulse due to the real-time computations, for the durations
+            from 16ns (baked waveforms and pulse stretched in real-time).
+        """
+        cycles = declare(int)  # Number of clock cycles of the pulse played in real-time
+        index = declare(int)  # Index of the baked waveforms: the duration below 16ns and 16 + remainder above
+        assign(cycles, duration >> 2)  # Right shift by 2 is a quick way to divide by 4
+        # left shift by 2 is a quick way to multiply by 4
+        assign(index, Util.cond(duration < 16, duration, 16 + duration - (cycles << 2)))
+        with switch_(index, unsafe=True):
+            for k in range(20):
+                with case_(k):
+                    if k < 16:
+                        # Short pulse: baked remainder followed by 0 to 12ns of baked pulse
+                        wait(end_time - short_latency - self.head_length // 4 - k // 4, *self.elements)
+                        self._run(self._heads[k % 4], amplitudes)
+                        self._run(self._tails[k // 4], amplitudes)
+                    else:
+                        # Long pulse: baked remainder followed by the pulse stretched in real-time
+                        wait(end_time - long_latency - self.head_length // 4 - cycles, *self.elements)
+                        self._run(self._heads[k % 4], amplitudes)
+                        for el in self.elements:
+                            if self.levels[el] == 0:
+                                wait(cycles, el)
+                            elif amplitudes is not None and el in amplitudes:
+                                play(self.name * amp(amplitudes[el]), el, duration=cycles)
+                            else:
+                                play(self.name, el, duration=cycles)
+                        self._run(self._tails[0], amplitudes)
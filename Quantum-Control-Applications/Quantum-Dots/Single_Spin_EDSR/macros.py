@@ -4,10 +4,10 @@
 
 from qm.qua import *
 import matplotlib.pyplot as plt
-from scipy.signal import butter, lfilter
 from typing import Union
 from numpy.typing import NDArray
 import numpy as np
+from compensation import bias_tee_time_constant, bias_tee_response, bias_tee_error
 
 
 def round_to_fixed(x, number_of_bits=12):
@@ -53,29 +53,42 @@ def DC_current_sensing_macro(
 
 
 def get_filtered_voltage(
-    voltage_list: Union[NDArray, list], step_duration: float, bias_tee_cut_off_frequency: float, plot: bool = False
+    voltage_list: Union[NDArray, list],
+    step_duration: Union[float, NDArray, list],
+    bias_tee_cut_off_frequency: float,
+    plot: bool = False,
+    times: Union[NDArray, list] = None,
 ):
-    """Get the voltage after filtering through the bias-tee
+    """Get the voltage after filtering through the bias-tee.
+
+    The bias-tee response to the piecewise constant voltages is computed in closed form (see compensation.py), in
+    O(number of steps) and only at the requested times, without expanding the voltages to 1 GS/s. Consecutive equal
+    voltages are merged, so that the simulated samples of any OPX_virtual_gate_sequence can be passed directly:
+        get_filtered_voltage(job.get_simulated_samples().con1.analog["1"], 1e-9, bias_tee_cut_off_frequency, True)
 
     :param voltage_list: List of voltages outputted by the OPX in V.
-    :param step_duration: Duration of each step in s.
+    :param step_duration: Duration of each step in s, the same for all the steps or one per step.
     :param bias_tee_cut_off_frequency: Cut-off frequency of the bias-tee in Hz.
     :param plot: Flag to plot the voltage values if set to True.
-    :return: the filtered and unfiltered voltage lists with 1Gs/s sampling rate.
+    :param times: Times in ns at which the voltages are evaluated. Default is None which evaluates them at the start
+        and at the end of each step.
+    :return: the filtered and unfiltered voltages at the evaluated times.
     """
-
-    def high_pass(data, f_cutoff):
-        res = butter(1, f_cutoff, btype="high", analog=False)
-        return lfilter(res[0], res[1], data)
-
-    y = [val for val in voltage_list for _ in range(int(step_duration * 1e9))]
-    y_filtered = high_pass(y, bias_tee_cut_off_frequency * 1e-9)
+    levels = np.asarray(voltage_list, dtype=float)
+    durations = np.broadcast_to(np.asarray(step_duration, dtype=float) * 1e9, levels.shape)
+    # Merge the consecutive steps with the same voltage
+    first = np.flatnonzero(np.concatenate([[True], np.diff(levels) != 0]))
+    durations = np.add.reduceat(durations, first)
+    levels = levels[first]
+    tau = bias_tee_time_constant(bias_tee_cut_off_frequency)
+    response = bias_tee_response(levels, durations, tau, times=times)
+    y, y_filtered = response["levels"], response["filtered"]
     if plot:
         # plt.figure()
-        plt.plot(y, label="before bias-tee")
-        plt.plot(y_filtered, label="after bias-tee")
+        plt.plot(response["times"], y, label="before bias-tee")
+        plt.plot(response["times"], y_filtered, label="after bias-tee")
         plt.xlabel("Time [ns]")
         plt.ylabel("Voltage [V]")
         plt.legend()
-    print(f"Error: {np.mean(np.abs((y-y_filtered)/(max(y)-min(y))))*100:.2f} %")
+    print(f"Error: {bias_tee_error(levels, durations, tau) / np.ptp(levels) * 100:.2f} %")
     return y, y_filtered
@@ -1,5 +1,6 @@
-from time import sleep
 import pyvisa as visa
+from pyvisa.util import to_ieee_block
+import numpy as np
 from typing import Union
 from numpy.typing import NDArray
 
@@ -33,6 +34,8 @@ class QDACII:
 
         self._visa.write_termination = "\n"
         self._visa.read_termination = "\n"
+        # Settings already sent to the instrument, per channel, to skip the unchanged ones
+        self._cache = {}
         print(self._visa.query("*IDN?"))
         print(self._visa.query("syst:err:all?"))
 
@@ -45,10 +48,123 @@ class QDACII:
     def write_binary_values(self, cmd, values):
         self._visa.write_binary_values(cmd, values)
 
+    def write_batch(self, cmds: list, wait: bool = False):
+        """Send several commands in a single message, the commands being separated by ';:'.
+
+        :param cmds: list of SCPI commands. A command can also be a tuple (command, values) to send the values as an
+            IEEE 488.2 binary block of float32, as write_binary_values does.
+        :param wait: if True, '*OPC?' is appended to the message and the function blocks until the instrument has
+            executed all the commands, without waiting for a fixed time.
+        """
+        cmds = list(cmds) + (["*OPC?"] if wait else [])
+        if len(cmds) == 0:
+            return None
+        message = b";:".join(
+            cmd.encode() if isinstance(cmd, str) else cmd[0].encode() + to_ieee_block(cmd[1], "f", False)
+            for cmd in cmds
+        )
+        self._visa.write_raw(message + self._visa.write_termination.encode())
+        if wait:
+            return self._visa.read()
+
+    def cached(self, channel: int, setting: str):
+        """Value of a channel setting last sent with load_voltage_lists, None if unknown."""
+        return self._cache.get(channel, {}).get(setting)
+
+    def update_cache(self, channel: int, **settings):
+        self._cache.setdefault(channel, {}).update(settings)
+
+    def clear_cache(self, channel: int = None):
+        """Forget the settings sent to the instrument, for instance after having configured it by hand.
+
+        :param channel: channel to forget. Default is None which clears all the channels.
+        """
+        if channel is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(channel, None)
+
     def __exit__(self):
         self.close()
 
 
+# Channel settings of the list mode and the corresponding SCPI commands, in the order in which they are set
+_LIST_SETTINGS = {
+    # Set the minimum time spent on each voltage level. Must be between 2µs and the time between two trigger events.
+    "dwell": "dc:list:dwell",
+    # Set the maximum voltage slope in V/s
+    "slew_rate": "dc:volt:slew",
+    # Step through the voltage list on the event of a trigger
+    "trigger_mode": "dc:list:tmode",
+    # Set the external trigger port. Must be in ["ext1", "ext2", "ext3", "ext4"]
+    "trigger_port": "dc:trig:sour",
+}
+_OUTPUT_SETTINGS = {
+    # Make sure that the correct DC mode (LIST) is set, as opposed to FIXed.
+    "mode": "dc:mode",
+    # Set the channel output range
+    "output_range": "rang",
+    # Set the channel output filter
+    "output_filter": "filt",
+}
+
+
+def load_voltage_lists(qdac, channel_settings: list, binary: bool = True):
+    """
+    Configure several QDAC2 channels to play a set of voltages from given lists and step through them according to external triggers given by OPX digital markers.
+    The voltage lists are uploaded as single blocks and sent together with the configuration of all the channels in a
+    single message, the lists and settings that did not change since the last call being skipped. The function returns once the instrument has
+    executed all the commands (*OPC? query) instead of waiting for a fixed time.
+
+    :param qdac: the QDAC2 object.
+    :param channel_settings: list of dictionaries with the arguments of load_voltage_list (except qdac), one per channel.
+    :param binary: upload the voltage lists as binary blocks if True (default) or as comma-separated values otherwise.
+    :return:
+    """
+    uploads, commands, updates = [], [], {}
+    for settings in channel_settings:
+        channel = settings["channel"]
+        voltage_list = np.asarray(settings["voltage_list"], dtype=float)
+        values = dict(
+            dwell=settings["dwell"],
+            slew_rate=settings["slew_rate"],
+            trigger_mode="stepped",
+            trigger_port=settings["trigger_port"],
+            mode="LIST",
+            output_range=settings["output_range"],
+            output_filter=settings["output_filter"],
+        )
+        # Load the list of voltages if it changed
+        if qdac.cached(channel, "voltage_list") != voltage_list.tobytes():
+            uploads.append((f"sour{channel}:dc:list:volt ", voltage_list))
+        # Ensure that the output voltage will start from the beginning of the list.
+        commands.append(f"sour{channel}:dc:init:cont off")
+        commands += [
+            f"sour{channel}:{cmd} {values[key]}"
+            for key, cmd in _LIST_SETTINGS.items()
+            if qdac.cached(channel, key) != values[key]
+        ]
+        # Listen continuously to trigger
+        commands.append(f"sour{channel}:dc:init:cont on")
+        commands += [
+            f"sour{channel}:{cmd} {values[key]}"
+            for key, cmd in _OUTPUT_SETTINGS.items()
+            if qdac.cached(channel, key) != values[key]
+        ]
+        updates[channel] = dict(values, voltage_list=voltage_list.tobytes())
+
+    if not binary:
+        uploads = [cmd + ",".join(f"{v:.9g}" for v in voltage_list) for cmd, voltage_list in uploads]
+    # A single message and a single round trip for all the channels
+    qdac.write_batch(uploads + commands, wait=True)
+    for channel, values in updates.items():
+        qdac.update_cache(channel, **values)
+    for settings in channel_settings:
+        print(
+            f"Set-up QDAC2 channel {settings['channel']} to step voltages from a list of {len(settings['voltage_list'])} items on trigger events from the {settings['trigger_port']} port with a {settings['dwell']} s dwell time."
+        )
+
+
 # load list of voltages to the relevant QDAC2 channel
 def load_voltage_list(
     qdac,
@@ -73,27 +189,17 @@ def load_voltage_list(
     :param voltage_list: list containing the desired voltages to output - the size of the list must not exceed 65536 items.
     :return:
     """
-    # Load the list of voltages
-    qdac.write_binary_values(f"sour{channel}:dc:list:volt ", voltage_list)
-    # Ensure that the output voltage will start from the beginning of the list.
-    qdac.write(f"sour{channel}:dc:init:cont off")
-    # Set the minimum time spent on each voltage level. Must be between 2µs and the time between two trigger events.
-    qdac.write(f"sour{channel}:dc:list:dwell {dwell}")
-    # Set the maximum voltage slope in V/s
-    qdac.write(f"sour{channel}:dc:volt:slew {slew_rate}")
-    # Step through the voltage list on the event of a trigger
-    qdac.write(f"sour{channel}:dc:list:tmode stepped")
-    # Set the external trigger port. Must be in ["ext1", "ext2", "ext3", "ext4"]
-    qdac.write(f"sour{channel}:dc:trig:sour {trigger_port}")
-    # Listen continuously to trigger
-    qdac.write(f"sour{channel}:dc:init:cont on")
-    # Make sure that the correct DC mode (LIST) is set, as opposed to FIXed.
-    qdac.write(f"sour{channel}:dc:mode LIST")
-    # Set the channel output range
-    qdac.write(f"sour{channel}:rang {output_range}")
-    # Set the channel output filter
-    qdac.write(f"sour{channel}:filt {output_filter}")
-    sleep(1)
-    print(
-        f"Set-up QDAC2 channel {channel} to step voltages from a list of {len(voltage_list)} items on trigger events from the {trigger_port} port with a {qdac.query(f'sour{channel}:dc:list:dwell?')} s dwell time."
+    load_voltage_lists(
+        qdac,
+        [
+            dict(
+                channel=channel,
+                dwell=dwell,
+                slew_rate=slew_rate,
+                trigger_port=trigger_port,
+                output_range=output_range,
+                output_filter=output_filter,
+                voltage_list=voltage_list,
+            )
+        ],
     )
@@ -0,0 +1,117 @@
+"""
+        MULTIPLEXED CHARGE STABILITY MAPS with the OPX
+The goal of the script is to acquire the charge stability maps of several dots in a single acquisition.
+Several pairs of gates are swept simultaneously by the OPX and several charge sensors are read at once by RF
+reflectometry, each resonator being demodulated at its own intermediate frequency on the same lines (frequency
+multiplexing). Each map is streamed to its own buffers.
+
+A global average is performed (averaging on the most outer loop) and the data is extracted while the program is running
+to display the full charge stability maps with increasing SNR.
+
+Prerequisites:
+    - Readout calibration of each resonator (resonance frequency for RF reflectometry).
+    - Connect the gates of each map to the OPX (AC line of the bias-tees) and the resonators to the same readout lines.
+
+Before proceeding to the next node:
+    - Identify the different charge occupation regions of each dot.
+"""
+
+from qm.qua import *
+from qm import QuantumMachinesManager
+from qm import SimulationConfig
+from configuration import *
+from qualang_tools.results import progress_counter, fetching_tool
+from qualang_tools.plot import interrupt_on_close
+import matplotlib.pyplot as plt
+from charge_stability import add_sensors, MultiplexedChargeStability
+
+###################
+# The QUA program #
+###################
+n_avg = 100
+n_points_x = 51
+n_points_y = 41
+
+# Readout resonators, demodulated at their own intermediate frequency
+# TODO: set the resonance frequency of each resonator
+add_sensors(config, {"tank_circuit": resonator_IF, "tank_circuit_2": resonator_IF + 50 * u.MHz})
+# Maps acquired simultaneously, one per pair of gates and sensor
+# Because of the bias-tee, it is important that the voltages swept by the OPX are centered around 0.
+maps = [
+    {
+        "name": "P1_P2",
+        "x_gate": "P1",
+        "y_gate": "P2",
+        "x_values": np.linspace(-0.2, 0.2, n_points_x),
+        "y_values": np.linspace(-0.2, 0.2, n_points_y),
+        "sensor": "tank_circuit",
+    },
+    {
+        "name": "sensor_P2",
+        "x_gate": "sensor_gate",
+        "y_gate": "P2",
+        "x_values": np.linspace(-0.1, 0.1, n_points_x),
+        "y_values": np.linspace(-0.2, 0.2, n_points_y),
+        "sensor": "tank_circuit_2",
+    },
+]
+# Two values (I and Q) are streamed per sensor and per point
+charge_stability = MultiplexedChargeStability(maps, n_avg, wait_time=len(maps) * 1_000)
+
+with program() as multiplexed_charge_stability:
+    charge_stability.scan()
+
+    # Stream processing section used to process the data before saving it
+    with stream_processing():
+        charge_stability.stream_processing()
+
+
+#####################################
+#  Open Communication with the QOP  #
+#####################################
+qmm = QuantumMachinesManager(host=qop_ip, port=qop_port, cluster_name=cluster_name, octave=octave_config)
+
+###########################
+# Run or Simulate Program #
+###########################
+simulate = False
+
+if simulate:
+    # Simulates the QUA program for the specified duration
+    simulation_config = SimulationConfig(duration=10_000)  # In clock cycles = 4ns
+    job = qmm.simulate(config, multiplexed_charge_stability, simulation_config)
+    plt.figure()
+    job.get_simulated_samples().con1.plot()
+
+else:
+    # Open the quantum machine
+    qm = qmm.open_qm(config)
+    # Send the QUA program to the OPX, which compiles and executes it
+    job = qm.execute(multiplexed_charge_stability)
+    # Get results from QUA program
+    results = fetching_tool(job, data_list=charge_stability.result_names, mode="live")
+    # Live plotting
+    fig = plt.figure()
+    interrupt_on_close(fig, job)  # Interrupts the job when closing the figure
+    while results.is_processing():
+        # Fetch results
+        *data, iteration = results.fetch_all()
+        # Progress bar
+        progress_counter(iteration, n_avg, start_time=results.get_start_time())
+        # Plot the amplitude and phase of each map, converted into Volts
+        for k, (name, S) in enumerate(charge_stability.unpack(data).items()):
+            S = u.demod2volts(S, reflectometry_readout_length)
+            plt.subplot(2, len(maps), k + 1)
+            plt.cla()
+            plt.title(f"{name}: " + r"$R=\sqrt{I^2 + Q^2}$ [V]")
+            plt.pcolor(maps[k]["x_values"], maps[k]["y_values"], np.abs(S))
+            plt.xlabel(f"{maps[k]['x_gate']} voltage [V]")
+            plt.ylabel(f"{maps[k]['y_gate']} voltage [V]")
+            plt.subplot(2, len(maps), len(maps) + k + 1)
+            plt.cla()
+            plt.title(f"{name}: phase [rad]")
+            plt.pcolor(maps[k]["x_values"], maps[k]["y_values"], np.angle(S))
+            plt.xlabel(f"{maps[k]['x_gate']} voltage [V]")
+            plt.ylabel(f"{maps[k]['y_gate']} voltage [V]")
+        plt.tight_layout()
+        plt.pause(0.1)
@@ -9,8 +9,10 @@ A compensation pulse can be added to the long timescale sequence in order to ens
 the bias-tee. Alternatively one can obtain the same result by changing the offset of the slow line of the bias-tee.
 
 In the current implementation, the qubit pulse is played using the baking tool that allows for playing arbitrarily short
-pulses with 1ns resolution. The drawback is that the pulses must be loaded to the OPX before the program starts (kind of
-like an AWG), which quickly hit the waveform memory limit of the OPX (~65k samples per pulse processor).
+pulses with 1ns resolution. Instead of loading one pulse per duration to the OPX before the program starts (kind of
+like an AWG), which quickly hits the waveform memory limit of the OPX (~65k samples per pulse processor), only the
+remainders of the durations modulo 4ns are baked and the rest of the pulse is stretched in real-time (see
+duration_sweep.py), so that the memory does not depend on the number and range of the durations.
 Also note that the qubit pulses are played at the end of the "idle" level whose duration is fixed.
 
 Prerequisites:
@@ -30,48 +32,25 @@ from configuration import *
 from qualang_tools.results import progress_counter, fetching_tool
 from qualang_tools.plot import interrupt_on_close
 from qualang_tools.loops import from_array
-from qualang_tools.bakery import baking
 import matplotlib.pyplot as plt
 from macros import RF_reflectometry_macro, DC_current_sensing_macro
+from duration_sweep import DurationSweep
 
 
 n_avg = 100
 # Pulse amplitude sweep as the absolute voltage level in V
 pi_levels = np.arange(0.21, 0.3, 0.01)
-# Pulse duration sweep in ns - the last point must a multiple of 4ns
+# Pulse duration sweep in ns
 durations = np.arange(0, 153, 1)
-assert max(durations) % 4 == 0
 
 seq = OPX_virtual_gate_sequence(config, ["P1_sticky", "P2_sticky"])
 seq.add_points("initialization", level_init, duration_init)
 seq.add_points("idle", level_manip, duration_manip)
 seq.add_points("readout", level_readout, duration_readout)
 
-# Bake the Rabi pulses
-pi_list = []
-for t in durations:  # Create the different baked sequences
-    t = int(t)
-    with baking(config, padding_method="left") as b:  # don't use padding to assure error if timing is incorrect
-        if t == 0:
-            wf1 = [0.0] * 16
-            wf2 = [0.0] * 16
-        else:
-            wf1 = [0.25] * t
-            wf2 = [0.25] * t
-
-        # Add the baked operation to the config
-        b.add_op("pi_baked", "P1", wf1)
-        b.add_op("pi_baked", "P2", wf2)
-
-        # Baked sequence
-        b.wait(max(durations) - t, "P1")
-        b.wait(max(durations) - t, "P2")
-        b.play("pi_baked", "P1")  # Play the qubit pulse
-        b.play("pi_baked", "P2")  # Play the qubit pulse
-
-    # Append the baking object in the list to call it from the QUA program
-    pi_list.append(b)
-
+# Exchange pulse swept with 1ns resolution: the remainder of the duration modulo 4ns is baked and the rest is played in
+# real-time, so that the number of baked waveforms does not depend on the sweep
+rabi_pulse = DurationSweep(config, {"P1": 0.25, "P2": 0.25})
 
 with program() as Rabi_prog:
     n = declare(int)  # QUA integer used as an index for the averaging loop
@@ -81,29 +60,25 @@ with program() as Rabi_prog:
     with for_(n, 0, n < n_avg, n + 1):  # The averaging loop
         save(n, n_st)
         with for_(*from_array(Vpi, pi_levels)):  # Loop over the qubit pulse amplitude
-            with for_(t, 0, t < len(durations), t + 1):  # Loop over the qubit pulse duration
+            with for_(*from_array(t, durations)):  # Loop over the qubit pulse duration
                 with strict_timing_():  # Ensure that the sequence will be played without gap
                     # Navigate through the charge stability map
                     seq.add_step(voltage_point_name="initialization")
                     seq.add_step(voltage_point_name="readout")
                     seq.add_compensation_pulse(duration=duration_compensation_pulse)
 
-                    # switch case to select the baked waveform corresponding to the burst duration
-                    with switch_(t, unsafe=True):
-                        for ii in range(len(durations)):
-                            with case_(ii):
-                                # Drive the singlet-triplet qubit using an exchange pulse at the end of the manipulation step
-                                # Need -4 cycles to compensate the gap
-                                wait(int(duration_init - max(durations)) * u.ns - 4, "P1", "P2")
-                                wait(4, "P1", "P2")  # Need 4 additional cycles because of a gap
-                                pi_list[ii].run(
-                                    amp_array=[("P1", (Vpi - level_init[0]) * 4), ("P2", (-Vpi - level_init[1]) * 4)]
-                                )
-
-                    # Measure the dot right after the qubit manipulation
-                    wait(duration_init * u.ns, "tank_circuit", "TIA")
-                    I, Q, I_st, Q_st = RF_reflectometry_macro()
-                    dc_signal, dc_signal_st = DC_current_sensing_macro()
+                # Drive the singlet-triplet qubit using an exchange pulse at the end of the manipulation step
+                # The delay of the real-time computations is compensated in the macro (see duration_sweep.py)
+                rabi_pulse.play(
+                    t,
+                    end_time=duration_init * u.ns,
+                    amplitudes={"P1": (Vpi - level_init[0]) * 4, "P2": (-Vpi - level_init[1]) * 4},
+                )
+
+                # Measure the dot right after the qubit manipulation
+                wait(duration_init * u.ns, "tank_circuit", "TIA")
+                I, Q, I_st, Q_st = RF_reflectometry_macro()
+                dc_signal, dc_signal_st = DC_current_sensing_macro()
 
                 # Ramp the background voltage to zero to avoid propagating floating point errors
                 seq.ramp_to_zero()
@@ -11,7 +11,8 @@ the bias-tee. Alternatively one can obtain the same result by changing the offse
 
 In the current implementation, the qubit pulse is played using both the baking tool, that allows for playing arbitrarily
 short pulses with 1ns resolution, and real-time pulse manipulation of the OPX for playing arbitrarily long pulse without
-any memory issue.
+any memory issue (see duration_sweep.py). Only the remainders of the durations modulo 4ns are baked, so that the
+memory and compilation time do not depend on the number and range of the durations.
 Also note that the qubit pulses are played at the end of the "idle" level whose duration is fixed.
 
 The magnetic field is swept as the most outer loop which start with a pause() statement, that instructs the OPX to wait
@@ -37,9 +38,9 @@ from configuration import *
 from qualang_tools.results import progress_counter, fetching_tool, wait_until_job_is_paused
 from qualang_tools.plot import interrupt_on_close
 from qualang_tools.loops import from_array
-from qualang_tools.bakery import baking
 import matplotlib.pyplot as plt
 from macros import RF_reflectometry_macro, DC_current_sensing_macro
+from duration_sweep import DurationSweep
 
 
 ###################
@@ -58,54 +59,13 @@ seq.add_points("initialization", level_init, duration_init)
 seq.add_points("idle", level_manip, duration_manip)
 seq.add_points("readout", level_readout, duration_readout)
 
-# Bake the Rabi pulses
-pi_list = []
-pi_list_4ns = []
-for t in range(16):  # Create the different baked sequences
-    t = int(t)
-    with baking(config, padding_method="left") as b:  # don't use padding to assure error if timing is incorrect
-        if t == 0:
-            wf1 = [0.0] * 16
-            wf2 = [0.0] * 16
-        else:
-            wf1 = [pi_amps[0] - level_manip[0]] * t
-            wf2 = [pi_amps[1] - level_manip[1]] * t
-
-        # Add the baked operation to the config
-        b.add_op("pi_baked", "P1", wf1)
-        b.add_op("pi_baked", "P2", wf2)
-
-        # Baked sequence
-        b.wait(16 - t, "P1")  # Wait time to take gaps into account and always play right before reading out
-        b.wait(16 - t, "P2")  # Wait time to take gaps into account and always play right before reading out
-        b.play("pi_baked", "P1")  # Play the qubit pulse
-        b.play("pi_baked", "P2")  # Play the qubit pulse
-    if t < 4:
-        with baking(config, padding_method="left") as b4ns:  # don't use padding to assure error if timing is incorrect
-            wf1 = [pi_amps[0] - level_manip[0]] * t
-            wf2 = [pi_amps[1] - level_manip[1]] * t
-
-            # Add the baked operation to the config
-            b4ns.add_op("pi_baked2", "P1", wf1)
-            b4ns.add_op("pi_baked2", "P2", wf2)
-
-            # Baked sequence
-            b4ns.wait(32 - t, "P1")  # Wait time to take gaps into account and always play right before reading out
-            b4ns.wait(32 - t, "P2")  # Wait time to take gaps into account and always play right before reading out
-            b4ns.play("pi_baked2", "P1")  # Play the qubit pulse
-            b4ns.play("pi_baked2", "P2")  # Play the qubit pulse
-
-    # Append the baking object in the list to call it from the QUA program
-    pi_list.append(b)
-    if t < 4:
-        pi_list_4ns.append(b4ns)
-
+# Exchange pulse swept with 1ns resolution: the remainder of the duration modulo 4ns is baked and the rest is played in
+# real-time, so that the number of baked waveforms does not depend on the sweep
+rabi_pulse = DurationSweep(config, {"P1": pi_amps[0] - level_manip[0], "P2": pi_amps[1] - level_manip[1]})
 
 with program() as Rabi_prog:
     n = declare(int)  # QUA integer used as an index for the averaging loop
     t = declare(int)  # QUA variable for the qubit pulse duration
-    t_cycles = declare(int)  # QUA variable for the qubit pulse duration
-    t_left_ns = declare(int)  # QUA variable for the remainder
     i = declare(int)  # QUA variable for the magnetic field sweep
     n_st = declare_stream()  # Stream for the iteration number (progress bar)
     with for_(i, 0, i < len(B_fields) + 1, i + 1):
@@ -118,29 +78,9 @@ with program() as Rabi_prog:
                     seq.add_step(voltage_point_name="readout")
                     seq.add_compensation_pulse(duration=duration_compensation_pulse)
 
-                # Short qubit pulse: baking only
-                with if_(t < 16):
-                    # switch case to select the baked waveform corresponding to the burst duration
-                    with switch_(t, unsafe=True):
-                        for ii in range(16):
-                            with case_(ii):
-                                # Drive the singlet-triplet qubit using an exchange pulse at the end of the manipulation step
-                                wait(duration_init * u.ns - 4 - 9, "P1", "P2")
-                                pi_list[ii].run()
-
-                # Long qubit pulse: baking and play combined
-                with else_():
-                    assign(t_cycles, t >> 2)  # Right shift by 2 is a quick way to divide by 4
-                    assign(t_left_ns, t - (t_cycles << 2))  # left shift by 2 is a quick way to multiply by 4
-                    # switch case to select the baked waveform corresponding to the burst duration
-                    with switch_(t_left_ns, unsafe=True):
-                        for ii in range(4):
-                            with case_(ii):
-                                # Drive the singlet-triplet qubit using an exchange pulse at the end of the manipulation step
-                                wait(duration_init * u.ns - t_cycles - 4 - 29, "P1", "P2")
-                                pi_list_4ns[ii].run()
-                                play("pi", "P1", duration=t_cycles)
-                                play("pi", "P2", duration=t_cycles)
+                # Drive the singlet-triplet qubit using an exchange pulse at the end of the manipulation step
+                # The delay of the real-time computations is compensated in the macro (see duration_sweep.py)
+                rabi_pulse.play(t, end_time=duration_init * u.ns)
 
                 # Measure the dot right after the qubit manipulation
                 wait(duration_init * u.ns, "tank_circuit", "TIA")
@@ -7,6 +7,8 @@ The QUA program is divided into three sections:
     3) measure the state of the qubit using either RF reflectometry or dc current sensing via PSB or Elzerman readout.
 A compensation pulse can be added to the long timescale sequence in order to ensure 0 DC voltage on the fast line of
 the bias-tee. Alternatively one can obtain the same result by changing the offset of the slow line of the bias-tee.
+Here the shortest compensation pulse compatible with the amplitude limits is planned for the whole sweep beforehand,
+and the resulting amplitudes are validated with a simulation of the bias-tee.
 
 In the current implementation, the qubit pulse is played using the real-time pulse manipulation of the OPX, which is fast
 and can be arbitrarily long. However, the minimum pulse length is 16ns and the sweep step must be larger than 4ns.
@@ -29,10 +31,10 @@ from qm import SimulationConfig
 from configuration import *
 from qualang_tools.results import progress_counter, fetching_tool
 from qualang_tools.plot import interrupt_on_close
-from qualang_tools.loops import from_array
 from qualang_tools.addons.variables import assign_variables_to_element
 import matplotlib.pyplot as plt
 from macros import RF_reflectometry_macro, DC_current_sensing_macro
+from compensation import bias_tee_time_constant, plan_compensation, simulate_bias_tee
 
 
 ###################
@@ -49,6 +51,16 @@ seq.add_points("initialization", level_init, duration_init)
 seq.add_points("idle", level_manip, duration_manip)
 seq.add_points("readout", level_readout, readout_len)
 
+# Plan the compensation pulse of the whole sweep: the sequence levels are (nb_of_steps, nb_of_gates) and the step
+# durations (len(durations), nb_of_steps)
+sequence_levels = np.array([level_init, level_manip, level_readout])
+sequence_durations = np.column_stack(
+    [np.full(len(durations), duration_init), np.full(len(durations), pi_length), durations + readout_len]
+)
+tau = bias_tee_time_constant(bias_tee_cut_off_frequency)
+compensation = plan_compensation(sequence_levels, sequence_durations, tau)
+_, residual_charge = simulate_bias_tee(sequence_levels, sequence_durations, tau, compensation)
+
 with program() as T1_prog:
     n = declare(int)  # QUA integer used as an index for the averaging loop
     t = declare(int)  # QUA variable for the qubit pulse duration
@@ -57,6 +69,7 @@ with program() as T1_prog:
     I = declare(fixed)  # QUA variable for the measured 'I' quadrature
     Q = declare(fixed)  # QUA variable for the measured 'Q' quadrature
     dc_signal = declare(fixed)  # QUA variable for the measured dc signal
+    compensation_amps = [declare(fixed) for _ in range(2)]  # QUA variables for the compensation pulse amplitudes
 
     # Ensure that the result variables are assigned to the measurement elements
     assign_variables_to_element("tank_circuit", I, Q)
@@ -64,13 +77,14 @@ with program() as T1_prog:
     # seq.add_step(voltage_point_name="readout", duration=16)
     with for_(n, 0, n < n_avg, n + 1):  # The averaging loop
         save(n, n_st)
-        with for_(*from_array(t, durations)):  # Loop over the qubit pulse duration
+        # Loop over the qubit pulse duration together with the planned compensation amplitudes
+        with for_each_((t, *compensation_amps), (durations, *compensation["amplitudes"].T)):
             with strict_timing_():  # Ensure that the sequence will be played without gap
                 # Navigate through the charge stability map
                 seq.add_step(voltage_point_name="initialization")
                 seq.add_step(voltage_point_name="idle", duration=pi_length)
                 seq.add_step(voltage_point_name="readout", duration=t + readout_len)
-                seq.add_compensation_pulse(duration=duration_compensation_pulse)
+                seq.add_compensation_pulse(duration=compensation["duration"], amplitudes=compensation_amps)
 
                 # Drive the singlet-triplet qubit using an exchange pulse at the end of the manipulation step
                 wait(duration_init * u.ns, "P1", "P2")
@@ -113,6 +127,10 @@ if simulate:
     plt.figure()
     plt.subplot(211)
     job.get_simulated_samples().con1.plot()
+    plt.title(
+        f"Compensation pulse of {compensation['duration']} ns, "
+        f"residual bias-tee charge {np.max(np.abs(residual_charge)) * 1e3:.3f} mV"
+    )
     plt.axhline(level_init[0], color="k", linestyle="--")
     plt.axhline(level_manip[0], color="k", linestyle="--")
     plt.axhline(level_readout[0], color="k", linestyle="--")
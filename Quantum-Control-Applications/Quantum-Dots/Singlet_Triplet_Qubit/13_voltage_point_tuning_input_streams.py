@@ -0,0 +1,135 @@
+"""
+        VOLTAGE POINT TUNING WITH INPUT STREAMS
+The goal of the script is to show how a single compiled QUA program can be re-targeted to new voltage points without
+recompiling it, which removes the compilation time from iterative tuning loops.
+
+The coordinates of the relevant voltage points of the virtual gate sequence are declared as QUA input streams with
+seq.declare_parameters(). For each candidate point chosen in Python, the new coordinates are pushed to the running job
+with seq.push_parameters() and loaded in QUA with seq.update_parameters(), before playing the sequence and measuring the
+averaged signal of the dot.
+Here the readout point is scanned along the detuning axis, but the candidates can be chosen by any optimizer that updates
+the point to measure from the previous results.
+
+A compensation pulse can be added to the long timescale sequence in order to ensure 0 DC voltage on the fast line of
+the bias-tee. Alternatively one can obtain the same result by changing the offset of the slow line of the bias-tee.
+
+Prerequisites:
+    - Readout calibration (resonance frequency for RF reflectometry and sensor operating point for DC current sensing).
+    - Setting the DC offsets of the external DC voltage source.
+    - Connecting the OPX to the fast line of the plunger gates.
+    - Having found the initialization and readout points from the charge stability map and updated the configuration.
+
+Before proceeding to the next node:
+    - Update the readout point in the configuration.
+"""
+
+from qm.qua import *
+from qm import QuantumMachinesManager
+from configuration import *
+from qualang_tools.plot import interrupt_on_close
+from qualang_tools.results import progress_counter
+from qualang_tools.addons.variables import assign_variables_to_element
+import matplotlib.pyplot as plt
+from macros import RF_reflectometry_macro, DC_current_sensing_macro
+
+
+###################
+# The QUA program #
+###################
+
+n_avg = 100
+# Candidate readout points, along the detuning axis [1, -1] around the current readout point
+detunings = np.linspace(-0.02, 0.02, 41)
+candidates = [[level_readout[0] + eps, level_readout[1] - eps] for eps in detunings]
+
+# Add the relevant voltage points describing the "slow" sequence
+seq = OPX_virtual_gate_sequence(config, ["P1_sticky", "P2_sticky"])
+seq.add_points("initialization", level_init, duration_init)
+seq.add_points("readout", level_readout, duration_readout)
+
+with program() as tuning_prog:
+    k = declare(int)  # QUA integer used as an index for the candidate points
+    n = declare(int)  # QUA integer used as an index for the averaging loop
+    I = declare(fixed)  # QUA variable for the measured 'I' quadrature
+    Q = declare(fixed)  # QUA variable for the measured 'Q' quadrature
+    dc_signal = declare(fixed)  # QUA variable for the measured dc signal
+    # The coordinates of the readout point are QUA variables loaded from input streams
+    seq.declare_parameters(["readout"])
+
+    # Ensure that the result variables are assigned to the measurement elements
+    assign_variables_to_element("tank_circuit", I, Q)
+    assign_variables_to_element("TIA", dc_signal)
+
+    with for_(k, 0, k < len(candidates), k + 1):  # Loop over the candidate points pushed from Python
+        # Wait for the next candidate point
+        seq.update_parameters()
+        with for_(n, 0, n < n_avg, n + 1):  # The averaging loop
+            align()
+            # Navigate through the charge stability map
+            seq.add_step(voltage_point_name="initialization")
+            seq.add_step(voltage_point_name="readout")
+            seq.add_compensation_pulse(duration=duration_compensation_pulse)
+            # Measure the dot at the readout point
+            wait(duration_init * u.ns, "tank_circuit", "TIA")
+            I, Q, I_st, Q_st = RF_reflectometry_macro(I=I, Q=Q)
+            dc_signal, dc_signal_st = DC_current_sensing_macro(dc_signal=dc_signal)
+            # Ramp the background voltage to zero to avoid propagating floating point errors
+            seq.ramp_to_zero()
+
+    # Stream processing section used to process the data before saving it.
+    with stream_processing():
+        # Average the data of each candidate point and keep all of them
+        # RF reflectometry
+        I_st.buffer(n_avg).map(FUNCTIONS.average()).save_all("I")
+        Q_st.buffer(n_avg).map(FUNCTIONS.average()).save_all("Q")
+        # DC current sensing
+        dc_signal_st.buffer(n_avg).map(FUNCTIONS.average()).save_all("dc_signal")
+
+#####################################
+#  Open Communication with the QOP  #
+#####################################
+qmm = QuantumMachinesManager(host=qop_ip, port=qop_port, cluster_name=cluster_name, octave=octave_config)
+
+#######################
+# Run the tuning loop #
+#######################
+# Open the quantum machine
+qm = qmm.open_qm(config)
+# Send the QUA program to the OPX, which compiles and executes it only once
+job = qm.execute(tuning_prog)
+handles = {name: job.result_handles.get(name) for name in ["I", "Q", "dc_signal"]}
+# Live plotting
+fig = plt.figure()
+interrupt_on_close(fig, job)  # Interrupts the job when closing the figure
+for k, point in enumerate(candidates):
+    # Re-target the running program to the new readout point
+    seq.push_parameters(job, readout=point)
+    # Wait for the averaged results of this point
+    for handle in handles.values():
+        handle.wait_for_values(k + 1)
+    I, Q, DC_signal = [handles[name].fetch(slice(0, k + 1))["value"] for name in ["I", "Q", "dc_signal"]]
+    # Convert results into Volts
+    S = u.demod2volts(I + 1j * Q, reflectometry_readout_length)
+    R = np.abs(S)  # Amplitude
+    phase = np.angle(S)  # Phase
+    DC_signal = u.demod2volts(DC_signal, readout_len)
+    # Progress bar
+    progress_counter(k, len(candidates))
+    # Plot data
+    plt.subplot(131)
+    plt.cla()
+    plt.plot(detunings[: k + 1], R)
+    plt.xlabel("Readout detuning [V]")
+    plt.ylabel(r"$R=\sqrt{I^2 + Q^2}$ [V]")
+    plt.subplot(132)
+    plt.cla()
+    plt.plot(detunings[: k + 1], phase)
+    plt.xlabel("Readout detuning [V]")
+    plt.ylabel("Phase [rad]")
+    plt.subplot(133)
+    plt.cla()
+    plt.plot(detunings[: k + 1], DC_signal)
+    plt.xlabel("Readout detuning [V]")
+    plt.ylabel("DC signal [V]")
+    plt.tight_layout()
+    plt.pause(0.1)
@@ -0,0 +1,150 @@
+"""
+Adaptive and sparse acquisition of 2D maps (charge stability diagrams, PSB search...).
+
+The transition lines of a charge stability diagram only cover a small fraction of the map, so that most of the points of
+a dense grid are measured where the signal is flat. AdaptiveSampler chooses the points to measure by refining a
+quadtree of the grid:
+    - the corners of coarse cells are measured first,
+    - the cells whose corners differ the most are split in four and the midpoints of their edges and their center are
+      measured next, down to the resolution of the grid,
+    - the cells whose corners differ by less than a threshold are not refined further.
+The full image is reconstructed by bilinear interpolation of the corners of each cell, the smaller cells overwriting
+the larger ones, so that the transition lines are rendered with the resolution at which they have been measured. The
+reconstruction is vectorized over the cells of the same size and takes a time proportional to the number of pixels.
+
+The points are sent to the OPX by batches through input streams, so that a single compiled program measures any
+sequence of points chosen from the previous results (see 06_charge_stability_map_adaptive.py).
+"""
+
+import heapq
+import numpy as np
+
+# States of the grid points
+_UNMEASURED, _QUEUED, _MEASURED = 0, 1, 2
+
+
+class AdaptiveSampler:
+    def __init__(self, x_values, y_values, initial_step: int = 8, threshold: float = 0.05, max_points: int = None):
+        """Choice of the points of a 2D map to measure, refining the regions with large variations of the signal.
+
+        :param x_values: Values of the fast axis (columns of the map), at least 2.
+        :param y_values: Values of the slow axis (rows of the map), at least 2.
+        :param initial_step: Spacing in pixels of the initial coarse grid.
+        :param threshold: Variation of the signal between the corners of a cell, relative to the range of the signal
+            measured so far, below which the cell is not refined.
+        :param max_points: Maximum number of points to measure. Default is None for no limit.
+        """
+        self.x_values = np.asarray(x_values)
+        self.y_values = np.asarray(y_values)
+        self.shape = (len(self.y_values), len(self.x_values))
+        if min(self.shape) < 2:
+            # The cells are interpolated between corners along both axes, so that a single row or column has no cells
+            raise ValueError(f"The map must have at least 2 points along each axis, got {self.shape} (rows, columns).")
+        self.threshold = threshold
+        self.max_points = np.prod(self.shape) if max_points is None else max_points
+        self.state = np.full(self.shape, _UNMEASURED, dtype=np.int8)
+        self.values = np.full(self.shape, np.nan)
+        self._cells = []  # Heap of the cells to refine, by decreasing variation
+        self._completed = []  # Cells whose corners are measured
+        self._nb_of_scheduled = 0  # Number of points sent for measurement and not measured yet
+        # Corners of the cells of the initial coarse grid
+        rows = np.unique(np.r_[np.arange(0, self.shape[0], initial_step), self.shape[0] - 1])
+        cols = np.unique(np.r_[np.arange(0, self.shape[1], initial_step), self.shape[1] - 1])
+        self._queue = [(r, c) for r in rows for c in cols]
+        self.state[np.ix_(rows, cols)] = _QUEUED
+        # Cells waiting for the measurement of their corners
+        self._pending = [(r0, r1, c0, c1) for r0, r1 in zip(rows[:-1], rows[1:]) for c0, c1 in zip(cols[:-1], cols[1:])]
+
+    @property
+    def nb_of_measured(self) -> int:
+        return int(np.count_nonzero(self.state == _MEASURED))
+
+    @property
+    def done(self) -> bool:
+        return len(self._queue) == 0 and len(self._cells) == 0 and self._nb_of_scheduled == 0
+
+    @property
+    def points(self) -> np.ndarray:
+        """Grid indices (row, column) of the measured points."""
+        return np.argwhere(self.state == _MEASURED)
+
+    def next_points(self, nb_of_points: int) -> np.ndarray:
+        """Points to measure next, chosen in the cells with the largest variations.
+
+        :param nb_of_points: Maximum number of points.
+        :return: grid indices (row, column) of the points, array of shape (n, 2), empty when the acquisition is over.
+        """
+        budget = self.max_points - self.nb_of_measured - self._nb_of_scheduled
+        nb_of_points = min(nb_of_points, budget)
+        while len(self._queue) < nb_of_points and self._cells:
+            _, cell = heapq.heappop(self._cells)
+            self._split(cell)
+        batch, self._queue = self._queue[:nb_of_points], self._queue[nb_of_points:]
+        self._nb_of_scheduled += len(batch)
+        return np.array(batch, dtype=int).reshape(-1, 2)
+
+    def voltages(self, points) -> tuple:
+        """Values of the fast and slow axes at the given grid indices."""
+        points = np.asarray(points, dtype=int).reshape(-1, 2)
+        return self.x_values[points[:, 1]], self.y_values[points[:, 0]]
+
+    def update(self, points, values) -> None:
+        """Record the measured values and queue the cells that can now be refined.
+
+        :param points: grid indices (row, column) of the measured points, as returned by next_points.
+        :param values: measured signal at each point (e.g. the amplitude or the phase of the reflectometry signal).
+        """
+        points = np.asarray(points, dtype=int).reshape(-1, 2)
+        self.values[points[:, 0], points[:, 1]] = values
+        self.state[points[:, 0], points[:, 1]] = _MEASURED
+        self._nb_of_scheduled -= len(points)
+        span = np.nanmax(self.values) - np.nanmin(self.values)
+        pending = []
+        for cell in self._pending:
+            r0, r1, c0, c1 = cell
+            corners = ([r0, r0, r1, r1], [c0, c1, c0, c1])
+            if np.any(self.state[corners] != _MEASURED):
+                pending.append(cell)
+                continue
+            self._completed.append(cell)
+            variation = np.ptp(self.values[corners])
+            if variation > self.threshold * span and (r1 - r0 > 1 or c1 - c0 > 1):
+                heapq.heappush(self._cells, (-variation, cell))
+        self._pending = pending
+
+    def _split(self, cell) -> None:
+        r0, r1, c0, c1 = cell
+        rm, cm = (r0 + r1) // 2, (c0 + c1) // 2
+        rows = [r0, rm, r1] if r0 < rm < r1 else [r0, r1]
+        cols = [c0, cm, c1] if c0 < cm < c1 else [c0, c1]
+        for ra, rb in zip(rows[:-1], rows[1:]):
+            for ca, cb in zip(cols[:-1], cols[1:]):
+                self._pending.append((ra, rb, ca, cb))
+        for r in rows:
+            for c in cols:
+                if self.state[r, c] == _UNMEASURED:
+                    self.state[r, c] = _QUEUED
+                    self._queue.append((r, c))
+
+    def reconstruct(self) -> np.ndarray:
+        """Full image interpolated from the measured points, of shape (len(y_values), len(x_values)). The pixels which
+        are not in a cell with measured corners yet are NaN."""
+        image = np.full(self.shape, np.nan)
+        if self._completed:
+            cells = np.array(self._completed)
+            heights, widths = cells[:, 1] - cells[:, 0], cells[:, 3] - cells[:, 2]
+            # From the largest to the smallest cells
+            for h, w in sorted(set(zip(heights, widths)), key=lambda size: -size[0] * size[1]):
+                r0, r1, c0, c1 = cells[(heights == h) & (widths == w)].T
+                ty = (np.arange(h + 1) / h)[None, :, None]
+                tx = (np.arange(w + 1) / w)[None, None, :]
+                v00, v01, v10, v11 = (
+                    self.values[r, c][:, None, None] for r, c in ((r0, c0), (r0, c1), (r1, c0), (r1, c1))
+                )
+                block = (v00 * (1 - tx) + v01 * tx) * (1 - ty) + (v10 * (1 - tx) + v11 * tx) * ty
+                rows = r0[:, None, None] + np.arange(h + 1)[None, :, None]
+                cols = c0[:, None, None] + np.arange(w + 1)[None, None, :]
+                image[rows, cols] = block
+        measured = self.state == _MEASURED
+        image[measured] = self.values[measured]
+        return image
@@ -0,0 +1,221 @@
+"""
+Planning of the compensation pulses played at the end of the voltage sequences to manage the bias-tee charging.
+
+The bias-tee acts on the fast line as a first order high-pass filter with time constant tau = 1 / (2 * pi * f_cut_off):
+the device sees the OPX voltage x(t) minus the voltage v(t) of the bias-tee capacitor, which follows
+    dv/dt = (x - v) / tau.
+For a sequence of steps of level x_k and duration d_k, the capacitor voltage is updated exactly as
+    v <- v * exp(-d_k / tau) + x_k * (1 - exp(-d_k / tau)),
+so the compensation pulse bringing it back to zero at the end of the shot has an amplitude
+    A = -v / (exp(D / tau) - 1)
+for a duration D. The amplitude decreases monotonically with D, so the shortest compensation pulse is set by the gate
+and sweep point requiring the largest amplitude, given the amplitude limits of each gate and the maximum step that can
+be played from the last level of the sequence. All the gates play the compensation pulse simultaneously with the same
+duration, so that the planning is done jointly on all the gates and on whole sweep grids at once.
+
+Ramps can be described as steps at the mean level of the ramp, which is exact as long as the ramp is short compared to
+tau.
+"""
+
+import numpy as np
+from scipy.signal import lfilter
+
+
+def bias_tee_time_constant(cut_off_frequency: float) -> float:
+    """Time constant of the bias-tee high-pass filter.
+
+    :param cut_off_frequency: Cut-off frequency of the bias-tee in Hz.
+    :return: the time constant in ns.
+    """
+    return 1e9 / (2 * np.pi * cut_off_frequency)
+
+
+def _as_sequence(levels, durations):
+    levels = np.asarray(levels, dtype=float)
+    if levels.ndim < 2:
+        raise ValueError("The levels must have the shape (..., nb_of_steps, nb_of_gates).")
+    durations = np.asarray(durations, dtype=float)
+    grid = np.broadcast_shapes(levels.shape[:-1], durations.shape)
+    levels = np.broadcast_to(levels, grid + levels.shape[-1:])
+    return levels, np.broadcast_to(durations, grid)
+
+
+def bias_tee_charge(levels, durations, tau: float, initial=0.0):
+    """Voltage of the bias-tee capacitor at the end of piecewise constant voltage sequences.
+
+    :param levels: Voltage levels played by the OPX in V, array of shape (..., nb_of_steps, nb_of_gates) where the
+        leading dimensions describe the sweep grid.
+    :param durations: Duration of each step in ns, array broadcastable to (..., nb_of_steps).
+    :param tau: Time constant of the bias-tee in ns (see bias_tee_time_constant).
+    :param initial: Voltage of the capacitor at the beginning of the sequence in V.
+    :return: the capacitor voltage in V, array of shape (..., nb_of_gates).
+    """
+    levels, durations = _as_sequence(levels, durations)
+    decay = np.exp(-durations / tau)[..., None]
+    charge = np.broadcast_to(np.asarray(initial, dtype=float), levels.shape[:-2] + levels.shape[-1:]).copy()
+    for k in range(levels.shape[-2]):
+        charge = charge * decay[..., k, :] + levels[..., k, :] * (1 - decay[..., k, :])
+    return charge
+
+
+def plan_compensation(
+    levels,
+    durations,
+    tau: float,
+    max_amplitude=0.5,
+    max_step: float = 0.5,
+    min_duration: int = 16,
+    shared: bool = True,
+):
+    """Shortest compensation pulse bringing the bias-tee capacitor of all the gates back to zero.
+
+    :param levels: Voltage levels played by the OPX in V, array of shape (..., nb_of_steps, nb_of_gates) where the
+        leading dimensions describe the sweep grid.
+    :param durations: Duration of each step in ns, array broadcastable to (..., nb_of_steps).
+    :param tau: Time constant of the bias-tee in ns (see bias_tee_time_constant).
+    :param max_amplitude: Maximum absolute level of the compensation pulse in V, for all the gates or for each of them.
+    :param max_step: Maximum voltage step that can be played from the last level of the sequence in V.
+    :param min_duration: Minimum duration of the compensation pulse in ns.
+    :param shared: If True, a single duration is derived for the whole sweep grid, so that it can be played with a fixed
+        duration in QUA. Otherwise, the duration of each sweep point is returned.
+    :return: dictionary with the compensation "duration" in ns (multiple of 4ns), the compensation "amplitudes" of each
+        gate in V, array of shape (..., nb_of_gates), and the capacitor voltage "charge" before compensation in V.
+    """
+    levels, durations = _as_sequence(levels, durations)
+    charge = bias_tee_charge(levels, durations, tau)
+    last = levels[..., -1, :]
+    max_amplitude = np.broadcast_to(np.asarray(max_amplitude, dtype=float), last.shape[-1:])
+    # The compensation has the opposite sign of the charge and must stay within the amplitude and step limits
+    bound = np.where(charge > 0, np.minimum(max_amplitude, max_step - last), np.minimum(max_amplitude, max_step + last))
+    if np.any(bound <= 0):
+        raise ValueError("The amplitude limits do not allow compensating the sequence from its last level.")
+    required = tau * np.log1p(np.abs(charge) / bound).max(axis=-1)
+    if shared:
+        required = required.max()
+    duration = np.maximum(4 * np.ceil(required / 4), min_duration).astype(int)
+    amplitudes = -charge / np.expm1(np.asarray(duration, dtype=float) / tau)[..., None]
+    return {"duration": duration[()], "amplitudes": amplitudes, "charge": charge}
+
+
+def simulate_bias_tee(levels, durations, tau: float, compensation: dict = None, dt: float = 1.0):
+    """Sample the voltage sequences and filter them with the bias-tee, for all the sweep points and gates at once.
+
+    :param levels: Voltage levels played by the OPX in V, array of shape (..., nb_of_steps, nb_of_gates).
+    :param durations: Duration of each step in ns, array broadcastable to (..., nb_of_steps).
+    :param tau: Time constant of the bias-tee in ns (see bias_tee_time_constant).
+    :param compensation: Compensation pulse returned by plan_compensation, appended to the sequences if provided.
+    :param dt: Sampling period in ns.
+    :return: the voltage seen by the device after the bias-tee in V, array of shape (..., nb_of_gates, nb_of_samples),
+        and the capacitor voltage at the end of each sequence in V, array of shape (..., nb_of_gates). The sequences of
+        the sweep points are zero-padded to the longest one.
+    """
+    levels, durations = _as_sequence(levels, durations)
+    if compensation is not None:
+        comp_durations = np.broadcast_to(compensation["duration"], durations.shape[:-1])
+        levels = np.concatenate([levels, np.asarray(compensation["amplitudes"])[..., None, :]], axis=-2)
+        durations = np.concatenate([durations, comp_durations[..., None]], axis=-1)
+    # Sample index at which each step ends
+    edges = np.rint(np.cumsum(durations, axis=-1) / dt).astype(int)
+    n_samples = int(edges.max())
+    steps = np.sum(np.arange(n_samples) >= edges[..., None], axis=-2)
+    waveforms = np.take_along_axis(
+        np.concatenate([levels, np.zeros_like(levels[..., :1, :])], axis=-2),
+        np.broadcast_to(steps[..., None], steps.shape + levels.shape[-1:]),
+        axis=-2,
+    )
+    waveforms = np.moveaxis(waveforms, -1, -2)
+    # The capacitor voltage is the zero-order-hold low-pass of the waveform
+    decay = np.exp(-dt / tau)
+    charge = lfilter([1 - decay], [1, -decay], waveforms, axis=-1)
+    end = np.broadcast_to((edges[..., -1] - 1)[..., None, None], charge.shape[:-1] + (1,))
+    return waveforms - charge, np.take_along_axis(charge, end, axis=-1)[..., 0]
+
+
+def _step_charges(levels, durations, tau: float, initial=0.0):
+    """Capacitor voltage at the end of each step, levels of shape (nb_of_steps, ...) and durations (nb_of_steps,).
+
+    The recursion v_k = a_k * v_{k-1} + (1 - a_k) * x_k is solved with cumulative sums of exponentials, rescaled by
+    blocks so that they do not overflow."""
+    ends = np.cumsum(durations) / tau
+    charges = np.empty(levels.shape)
+    charge = np.broadcast_to(np.asarray(initial, dtype=float), levels.shape[1:])
+    start = 0
+    while start < len(levels):
+        reference = ends[start - 1] if start > 0 else 0.0
+        stop = max(int(np.searchsorted(ends, reference + 500, side="right")), start + 1)
+        # Exponent relative to the beginning of the block, clipped for a single step longer than 500 tau
+        exponent = np.minimum(ends[start:stop] - reference, 700)
+        growth = np.exp(exponent)
+        weights = np.diff(growth, prepend=1.0).reshape((-1,) + (1,) * (levels.ndim - 1))
+        scale = np.exp(-exponent).reshape(weights.shape)
+        charges[start:stop] = (charge + np.cumsum(levels[start:stop] * weights, axis=0)) * scale
+        charge = charges[stop - 1]
+        start = stop
+    return charges
+
+
+def bias_tee_response(levels, durations, tau: float, times=None, initial=0.0):
+    """Voltage seen by the device behind the bias-tee for a piecewise constant sequence, computed in closed form in
+    O(nb_of_steps) and evaluated only at the requested times instead of sampling the whole sequence.
+
+    Within the step k starting at t_k, the capacitor voltage relaxes exponentially towards the level x_k:
+        v(t) = x_k + (v(t_k) - x_k) * exp(-(t - t_k) / tau).
+
+    :param levels: Voltage levels played by the OPX in V, array of shape (nb_of_steps,) or (nb_of_steps, nb_of_gates).
+    :param durations: Duration of each step in ns, array broadcastable to (nb_of_steps,).
+    :param tau: Time constant of the bias-tee in ns (see bias_tee_time_constant).
+    :param times: Times in ns at which the voltages are evaluated, the times after the end of the sequence being
+        evaluated at its last level. Default is None which evaluates them at the start and at the end of each step.
+    :param initial: Voltage of the capacitor at the beginning of the sequence in V.
+    :return: dictionary with the evaluation "times" in ns, the voltage output by the OPX "levels", the voltage seen by
+        the device "filtered" and the capacitor voltage at the end of each step "charges", in V.
+    """
+    levels = np.asarray(levels, dtype=float)
+    durations = np.broadcast_to(np.asarray(durations, dtype=float), levels.shape[:1])
+    charges = _step_charges(levels, durations, tau, initial)
+    starts = np.concatenate([[0.0], np.cumsum(durations)[:-1]])
+    if times is None:
+        # Start and end of each step, the end being evaluated before the next step
+        steps = np.repeat(np.arange(len(levels)), 2)
+        offsets = np.stack([np.zeros_like(durations), durations], axis=1).ravel()
+        times = starts[steps] + offsets
+    else:
+        times = np.asarray(times, dtype=float)
+        steps = np.clip(np.searchsorted(starts, times, side="right") - 1, 0, len(levels) - 1)
+        offsets = times - starts[steps]
+    start_charges = np.concatenate(
+        [np.broadcast_to(np.asarray(initial, dtype=float), (1,) + levels.shape[1:]), charges]
+    )
+    decay = np.exp(-offsets / tau).reshape((-1,) + (1,) * (levels.ndim - 1))
+    output = levels[steps]
+    charge = output + (start_charges[steps] - output) * decay
+    return {"times": times, "levels": output, "filtered": output - charge, "charges": charges}
+
+
+def bias_tee_error(levels, durations, tau: float, initial=0.0):
+    """Absolute difference between the voltage seen by the device and the voltage output by the OPX, averaged over the
+    whole sequence in closed form.
+
+    :param levels: Voltage levels played by the OPX in V, array of shape (nb_of_steps,) or (nb_of_steps, nb_of_gates).
+    :param durations: Duration of each step in ns, array broadcastable to (nb_of_steps,).
+    :param tau: Time constant of the bias-tee in ns (see bias_tee_time_constant).
+    :param initial: Voltage of the capacitor at the beginning of the sequence in V.
+    :return: the averaged error in V, for each gate.
+    """
+    levels = np.asarray(levels, dtype=float)
+    durations = np.broadcast_to(np.asarray(durations, dtype=float), levels.shape[:1]).reshape(
+        (-1,) + (1,) * (levels.ndim - 1)
+    )
+    charges = _step_charges(levels, durations.ravel(), tau, initial)
+    start = np.concatenate([np.broadcast_to(np.asarray(initial, dtype=float), (1,) + levels.shape[1:]), charges[:-1]])
+
+    def integral(s):
+        # Integral of the capacitor voltage from the beginning of the step
+        return levels * s + (start - levels) * tau * -np.expm1(-s / tau)
+
+    # The capacitor voltage changes sign at most once per step
+    with np.errstate(divide="ignore", invalid="ignore"):
+        crossing = -tau * np.log(-levels / (start - levels))
+    crossing = np.where(np.isfinite(crossing) & (crossing > 0) & (crossing < durations), crossing, durations)
+    area = np.abs(integral(crossing)) + np.abs(integral(durations) - integral(crossing))
+    return area.sum(axis=0) / durations.sum()
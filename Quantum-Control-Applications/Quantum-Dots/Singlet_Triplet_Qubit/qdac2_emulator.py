@@ -0,0 +1,214 @@
+"""
+Local emulator of the QDAC2 SCPI socket interface, to test and benchmark qdac2_driver.py without hardware.
+
+The emulator listens on a TCP port like the instrument (SOCKET resource, '\\n' terminated messages) and implements the
+subset of commands used by the driver:
+    - several commands per message separated by ';' (a leading ':' resets the command path),
+    - voltage lists sent as comma-separated values or as IEEE 488.2 definite length binary blocks of float32,
+    - '*IDN?', '*OPC?', '*RST' and 'syst:err:all?',
+    - any other command stores its argument, which is returned by the corresponding query ('...?').
+A processing time per command and a latency per message can be set to mimic the instrument.
+
+Usage:
+    with QDAC2Emulator(port=5025) as emulator:
+        qdac = QDACII("Ethernet", IP_address="127.0.0.1", port=emulator.port)
+        ...
+Running this file benchmarks the upload of voltage lists through qdac2_driver.py.
+"""
+
+import re
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        # Reply immediately to the queries, as the instrument does
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        buffer = b""
+        while True:
+            data = self.request.recv(1 << 16)
+            if not data:
+                return
+            if hasattr(socket, "TCP_QUICKACK"):
+                # Acknowledge the received data right away so that the client does not hold the end of long messages
+                self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+            buffer += data
+            while True:
+                message, buffer = _split_message(buffer)
+                if message is None:
+                    break
+                reply = self.server.emulator.execute(message)
+                if reply is not None:
+                    self.request.sendall(reply.encode() + b"\n")
+
+
+def _split(buffer: bytes, separator: bytes):
+    """Index of the first separator of the buffer, skipping the binary blocks. None if more data is needed, -1 if
+    there is no separator."""
+    i = 0
+    while True:
+        end = buffer.find(separator, i)
+        block = buffer.find(b"#", i)
+        if block == -1 or (end != -1 and end < block):
+            return end
+        # Definite length block: '#' + number of digits of the length + length + data
+        if len(buffer) < block + 2:
+            return None
+        digits = int(buffer[block + 1 : block + 2])
+        if len(buffer) < block + 2 + digits:
+            return None
+        i = block + 2 + digits + int(buffer[block + 2 : block + 2 + digits])
+        if len(buffer) < i:
+            return None
+
+
+def _split_message(buffer: bytes):
+    """Extract the first '\\n' terminated message, binary blocks possibly containing '\\n' bytes."""
+    end = _split(buffer, b"\n")
+    if end is None or end == -1:
+        return None, buffer
+    return buffer[:end], buffer[end + 1 :]
+
+
+def _split_commands(message: bytes) -> list:
+    commands = []
+    while True:
+        end = _split(message, b";")
+        if end is None or end == -1:
+            return commands + [message]
+        commands.append(message[:end])
+        message = message[end + 1 :]
+
+
+class QDAC2Emulator:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, command_time: float = 0.0, message_latency: float = 0.0):
+        """Emulated QDAC2 served on a local socket.
+
+        :param host: interface to listen on.
+        :param port: TCP port, 0 to pick a free one (see the port attribute).
+        :param command_time: time in seconds taken to process each command.
+        :param message_latency: time in seconds taken to process each message, whatever the number of commands.
+        """
+        self.command_time = command_time
+        self.message_latency = message_latency
+        self.state = {}
+        self.errors = []
+        self.nb_of_messages = 0
+        self.nb_of_commands = 0
+        self._server = socketserver.ThreadingTCPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.emulator = self
+        self.port = self._server.server_address[1]
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def voltage_list(self, channel: int) -> list:
+        """Voltage list loaded in a channel."""
+        return self.state.get(f"sour{channel}:dc:list:volt", [])
+
+    def execute(self, message: bytes):
+        """Execute a message and return the reply of its last query, None if it has no query."""
+        self.nb_of_messages += 1
+        time.sleep(self.message_latency)
+        commands = [c for c in _split_commands(message) if c.strip()]
+        reply = None
+        for command in commands:
+            self.nb_of_commands += 1
+            time.sleep(self.command_time)
+            result = self._execute(command)
+            if result is not None:
+                reply = result
+        return reply
+
+    def _execute(self, command: bytes):
+        header, _, argument = command.strip().partition(b" ")
+        header = _normalize(header.decode())
+        if header == "*idn?":
+            return "QDevil,QDAC-II,EMULATOR,0.0"
+        if header == "*opc?":
+            return "1"
+        if header == "*rst":
+            self.state.clear()
+            return None
+        if header == "syst:err:all?":
+            errors, self.errors = self.errors, []
+            return ", ".join(errors) if errors else '0, "No error"'
+        if header.endswith("?"):
+            value = self.state.get(header[:-1], 0)
+            return ",".join(f"{v:.9g}" for v in value) if isinstance(value, list) else str(value)
+        if re.fullmatch(r"sour\d+:dc:list:volt", header):
+            self.state[header] = _parse_values(argument)
+        else:
+            # Commands without argument (e.g. 'sour1:dc:abor') are recorded with an empty value
+            self.state[header] = argument.decode().strip()
+        return None
+
+
+def _normalize(header: str) -> str:
+    header = header.strip().lstrip(":").lower()
+    # Long and short forms of the keywords used by the driver
+    return re.sub(r"^source", "sour", header)
+
+
+def _parse_values(argument: bytes) -> list:
+    argument = argument.strip()
+    if argument.startswith(b"#"):
+        digits = int(argument[1:2])
+        length = int(argument[2 : 2 + digits])
+        data = argument[2 + digits : 2 + digits + length]
+        return list(struct.unpack(f"<{length // 4}f", data))
+    return [float(v) for v in argument.split(b",") if v.strip()]
+
+
+if __name__ == "__main__":
+    import numpy as np
+    from qdac2_driver import QDACII, load_voltage_lists
+
+    def channel_settings(n_points, offset=0.0):
+        return [
+            dict(
+                channel=channel,
+                dwell=2e-6,
+                slew_rate=2e7,
+                trigger_port=f"ext{channel}",
+                output_range="low",
+                output_filter="med",
+                voltage_list=np.linspace(-1, 1, n_points) + offset,
+            )
+            for channel in (1, 2)
+        ]
+
+    # Mimic the instrument with 1 ms per message and 0.1 ms per command
+    with QDAC2Emulator(command_time=1e-4, message_latency=1e-3) as emulator:
+        qdac = QDACII("Ethernet", IP_address="127.0.0.1", port=emulator.port)
+        for binary in (True, False):
+            for n_points in (100, 10_000, 65_536):
+                qdac.clear_cache()
+                timings = []
+                for offset in (0.0, 0.0, 0.1):
+                    start = time.perf_counter()
+                    load_voltage_lists(qdac, channel_settings(n_points, offset), binary=binary)
+                    timings.append(time.perf_counter() - start)
+                print(
+                    f"{'binary' if binary else 'ascii'} upload of 2 x {n_points} points: first {timings[0] * 1e3:.1f} ms, "
+                    f"unchanged {timings[1] * 1e3:.1f} ms, new voltages {timings[2] * 1e3:.1f} ms"
+                )
+        print(f"{emulator.nb_of_messages} messages, {emulator.nb_of_commands} commands, errors: {emulator.errors}")
@@ -0,0 +1,248 @@
+"""
+Hardware-triggered sweeps of external instruments.
+
+Instead of pausing the QUA program at every point and updating the instrument from Python, the whole list of setpoints
+is preloaded into the instrument, which steps to the next setpoint on every digital trigger sent by the OPX. The QUA
+program runs freely: it only plays the trigger, waits for the instrument to settle and measures, so that the
+Python/OPX round-trip latency is removed from every point.
+
+* TriggeredSweep builds the list of setpoints from the sweep axes, loads it into the instrument and provides the QUA
+  macro stepping to the next point, as well as the reshaping of the acquired data to the sweep grid.
+* QDAC2Sweep drives one or several QDAC2 channels stepping on the same external trigger.
+* MockTriggeredInstrument is a local stand-in for testing without hardware: it can be triggered from Python or from the
+  digital samples of a simulated QUA program and records the setpoints it outputs.
+
+Any other instrument with a triggered list mode can be used by implementing the TriggeredInstrument interface.
+"""
+
+import itertools
+import numpy as np
+from scipy.signal import lfilter
+from qm.qua import align, play, wait
+from qualang_tools.units import unit
+
+u = unit(coerce_to_integer=True)
+
+
+class TriggeredInstrument:
+    """Interface of an instrument stepping through a preloaded list of setpoints on external triggers.
+
+    The first trigger outputs the first setpoint and the list restarts from the beginning once completed, so that the
+    same list can be used for several averaging iterations.
+    """
+
+    max_points = None
+
+    def load(self, points: np.ndarray) -> None:
+        """Preload the setpoints.
+
+        :param points: Setpoints of shape (nb_of_points, nb_of_channels), played in this order.
+        """
+        raise NotImplementedError
+
+    def arm(self) -> None:
+        """Reset the list position so that the next trigger outputs the first setpoint."""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Release the instrument."""
+        pass
+
+
+class QDAC2Sweep(TriggeredInstrument):
+    max_points = 65536
+
+    def __init__(
+        self,
+        qdac,
+        channels: list,
+        trigger_port: str,
+        dwell: float = 2e-6,
+        slew_rate: float = 2e7,
+        output_range: str = "low",
+        output_filter: str = "med",
+    ):
+        """Channels of a QDAC2 stepping through voltage lists on the same external trigger.
+
+        :param qdac: the QDAC2 object (see qdac2_driver.QDACII).
+        :param channels: the QDAC2 channels, one per sweep axis.
+        :param trigger_port: external trigger port to which the OPX digital marker is connected - must be in ["ext1", "ext2", "ext3", "ext4"].
+        :param dwell: dwell time at each voltage level in seconds - must be smaller than the trigger spacing and larger than 2e-6.
+        :param slew_rate: the rate at which the voltage can change in Volt per seconds. Must be within [0.01; 2e7].
+        :param output_range: the channel output range that can be either "low" (+/-2V) or "high" (+/-10V).
+        :param output_filter: the channel output filter that can be either "dc" (10Hz), "med" (10kHz) or "high" (300kHZ).
+        """
+        self.qdac = qdac
+        self.channels = list(channels)
+        self.settings = dict(
+            dwell=dwell,
+            slew_rate=slew_rate,
+            trigger_port=trigger_port,
+            output_range=output_range,
+            output_filter=output_filter,
+        )
+
+    def load(self, points: np.ndarray) -> None:
+        from qdac2_driver import load_voltage_lists
+
+        points = np.atleast_2d(points)
+        if points.shape[1] != len(self.channels):
+            raise ValueError(f"Expected setpoints for {len(self.channels)} channels, got {points.shape[1]}.")
+        load_voltage_lists(
+            self.qdac,
+            [
+                dict(channel=channel, voltage_list=points[:, k], **self.settings)
+                for k, channel in enumerate(self.channels)
+            ],
+        )
+
+    def arm(self) -> None:
+        # Restart the lists from their first voltage on the next trigger
+        self.qdac.write_batch(
+            [cmd for channel in self.channels for cmd in (f"sour{channel}:dc:abor", f"sour{channel}:dc:init:cont on")],
+            wait=True,
+        )
+
+
+class MockTriggeredInstrument(TriggeredInstrument):
+    def __init__(self, nb_of_channels: int = 1, settle_time_constant: float = 0.0, initial=0.0):
+        """Local instrument mock stepping through the preloaded setpoints on triggers.
+
+        :param nb_of_channels: Number of output channels.
+        :param settle_time_constant: Time constant in ns of the first order response of the outputs to a new setpoint.
+        :param initial: Output value of the channels before the first trigger.
+        """
+        self.nb_of_channels = nb_of_channels
+        self.settle_time_constant = settle_time_constant
+        self.initial = np.broadcast_to(np.asarray(initial, dtype=float), (nb_of_channels,)).copy()
+        self.points = np.zeros((0, nb_of_channels))
+        self.nb_of_triggers = 0
+        self.history = []
+
+    def load(self, points: np.ndarray) -> None:
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+        if points.shape[1] != self.nb_of_channels:
+            raise ValueError(f"Expected setpoints for {self.nb_of_channels} channels, got {points.shape[1]}.")
+        self.points = points
+        self.arm()
+
+    def arm(self) -> None:
+        self.nb_of_triggers = 0
+        self.history = []
+
+    @property
+    def setpoint(self) -> np.ndarray:
+        """Current setpoint of the channels."""
+        if self.nb_of_triggers == 0:
+            return self.initial
+        return self.points[(self.nb_of_triggers - 1) % len(self.points)]
+
+    def trigger(self, nb_of_triggers: int = 1) -> np.ndarray:
+        """Step through the list as if receiving triggers.
+
+        :param nb_of_triggers: Number of triggers received.
+        :return: the new setpoint.
+        """
+        for _ in range(nb_of_triggers):
+            self.nb_of_triggers += 1
+            self.history.append(self.setpoint)
+        return self.setpoint
+
+    def replay(self, trigger_samples, dt: float = 1.0) -> np.ndarray:
+        """Respond to a digital trigger trace, for instance the simulated samples of the digital output of the OPX.
+
+        :param trigger_samples: Digital samples of the trigger line, one per dt.
+        :param dt: Sampling period in ns.
+        :return: the output of the channels at each sample, array of shape (nb_of_samples, nb_of_channels).
+        """
+        if len(self.points) == 0:
+            raise RuntimeError("No setpoints loaded.")
+        samples = np.asarray(trigger_samples, dtype=bool)
+        start = self.setpoint
+        # Number of triggers received since the beginning of the list at each sample
+        rising_edges = samples & ~np.concatenate([[False], samples[:-1]])
+        triggers = self.nb_of_triggers + np.cumsum(rising_edges)
+        self.trigger(int(rising_edges.sum()))
+        targets = np.where((triggers > 0)[:, None], self.points[(triggers - 1) % len(self.points)], self.initial)
+        if self.settle_time_constant <= 0:
+            return targets
+        # First order response of the outputs to the stepped setpoints
+        decay = np.exp(-dt / self.settle_time_constant)
+        outputs, _ = lfilter([1 - decay], [1, -decay], targets, axis=0, zi=start[None, :] * decay)
+        return outputs
+
+
+class TriggeredSweep:
+    def __init__(
+        self,
+        instrument: TriggeredInstrument,
+        axes: list,
+        trigger_element: str,
+        settle_time: int,
+        snake: bool = False,
+    ):
+        """Sweep of an external instrument over a grid of setpoints, stepped by digital triggers from the OPX.
+
+        :param instrument: The instrument stepping through the setpoints (see TriggeredInstrument).
+        :param axes: Values of each sweep axis, from the slowest to the fastest one. Each axis is output by one channel
+            of the instrument.
+        :param trigger_element: Element of the configuration whose "trigger" operation sends the digital trigger.
+        :param settle_time: Time in ns waited after each trigger for the instrument to settle.
+        :param snake: If True, the direction of the fastest axis is reversed every other line to avoid large steps.
+        """
+        self.instrument = instrument
+        self.axes = [np.asarray(axis, dtype=float) for axis in axes]
+        self.shape = tuple(len(axis) for axis in self.axes)
+        self.trigger_element = trigger_element
+        self.settle_time = settle_time
+        self.snake = snake
+        if instrument.max_points is not None and self.nb_of_points > instrument.max_points:
+            raise ValueError(
+                f"The sweep has {self.nb_of_points} points, the instrument accepts {instrument.max_points}."
+            )
+
+    @property
+    def nb_of_points(self) -> int:
+        return int(np.prod(self.shape))
+
+    @property
+    def indices(self) -> np.ndarray:
+        """Grid indices of the setpoints in the order in which they are played, array of shape (nb_of_points, nb_of_axes)."""
+        indices = np.array(list(itertools.product(*[range(n) for n in self.shape])), dtype=int).reshape(
+            -1, len(self.shape)
+        )
+        if self.snake and len(self.shape) > 1:
+            reverse = np.ravel_multi_index(indices[:, :-1].T, self.shape[:-1]) % 2 == 1
+            indices[reverse, -1] = self.shape[-1] - 1 - indices[reverse, -1]
+        return indices
+
+    @property
+    def points(self) -> np.ndarray:
+        """Setpoints in the order in which they are played, array of shape (nb_of_points, nb_of_axes)."""
+        return np.stack([axis[index] for axis, index in zip(self.axes, self.indices.T)], axis=1)
+
+    def load(self) -> None:
+        """Preload all the setpoints into the instrument and arm it."""
+        self.instrument.load(self.points)
+        self.instrument.arm()
+
+    def step(self, *elements: str) -> None:
+        """QUA macro sending the trigger to the instrument and waiting for the new setpoint to settle.
+
+        :param elements: Elements that must wait for the instrument to settle (e.g. the readout elements).
+        """
+        play("trigger", self.trigger_element)
+        align(self.trigger_element, *elements)
+        wait(self.settle_time * u.ns, *elements)
+
+    def reshape(self, data) -> np.ndarray:
+        """Reorder data acquired in the played order (last dimension) to the sweep grid.
+
+        :param data: Data whose last dimension follows the played order, possibly truncated for live plotting.
+        :return: the data with the sweep grid as last dimensions, the points not acquired yet being NaN.
+        """
+        data = np.asarray(data)
+        grid = np.full(data.shape[:-1] + (self.nb_of_points,), np.nan, dtype=np.result_type(data, float))
+        played = np.ravel_multi_index(self.indices.T, self.shape)[: data.shape[-1]]
+        grid[..., played] = data
+        return grid.reshape(data.shape[:-1] + self.shape)
@@ -1,59 +1,61 @@
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy import signal
+from scan_simulation import scan_distortion, relative_error
+from scan_orders import optimize_scan_order
 
 
 N = 101  # Number of points in each direction
 measurement_time = 1000  # in ns
 font_position_correction = 0.06
 tau_biasT = 200e3 * 100  # Bias-T time constant; *100 to have it in ns
-
-
-def high_pass(data, tau):
-    res = signal.butter(1, 1 / tau, btype="high", analog=False)
-    return signal.lfilter(res[0], res[1], data)
+# RC time constant of the first order high-pass filter, whose cut-off frequency is 1 / (2 * tau_biasT) in GHz
+tau_RC = tau_biasT / np.pi
+
+
+def compare(name: str, order, label=None):
+    """Plot the scan order and the gate voltages without and with the bias-tee high-pass filtering.
+
+    The filtered voltages are derived pixel by pixel with scan_simulation.py, so that the memory and time only scale
+    with the number of pixels.
+    """
+    plt.figure(name)
+    # Plot 2D map if N < 10
+    if N < 10:
+        plt.subplot(121)
+        plt.imshow(order.T, origin="lower")
+        for i in range(N):
+            for j in range(N):
+                plt.text(
+                    i - font_position_correction,
+                    j - font_position_correction,
+                    order[i, j] if label is None else label[i, j],
+                )
+        plt.axis("off")
+        plt.subplot(122)
+
+    # Derive output voltages without and with high pass filtering
+    values = (np.arange(N) - (N - 1) / 2) / (N - 1)
+    distortion_1, distortion_2 = scan_distortion(order, values, values, measurement_time, tau_RC)
+    visits = np.argsort(order, axis=None)
+    output_1 = np.repeat(values, N)[visits]
+    output_2 = np.tile(values, N)[visits]
+    time = np.arange(N**2) * measurement_time
+    plt.plot(time, output_1 + 1.1, "b", label="V_rg")
+    plt.plot(time, output_2, "r", label="V_lg")
+    plt.plot(time, output_1 + distortion_1["mean"].ravel()[visits] + 1.1, "c--", label="V_rg filtered")
+    plt.plot(time, output_2 + distortion_2["mean"].ravel()[visits], "m--", label="V_lg filtered")
+    plt.xlabel("time (ns)")
+    plt.ylabel("output voltage (V)")
+    plt.legend()
+    plt.show()
+
+    print(f"{name} - averaged error per step: {relative_error(distortion_1, values) * 100:.1f} %")
 
 
 ##################################################
 # Raster scan
 ##################################################
-plt.figure("Raster Scan")
-
-# Plot 2D map if N < 10
-X = np.arange(0, N**2).reshape(N, N)
-if N < 10:
-    plt.subplot(121)
-    plt.imshow(X.T, origin="lower")
-    for i, values in enumerate(X):
-        for j, num in enumerate(values):
-            plt.text(i - font_position_correction, j - font_position_correction, num)
-
-    plt.axis("off")
-
-# Derive output voltages without and with high pass filtering
-output_1 = np.full(shape=(N**2 + 2, measurement_time), fill_value=0.0)
-output_2 = np.full(shape=(N**2 + 2, measurement_time), fill_value=0.0)
-
-for i, values in enumerate(X):
-    for j, num in enumerate(values):
-        output_1[num + 1, :] = np.full(measurement_time, fill_value=(i - (N - 1) / 2) / (N - 1))
-        output_2[num + 1, :] = np.full(measurement_time, fill_value=(j - (N - 1) / 2) / (N - 1))
-if N < 10:
-    plt.subplot(122)
-
-plt.plot(output_1.flatten()[::100] + 1.1, "b", label="V_rg")
-plt.plot(output_2.flatten()[::100], "r", label="V_lg")
-output_1_filter = high_pass(output_1.flatten(), tau_biasT)
-output_2_filter = high_pass(output_2.flatten(), tau_biasT)
-plt.plot(output_1_filter.flatten()[::100] + 1.1, "c--", label="V_rg filtered")
-plt.plot(output_2_filter.flatten()[::100], "m--", label="V_lg filtered")
-
-plt.xlabel("time (ns)")
-plt.ylabel("output voltage (V)")
-plt.legend()
-plt.show()
-
-print(f"Averaged error per step: {np.average(np.abs(output_1.flatten()-output_1_filter)[:])*100:.1f} %")
+compare("Raster Scan", np.arange(0, N**2).reshape(N, N))
 
 
 ##################################################
@@ -88,40 +90,7 @@ def spiral(N: int):
     return order
 
 
-plt.figure("Spiral Scan")
-
-# Plot 2D map if N < 10
-order = spiral(N)
-if N < 10:
-    plt.subplot(121)
-    plt.imshow(order.T, origin="lower")
-    for i, values in enumerate(order):
-        for j, num in enumerate(values):
-            plt.text(i - font_position_correction, j - font_position_correction, num)
-    plt.axis("off")
-
-# Derive output voltages without and with high pass filtering
-output_1 = np.full(shape=(N**2 + 1, measurement_time), fill_value=0.0)
-output_2 = np.full(shape=(N**2 + 1, measurement_time), fill_value=0.0)
-
-for i, values in enumerate(order):
-    for j, num in enumerate(values):
-        output_1[num, :] = np.full(measurement_time, fill_value=(i - (N - 1) / 2) / (N - 1))
-        output_2[num, :] = np.full(measurement_time, fill_value=(j - (N - 1) / 2) / (N - 1))
-
-if N < 10:
-    plt.subplot(122)
-plt.plot(output_1.flatten()[::100] + 1.1, "b", label="V_rg")
-plt.plot(output_2.flatten()[::100], "r", label="V_lg")
-output_1_filter = high_pass(output_1.flatten(), tau_biasT)
-output_2_filter = high_pass(output_2.flatten(), tau_biasT)
-plt.plot(output_1_filter.flatten()[::100] + 1.1, "c--", label="V_rg filtered")
-plt.plot(output_2_filter.flatten()[::100], "m--", label="V_lg filtered")
-plt.xlabel("time (ns)")
-plt.ylabel("output voltage (V)")
-plt.legend()
-plt.show()
-print(f"Averaged error per step: {np.average(np.abs(output_1.flatten()-output_1_filter)[:])*100:.1f} %")
+compare("Spiral Scan", spiral(N))
 
 
 ##################################################
@@ -190,37 +159,15 @@ def diag(N: int):
     return order, label
 
 
-plt.figure("Diagonal Scan")
-
-# Plot 2D map if N < 10
-order, label = diag(N)
-if N < 10:
-    plt.subplot(121)
-    plt.imshow(order.T, origin="lower")
-    for i in range(N):
-        for j in range(N):
-            plt.text(i - font_position_correction, j - font_position_correction, label[i, j])
-    plt.axis("off")
-
-# Derive output voltages without and with high pass filtering
-output_1 = np.full(shape=(N**2 + 1, measurement_time), fill_value=0.0)
-output_2 = np.full(shape=(N**2 + 1, measurement_time), fill_value=0.0)
-
-for i, values in enumerate(order):
-    for j, num in enumerate(values):
-        output_1[num, :] = np.full(measurement_time, fill_value=(i - (N - 1) / 2) / (N - 1))
-        output_2[num, :] = np.full(measurement_time, fill_value=(j - (N - 1) / 2) / (N - 1))
-if N < 10:
-    plt.subplot(122)
-plt.plot(output_1.flatten()[::100] + 1.1, "b", label="V_rg")
-plt.plot(output_2.flatten()[::100], "r", label="V_lg")
-output_1_filter = high_pass(output_1.flatten(), tau_biasT)
-output_2_filter = high_pass(output_2.flatten(), tau_biasT)
-plt.plot(output_1_filter.flatten()[::100] + 1.1, "c--", label="V_rg filtered")
-plt.plot(output_2_filter.flatten()[::100], "m--", label="V_lg filtered")
-plt.xlabel("time (ns)")
-plt.ylabel("output voltage (V)")
-plt.legend()
-plt.show()
-
-print(f"Averaged error per step: {np.average(np.abs(output_1.flatten()-output_1_filter)[:])*100:.1f} %")
+compare("Diagonal Scan", *diag(N))
+
+
+##################################################
+# Optimized scan order
+##################################################
+# Search among the raster, snake, spiral, Hilbert and balanced orderings the one minimizing the bias-tee distortion,
+# large voltage jumps between pixels being slightly penalized
+values = (np.arange(N) - (N - 1) / 2) / (N - 1)
+optimized = optimize_scan_order(values, values, measurement_time, tau_RC, jump_weight=0.01)
+print("Cost of the candidate orderings: " + ", ".join(f"{k}: {v * 100:.2f} %" for k, v in optimized["costs"].items()))
+compare(f"Optimized Scan ({optimized['name']})", optimized["order"])
@@ -0,0 +1,98 @@
+"""
+Assembly of 2D scan images from data acquired in the order in which the pixels are visited (spiral, custom orders...).
+
+The permutation from the visit order to the grid is computed once from the order matrix (see macros.spiral_order).
+ImageAssembler then either:
+    - reorders a whole buffer of averaged data with a single indexed assignment (assemble), or
+    - builds the averaged image incrementally from the raw samples streamed with save_all, only the pixels measured
+      since the last update being touched (add and fetch). The cost of a live refresh then depends on the number of
+      new samples and not on the size of the map.
+
+Usage with the raw samples:
+    with stream_processing():
+        I_stream.save_all("I_samples")
+        Q_stream.save_all("Q_samples")
+    ...
+    assembler = ImageAssembler(order, nb_of_channels=2)
+    while job.result_handles.is_processing():
+        assembler.fetch(job.result_handles.get("I_samples"), job.result_handles.get("Q_samples"))
+        I, Q = assembler.image[..., 0], assembler.image[..., 1]
+"""
+
+import numpy as np
+
+
+class ImageAssembler:
+    def __init__(self, order, nb_of_channels: int = None):
+        """Running average of the images of a 2D scan, built from the samples in visit order.
+
+        :param order: visit index of each pixel, integer array of shape (N, M) (e.g. macros.spiral_order).
+        :param nb_of_channels: number of values acquired per pixel (e.g. 2 for I and Q). Default is None for a single
+            value, the images having the shape (N, M) instead of (N, M, nb_of_channels).
+        """
+        self.order = np.asarray(order)
+        self.shape = self.order.shape
+        self.nb_of_pixels = self.order.size
+        # Flat grid index of the pixels in the order in which they are visited
+        self.visits = np.argsort(self.order, axis=None)
+        channels = () if nb_of_channels is None else (nb_of_channels,)
+        self._sum = np.zeros((self.nb_of_pixels,) + channels)
+        self._count = np.zeros(self.nb_of_pixels, dtype=int)
+        self._image = np.full((self.nb_of_pixels,) + channels, np.nan)
+        self.nb_of_samples = 0
+
+    @property
+    def image(self) -> np.ndarray:
+        """Averaged image, the pixels not measured yet being NaN. This is a view updated in place by add."""
+        return self._image.reshape(self.shape + self._image.shape[1:])
+
+    @property
+    def iteration(self) -> int:
+        """Number of completed scans."""
+        return self.nb_of_samples // self.nb_of_pixels
+
+    def assemble(self, data) -> np.ndarray:
+        """Reorder a buffer of data acquired in visit order to the grid, e.g. the output of buffer(n).average().
+
+        :param data: data whose first dimension follows the visit order, possibly truncated for live plotting.
+        :return: the data with the grid as first dimensions, the pixels not acquired yet being NaN.
+        """
+        data = np.asarray(data)
+        grid = np.full((self.nb_of_pixels,) + data.shape[1:], np.nan, dtype=np.result_type(data, float))
+        grid[self.visits[: len(data)]] = data
+        return grid.reshape(self.shape + data.shape[1:])
+
+    def add(self, samples) -> np.ndarray:
+        """Add the samples acquired after the ones already added and update the corresponding pixels of the image.
+
+        :param samples: samples in visit order, array of shape (nb_of_samples,) or (nb_of_samples, nb_of_channels).
+            The samples can span several scans.
+        :return: flat grid indices of the updated pixels.
+        """
+        samples = np.asarray(samples, dtype=float).reshape((-1,) + self._sum.shape[1:])
+        positions = (self.nb_of_samples + np.arange(len(samples))) % self.nb_of_pixels
+        pixels = self.visits[positions]
+        # add.at accumulates the samples of pixels visited several times in the same chunk
+        np.add.at(self._sum, pixels, samples)
+        np.add.at(self._count, pixels, 1)
+        self._image[pixels] = self._sum[pixels] / self._count[pixels].reshape((-1,) + (1,) * (samples.ndim - 1))
+        self.nb_of_samples += len(samples)
+        return pixels
+
+    def fetch(self, *handles) -> int:
+        """Fetch the new samples of save_all result handles (one per channel) and add them to the image.
+
+        :param handles: result handles of the streams, in the order of the channels.
+        :return: the number of new samples.
+        """
+        count = min(handle.count_so_far() for handle in handles)
+        if count <= self.nb_of_samples:
+            return 0
+        new = slice(self.nb_of_samples, count)
+        channels = []
+        for handle in handles:
+            data = handle.fetch(new)
+            channels.append(data["value"] if data.dtype.names else data)
+        samples = channels[0] if self._sum.ndim == 1 else np.stack(channels, axis=-1)
+        self.add(samples)
+        return count - new.start
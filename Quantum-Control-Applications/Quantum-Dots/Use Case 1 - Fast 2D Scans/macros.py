@@ -49,41 +49,129 @@ def measurement_macro(measured_element, I, I_stream, Q, Q_stream):
     save(Q, Q_stream)
 
 
-def spiral_order(N: int):
+def spiral_order(N: int, M: int = None):
+    """
+    Order in which the pixels of a N x M grid are visited by a spiral starting from the middle of the grid, i.e.
+    order[i, j] is the index at which the pixel (i, j) is visited. The spiral only makes nearest-neighbour steps,
+    whatever the size of the grid. For odd square grids, the spiral is the one played by spiral_scan.py.
+
+    When only N is given, an even N is rounded up to N + 1 as spiral_scan.py only plays square spirals of odd size, so
+    that spiral_order(N) keeps returning the order of the spiral centered on a pixel. Giving both N and M returns the
+    order of a grid of exactly N x M pixels, even or odd.
+
+    The visit index is computed for all the pixels at once: each pixel lies on the ring at distance
+    min(i, j, N - 1 - i, M - 1 - j) from the edge, the rings being walked one after the other.
+
+    :param N: number of pixels along the first axis.
+    :param M: number of pixels along the second axis. Default is None for a square grid of odd size.
+    :return: the order matrix of shape (N, M), or (N + 1, N + 1) for an even N and no M.
+    """
     # casting to int if necessary
-    if not isinstance(N, int):
-        N = int(N)
-    # asserting that N is odd
-    N = N if N % 2 == 1 else N + 1
-
-    # setting i, j to be in the middle of the image
-    i, j = (N - 1) // 2, (N - 1) // 2
-
-    # creating array to hold the ordering
-    order = np.zeros(shape=(N, N), dtype=int)
-
-    sign = +1  # the direction which to move along the respective axis
-    number_of_moves = 1  # the number of moves needed for the current edge
-    total_moves = 0  # the total number of moves completed so far
-
-    # spiralling outwards along x edge then y
-    while total_moves < N**2 - N:
-        for _ in range(number_of_moves):
-            i = i + sign  # move one step in left (sign = -1) or right (sign = +1)
-            total_moves = total_moves + 1
-            order[i, j] = total_moves  # updating the ordering array
-
-        for _ in range(number_of_moves):
-            j = j + sign  # move one step in down (sign = -1) or up (sign = +1)
-            total_moves = total_moves + 1
-            order[i, j] = total_moves
-        sign = sign * -1  # the next moves will be in the opposite direction
-        number_of_moves = number_of_moves + 1  # the next edges will require one more step
-
-    # filling the final x edge, which cannot cleanly be done in the above while loop
-    for _ in range(number_of_moves - 1):
-        i = i + sign  # move one step in left (sign = -1) or right (sign = +1)
-        total_moves = total_moves + 1
-        order[i, j] = total_moves
-
-    return order
+    N = int(N)
+    if M is None:
+        # square spiral centered on a pixel, the size must be odd
+        N = N if N % 2 == 1 else N + 1
+        M = N
+    else:
+        M = int(M)
+    # the spiral is built walking inwards clockwise on the transposed (M, N) grid, then reversed, transposed and flipped
+    # to start from the middle and match the direction of spiral_scan.py
+    i, j = np.meshgrid(np.arange(M), np.arange(N), indexing="ij")
+    ring = np.minimum(np.minimum(i, j), np.minimum(M - 1 - i, N - 1 - j))
+    # size of the ring and position of the pixel relative to its top-left corner
+    height, width = M - 2 * ring, N - 2 * ring
+    p, q = i - ring, j - ring
+    # number of pixels in the outer rings
+    outer = M * N - height * width
+    position = np.select(
+        [p == 0, q == width - 1, p == height - 1, q == 0],
+        [q, (width - 1) + p, 2 * (width - 1) + (height - 1) - q, 2 * (width - 1) + 2 * (height - 1) - p],
+    )
+    order = N * M - 1 - (outer + position)
+    return np.ascontiguousarray(order.T[::-1])
+
+
+def step_tables(order, x_values, y_values, jump_amplitude: float, nb_of_pixels: int = None):
+    """
+    Precompute the voltage steps played by pattern_scan_macro to visit the pixels of a 2D scan in a given order.
+
+    :param order: visit index of each pixel, integer array of shape (len(x_values), len(y_values)) (e.g. spiral_order).
+    :param x_values: voltages of the gate swept along the first axis in V.
+    :param y_values: voltages of the gate swept along the second axis in V.
+    :param jump_amplitude: amplitude in V of the "jump" waveform played by the gates.
+    :param nb_of_pixels: length of the tables, which are padded with zeros if larger than the number of pixels so that
+        grids of different sizes can be loaded in the same QUA arrays. Default is None for the number of pixels.
+    :return: dictionary with the amplitude scaling factors "dx" and "dy" of the "jump" pulse to play before each pixel,
+        starting from 0 V, and the number of pixels "n".
+    """
+    order = np.asarray(order)
+    nb_of_pixels = order.size if nb_of_pixels is None else nb_of_pixels
+    if nb_of_pixels < order.size:
+        raise ValueError(f"The tables must contain at least {order.size} pixels, got {nb_of_pixels}.")
+    i, j = np.unravel_index(np.argsort(order, axis=None), order.shape)
+    tables = {"n": order.size}
+    for name, values, index in (("dx", x_values, i), ("dy", y_values, j)):
+        steps = np.diff(np.asarray(values, dtype=float)[index], prepend=0.0) / jump_amplitude
+        if np.any(np.abs(steps) >= 2):
+            raise ValueError(f"The largest step of {name} exceeds twice the amplitude of the jump waveform.")
+        tables[name] = np.pad(steps, (0, nb_of_pixels - order.size))
+    return tables
+
+
+def pattern_scan_macro(
+    x_element,
+    y_element,
+    measured_element,
+    dx,
+    dy,
+    n_pixels,
+    k,
+    I,
+    I_stream,
+    Q,
+    Q_stream,
+    wait_time=0,
+    ramp_to_zero_duration=100,
+    inserted_sequence=False,
+    wait_before_meas=0,
+):
+    """
+    QUA macro scanning the pixels of a 2D scan in the order given by precomputed step tables (see step_tables).
+
+    Each pixel is reached by playing the "jump" pulse on both gates scaled by the corresponding steps, so that the
+    real-time overhead is the same for all the pixels and the same program can scan any pattern and grid size fitting
+    in the tables. The gates are ramped back to zero at the end of the scan to remove the accumulated rounding errors.
+
+    :param x_element: element of the gate swept along the first axis.
+    :param y_element: element of the gate swept along the second axis.
+    :param measured_element: readout element.
+    :param dx: QUA fixed array of the steps of the x gate.
+    :param dy: QUA fixed array of the steps of the y gate.
+    :param n_pixels: number of pixels to scan, python or QUA int.
+    :param k: QUA int used as pixel index.
+    :param wait_time: time in clock cycles (4ns) to wait after each step before measuring.
+    :param ramp_to_zero_duration: duration in clock cycles (4ns) of the ramps to zero at the end of the scan.
+    :param inserted_sequence: True to use the measurement_macro_with_pulses macro with interleaved pulses.
+    :param wait_before_meas: waiting time before measuring after applying the interleaved pulses.
+    """
+    with for_(k, 0, k < n_pixels, k + 1):
+        # moving to the next pixel
+        play("jump" * amp(dx[k]), x_element)
+        play("jump" * amp(dy[k]), y_element)
+
+        # Make sure that we measure after the pulse has settled
+        align(x_element, y_element, measured_element)
+        if wait_time >= 4:  # if logic to enable wait_time = 0 without error
+            wait(wait_time, measured_element)
+
+        if inserted_sequence:
+            measurement_macro_with_pulses(
+                x_element, y_element, measured_element, wait_before_meas, I, I_stream, Q, Q_stream
+            )
+        else:
+            measurement_macro(measured_element, I, I_stream, Q, Q_stream)
+
+    # aligning and ramping to zero to return to initial state
+    align(x_element, y_element, measured_element)
+    ramp_to_zero(x_element, duration=ramp_to_zero_duration)
+    ramp_to_zero(y_element, duration=ramp_to_zero_duration)
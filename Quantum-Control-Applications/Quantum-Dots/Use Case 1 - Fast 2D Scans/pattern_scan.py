@@ -0,0 +1,174 @@
+"""
+2D scan following any precomputed pattern (spiral of any size, optimized ordering...) with step tables.
+
+The order in which the pixels are visited is computed in python and converted into tables of voltage steps, which are
+loaded in QUA arrays. The QUA program only plays the steps one after the other, so that the real-time overhead is the
+same for every pixel and the program is identical for all the patterns and grid sizes: only the content of the tables
+and the number of pixels change.
+"""
+
+from qm.qua import *
+from macros import spiral_order, step_tables, pattern_scan_macro
+from scan_orders import optimize_scan_order
+from image_assembly import ImageAssembler
+import numpy as np
+import time
+from qm import QuantumMachinesManager
+from qm.simulate import SimulationConfig, LoopbackInterface
+from configuration import config, qop_ip
+import matplotlib.pyplot as plt
+from qualang_tools.results import fetching_tool, progress_counter
+from qualang_tools.plot import interrupt_on_close
+
+##############################
+# Program-specific variables #
+##############################
+inserted_sequence = False  # True will use the measurement_macro_with_pulses macro with interleaved pulses
+wait_after_pulse = 1000  # waiting time (ns) before measuring after applying the pulses
+
+n_avg = 100  # Number of averaging loops
+# Stream the raw I/Q samples so that the live plot only updates the pixels measured since the last refresh (see
+# image_assembly.py). The raw samples take 16 bytes per pixel and per scan (n_avg * number of pixels samples of I and Q)
+# on the server and on the computer, so that the live plot uses the averaged buffers by default.
+stream_raw_samples = False
+
+# Relevant elements
+measured_element = "RF"
+x_element = "LB"
+y_element = "RB"
+
+# 2D scan parameters
+jump_amplitude = config["waveforms"]["jump"].get("sample")
+x_amp = 0.1  # The scan is defined as +/- x_amp/2
+y_amp = 0.06  # The scan is defined as +/- y_amp/2
+x_resolution = 12  # Number of points along x, any size is possible
+y_resolution = 8  # Number of points along y, any size is possible
+x_axis = np.linspace(-x_amp / 2, x_amp / 2, x_resolution) * jump_amplitude
+y_axis = np.linspace(-y_amp / 2, y_amp / 2, y_resolution) * jump_amplitude
+
+# Scan pattern: "spiral" or "optimized" to use the ordering minimizing the bias-tee distortion (see scan_orders.py)
+pattern = "spiral"
+measurement_time = config["pulses"]["measure"]["length"]  # time spent on each pixel in ns, used by the optimization
+tau_bias_tee = 2_000_000  # time constant of the bias-tee in ns, used by the optimization
+if pattern == "optimized":
+    order = optimize_scan_order(x_axis, y_axis, measurement_time, tau_bias_tee, jump_weight=0.01)["order"]
+else:
+    order = spiral_order(x_resolution, y_resolution)
+# Step tables played by the QUA program
+tables = step_tables(order, x_axis, y_axis, jump_amplitude)
+n_pixels = tables["n"]
+
+# Perturbation parameters
+ramp_to_zero_duration = 100
+wait_time = 16 // 4
+
+###################
+# The QUA program #
+###################
+with program() as pattern_scan:
+    k = declare(int)  # an index variable for the pixels
+    average = declare(int)  # an index variable for the average
+    # tables of the voltage steps, in units of the jump waveform
+    dx = declare(fixed, value=tables["dx"].tolist())
+    dy = declare(fixed, value=tables["dy"].tolist())
+    n_st = declare_stream()
+
+    # declaring the measured variables and their streams
+    I, Q = declare(fixed), declare(fixed)
+    I_stream, Q_stream = declare_stream(), declare_stream()
+
+    with for_(average, 0, average < n_avg, average + 1):
+        pattern_scan_macro(
+            x_element=x_element,
+            y_element=y_element,
+            measured_element=measured_element,
+            dx=dx,
+            dy=dy,
+            n_pixels=n_pixels,
+            k=k,
+            I=I,
+            I_stream=I_stream,
+            Q=Q,
+            Q_stream=Q_stream,
+            wait_time=wait_time,
+            ramp_to_zero_duration=ramp_to_zero_duration,
+            inserted_sequence=inserted_sequence,
+            wait_before_meas=wait_after_pulse,
+        )
+        save(average, n_st)
+
+    with stream_processing():
+        for stream_name, stream in zip(["I", "Q"], [I_stream, Q_stream]):
+            stream.buffer(n_pixels).average().save(stream_name)
+            if stream_raw_samples:
+                # raw samples in visit order for the live image assembly, growing as n_avg * number of pixels
+                stream.save_all(stream_name + "_samples")
+        n_st.save("iteration")
+
+
+#####################################
+#  Open Communication with the QOP  #
+#####################################
+qmm = QuantumMachinesManager(qop_ip)
+
+simulation = True
+
+if simulation is True:
+    simulation_duration = 100000  # ns
+
+    job = qmm.simulate(
+        config=config,
+        program=pattern_scan,
+        simulate=SimulationConfig(
+            duration=int(simulation_duration // 4),
+            include_analog_waveforms=True,
+            simulation_interface=LoopbackInterface(
+                latency=280,
+                connections=[
+                    ("con1", 1, "con1", 1),
+                    ("con1", 2, "con1", 1),
+                ],
+            ),
+        ),
+    )
+    # plotting the waveforms outputted by the OPX: the x and y gates step through the pattern
+    plt.figure("simulated output samples")
+    output_samples = job.get_simulated_samples()
+    output_samples.con1.plot()
+    plt.show()
+
+else:
+    # Open a quantum machine
+    qm = qmm.open_qm(config)
+    # Execute the QUA program
+    job = qm.execute(pattern_scan)
+    # assemble the images from the data acquired in visit order
+    assembler = ImageAssembler(order, nb_of_channels=2)
+    if stream_raw_samples:
+        handles = [job.result_handles.get("I_samples"), job.result_handles.get("Q_samples")]
+    else:
+        results = fetching_tool(job, ["I", "Q", "iteration"], mode="live")
+    start_time = time.time()
+    # Live plot
+    fig = plt.figure()
+    interrupt_on_close(fig, job)
+
+    while job.result_handles.is_processing():
+        if stream_raw_samples:
+            # Fetch the new samples, only the pixels measured since the last refresh being updated
+            assembler.fetch(*handles)
+            iteration = assembler.iteration
+            I, Q = assembler.image[..., 0], assembler.image[..., 1]
+        else:
+            # Fetch the averaged buffers and reorder them from the visit order to the grid
+            I, Q, iteration = results.fetch_all()
+            I, Q = assembler.assemble(I), assembler.assemble(Q)
+        # Progress bar
+        progress_counter(iteration, n_avg, start_time=start_time)
+        # Plot results
+        plt.cla()
+        plt.pcolor(x_axis, y_axis, np.sqrt(I**2 + Q**2).T)
+        plt.title(f"Stability diagram with {pattern} scan")
+        plt.xlabel(x_element + "_scan [V]")
+        plt.ylabel(y_element + "_scan [V]")
+        plt.pause(0.1)
@@ -0,0 +1,185 @@
+"""
+Pixel orderings of 2D scans and search of the ordering minimizing the bias-tee distortion.
+
+An ordering is described by an order matrix: order[i, j] is the index at which the pixel (i, j) is visited, as returned
+by macros.spiral_order. The candidates are:
+    - "raster" and "snake": line by line, in the same or in alternating directions,
+    - "spiral": the spiral of macros.spiral_order and its transposed and reversed variants,
+    - "hilbert": Hilbert curve covering the grid, which only makes nearest-neighbour steps on power of two grids,
+    - "balanced": snake path on half of the grid interleaved with the point-symmetric pixels, so that the voltage
+      averaged over two consecutive pixels stays at the center of the scan,
+and the best candidate can be refined by a local search reversing segments of the path.
+
+The cost of an ordering is the mean absolute bias-tee distortion of both gates relative to their voltage span, as
+computed by scan_simulation.py, to which the mean voltage jump between pixels can be added to favour short steps.
+The selected ordering is exported as arrays of pixel indices and voltage steps that can be loaded in QUA arrays.
+"""
+
+import numpy as np
+from scan_simulation import scan_distortion
+from macros import spiral_order
+
+
+def raster_order(n: int, m: int) -> np.ndarray:
+    """Line by line ordering, the second axis being the fast one."""
+    return np.arange(n * m).reshape(n, m)
+
+
+def snake_order(n: int, m: int) -> np.ndarray:
+    """Line by line ordering, the direction of the fast axis alternating between lines."""
+    order = np.arange(n * m).reshape(n, m)
+    order[1::2] = order[1::2, ::-1]
+    return order
+
+
+def hilbert_order(n: int, m: int) -> np.ndarray:
+    """Ordering following the Hilbert curve of the smallest power of two grid covering the (n, m) grid."""
+    size = 1 << int(np.ceil(np.log2(max(n, m, 2))))
+    d = np.arange(size * size)
+    x = np.zeros_like(d)
+    y = np.zeros_like(d)
+    t = d.copy()
+    s = 1
+    # Standard conversion from the curve index to the coordinates, vectorized over all the indices
+    while s < size:
+        rx = 1 & (t // 2)
+        ry = 1 & (t ^ rx)
+        flip = (ry == 0) & (rx == 1)
+        x = np.where(flip, s - 1 - x, x)
+        y = np.where(flip, s - 1 - y, y)
+        swap = ry == 0
+        x, y = np.where(swap, y, x), np.where(swap, x, y)
+        x += s * rx
+        y += s * ry
+        t //= 4
+        s *= 2
+    inside = (x < n) & (y < m)
+    order = np.empty((n, m), dtype=int)
+    order[x[inside], y[inside]] = np.arange(n * m)
+    return order
+
+
+def balanced_order(n: int, m: int) -> np.ndarray:
+    """Snake path on the first half of the grid interleaved with the point-symmetric pixels."""
+    path = np.argsort(snake_order(n, m), axis=None)
+    half = path[path < (n * m) // 2]
+    mirror = n * m - 1 - half
+    sequence = np.empty(2 * len(half), dtype=int)
+    sequence[0::2], sequence[1::2] = half, mirror
+    if (n * m) % 2 == 1:
+        # The center pixel comes first
+        sequence = np.concatenate([[(n * m) // 2], sequence])
+    return path_to_order(sequence, (n, m))
+
+
+def path_to_order(path, shape) -> np.ndarray:
+    """Order matrix from the sequence of flat pixel indices."""
+    order = np.empty(int(np.prod(shape)), dtype=int)
+    order[np.asarray(path)] = np.arange(order.size)
+    return order.reshape(shape)
+
+
+def candidate_orders(n: int, m: int) -> dict:
+    """Candidate orderings of a (n, m) grid, by name."""
+    candidates = {
+        "raster": raster_order(n, m),
+        "snake": snake_order(n, m),
+        "hilbert": hilbert_order(n, m),
+        "balanced": balanced_order(n, m),
+    }
+    spiral = spiral_order(n, m)
+    candidates["spiral"] = spiral
+    candidates["spiral_transposed"] = spiral_order(m, n).T.copy()
+    candidates["spiral_inward"] = n * m - 1 - spiral
+    return candidates
+
+
+def order_cost(order, x_values, y_values, dwell: float, tau: float, jump_weight: float = 0.0) -> float:
+    """Mean absolute bias-tee distortion of both gates relative to their voltage span, plus the weighted mean jump.
+
+    :param order: order matrix of shape (len(x_values), len(y_values)).
+    :param x_values: voltages of the gate swept along the first axis.
+    :param y_values: voltages of the gate swept along the second axis.
+    :param dwell: time spent on each pixel in ns.
+    :param tau: time constant of the bias-tee in ns.
+    :param jump_weight: weight of the mean voltage jump between consecutive pixels, relative to the voltage span.
+    :return: the cost of the ordering.
+    """
+    x_span, y_span = np.ptp(x_values), np.ptp(y_values)
+    distortion_x, distortion_y = scan_distortion(order, x_values, y_values, dwell, tau)
+    cost = np.mean(np.abs(distortion_x["mean"])) / x_span + np.mean(np.abs(distortion_y["mean"])) / y_span
+    if jump_weight > 0:
+        i, j = np.unravel_index(np.argsort(order, axis=None), order.shape)
+        jumps = np.abs(np.diff(np.asarray(x_values)[i])) / x_span + np.abs(np.diff(np.asarray(y_values)[j])) / y_span
+        cost += jump_weight * np.mean(jumps)
+    return cost / 2
+
+
+def optimize_scan_order(
+    x_values,
+    y_values,
+    dwell: float,
+    tau: float,
+    jump_weight: float = 0.0,
+    nb_of_iterations: int = 0,
+    seed: int = None,
+):
+    """Search for the pixel ordering minimizing the bias-tee distortion of a 2D scan.
+
+    All the candidate orderings are evaluated and the best one is refined by a local search that reverses random
+    segments of the path, a reversal being kept only if it lowers the cost.
+
+    :param x_values: voltages of the gate swept along the first axis.
+    :param y_values: voltages of the gate swept along the second axis.
+    :param dwell: time spent on each pixel in ns.
+    :param tau: time constant of the bias-tee in ns.
+    :param jump_weight: weight of the mean voltage jump between consecutive pixels (see order_cost).
+    :param nb_of_iterations: number of segment reversals tried by the local search. Default is 0 (no local search).
+    :param seed: seed of the random number generator used by the local search.
+    :return: dictionary with the best "order" matrix, its "name", its "cost" and the "costs" of all the candidates.
+    """
+    shape = (len(x_values), len(y_values))
+
+    def cost(order):
+        return order_cost(order, x_values, y_values, dwell, tau, jump_weight)
+
+    candidates = candidate_orders(*shape)
+    costs = {name: cost(order) for name, order in candidates.items()}
+    name = min(costs, key=costs.get)
+    order = candidates[name]
+    best = costs[name]
+    if nb_of_iterations > 0:
+        rng = np.random.default_rng(seed)
+        path = np.argsort(order, axis=None)
+        improved = False
+        for _ in range(nb_of_iterations):
+            start, stop = np.sort(rng.choice(len(path) + 1, size=2, replace=False))
+            trial = path.copy()
+            trial[start:stop] = trial[start:stop][::-1]
+            trial_cost = cost(path_to_order(trial, shape))
+            if trial_cost < best:
+                path, best, improved = trial, trial_cost, True
+        if improved:
+            name, order = f"{name}+local_search", path_to_order(path, shape)
+    return {"order": order, "name": name, "cost": best, "costs": costs}
+
+
+def scan_arrays(order, x_values, y_values) -> dict:
+    """Export an ordering as arrays that can be loaded in QUA, e.g. declare(fixed, value=arrays["dx"].tolist()).
+
+    :param order: order matrix of shape (len(x_values), len(y_values)).
+    :param x_values: voltages of the gate swept along the first axis.
+    :param y_values: voltages of the gate swept along the second axis.
+    :return: dictionary with the pixel indices "i" and "j" in the visit order, the corresponding voltages "x" and "y"
+        and the voltage steps "dx" and "dy" to play before each pixel, starting from 0 V.
+    """
+    i, j = np.unravel_index(np.argsort(order, axis=None), np.shape(order))
+    x, y = np.asarray(x_values, dtype=float)[i], np.asarray(y_values, dtype=float)[j]
+    return {
+        "i": i,
+        "j": j,
+        "x": x,
+        "y": y,
+        "dx": np.diff(x, prepend=0.0),
+        "dy": np.diff(y, prepend=0.0),
+    }
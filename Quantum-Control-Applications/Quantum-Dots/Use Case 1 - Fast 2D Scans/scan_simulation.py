@@ -0,0 +1,85 @@
+"""
+Streaming simulation of the bias-tee high-pass filtering of 2D scan patterns.
+
+The gate voltage output by the OPX is constant during the dwell time T of each pixel, so that the voltage v of the
+bias-tee capacitor (first order high-pass filter with time constant tau) follows the exact recursion
+    v_k = a * v_{k-1} + (1 - a) * x_k,    with a = exp(-T / tau),
+where x_k is the voltage of the k-th visited pixel. The gate voltage seen by the device is x(t) - v(t), so the
+distortion of each pixel is -v(t), which decays exponentially from v_{k-1} to v_k during the pixel.
+This recursion is a single IIR state update per pixel: the distortion maps of an N x M scan are obtained in O(N * M)
+time and memory, whatever the dwell time, instead of sampling the waveforms at 1 GS/s.
+
+The scan patterns are described by an order matrix, as returned by macros.spiral_order: order[i, j] is the index at
+which the pixel (i, j) is visited.
+"""
+
+import numpy as np
+from scipy.signal import lfilter
+
+
+def pixel_response(levels, dwell: float, tau: float, initial: float = 0.0):
+    """Bias-tee distortion of a sequence of pixels, computed with one filter update per pixel.
+
+    :param levels: voltage of each pixel in the order in which they are visited, array of shape (..., nb_of_pixels).
+    :param dwell: time spent on each pixel in ns.
+    :param tau: time constant of the bias-tee in ns.
+    :param initial: voltage of the bias-tee capacitor before the first pixel.
+    :return: dictionary with, for each pixel, the distortion averaged over the dwell time "mean", at the beginning of
+        the pixel "start" and at its end "end". The distortion is the voltage seen by the device minus the voltage
+        output by the OPX.
+    """
+    levels = np.asarray(levels, dtype=float)
+    a = np.exp(-dwell / tau)
+    zi = np.broadcast_to(np.asarray(initial, dtype=float) * a, levels.shape[:-1] + (1,))
+    end, _ = lfilter([1 - a], [1, -a], levels, axis=-1, zi=zi)
+    start = np.concatenate([np.broadcast_to(np.asarray(initial, dtype=float), zi.shape), end[..., :-1]], axis=-1)
+    # Average of the exponential relaxation from start to the pixel level during the dwell time
+    mean = levels + (start - levels) * tau / dwell * (1 - a)
+    return {"mean": -mean, "start": -start, "end": -end}
+
+
+def distortion_map(order, levels, dwell: float, tau: float, initial: float = 0.0):
+    """Bias-tee distortion of each pixel of a 2D scan pattern.
+
+    :param order: visit index of each pixel, integer array of shape (N, M) (e.g. macros.spiral_order).
+    :param levels: voltage of the gate at each pixel, array of shape (N, M).
+    :param dwell: time spent on each pixel in ns.
+    :param tau: time constant of the bias-tee in ns.
+    :param initial: voltage of the bias-tee capacitor before the first pixel.
+    :return: dictionary with the "mean", "start" and "end" distortion maps of shape (N, M) (see pixel_response).
+    """
+    order = np.asarray(order)
+    levels = np.asarray(levels, dtype=float)
+    # Pixels sorted by visit index
+    visits = np.argsort(order, axis=None)
+    response = pixel_response(levels.ravel()[visits], dwell, tau, initial)
+    maps = {}
+    for key, values in response.items():
+        maps[key] = np.empty(order.size)
+        maps[key][visits] = values
+        maps[key] = maps[key].reshape(order.shape)
+    return maps
+
+
+def scan_distortion(order, x_values, y_values, dwell: float, tau: float):
+    """Bias-tee distortion of the two gates swept by a 2D scan.
+
+    :param order: visit index of each pixel, integer array of shape (len(x_values), len(y_values)).
+    :param x_values: voltages of the gate swept along the first axis.
+    :param y_values: voltages of the gate swept along the second axis.
+    :param dwell: time spent on each pixel in ns.
+    :param tau: time constant of the bias-tee in ns.
+    :return: the distortion maps of the x and y gates (see distortion_map).
+    """
+    x_grid, y_grid = np.meshgrid(x_values, y_values, indexing="ij")
+    return distortion_map(order, x_grid, dwell, tau), distortion_map(order, y_grid, dwell, tau)
+
+
+def relative_error(distortion: dict, levels) -> float:
+    """Mean absolute distortion relative to the voltage span of the scan.
+
+    :param distortion: distortion maps returned by distortion_map.
+    :param levels: voltage of the gate at each pixel.
+    :return: the averaged error.
+    """
+    return np.mean(np.abs(distortion["mean"])) / np.ptp(levels)
@@ -10,7 +10,9 @@ from macros import (
     measurement_macro_with_pulses,
     spiral_order,
 )
+from image_assembly import ImageAssembler
 import numpy as np
+import time
 from scipy import signal
 from qm import QuantumMachinesManager
 from qm.simulate import SimulationConfig, LoopbackInterface
@@ -27,6 +29,10 @@ wait_after_pulse = 1000  # waiting time (ns) before measuring after applying the
 
 n_avg = 100  # Number of averaging loops
 cooldown_time = 200 // 4  # Resonator cooldown time in clock cycles (4ns)
+# Stream the raw I/Q samples so that the live plot only updates the pixels measured since the last refresh (see
+# image_assembly.py). The raw samples take 16 bytes per pixel and per scan (n_avg * number of pixels samples of I and Q)
+# on the server and on the computer, so that the live plot uses the averaged buffers by default.
+stream_raw_samples = False
 
 # Relevant elements
 measured_element = "RF"
@@ -45,6 +51,8 @@ ramp_to_zero_duration = 100
 wait_time = 16 // 4
 
 assert resolution % 2 == 1, "the resolution must be odd {}".format(resolution)
+# order in which the pixels are visited, used to assemble the images
+order = spiral_order(resolution)
 
 x_step_size = round_to_fixed(2 * x_amp / (resolution - 1))
 y_step_size = round_to_fixed(2 * y_amp / (resolution - 1))
@@ -68,6 +76,7 @@ with program() as spiral_scan:
     # declaring the measured variables and their streams
     I, Q = declare(fixed), declare(fixed)
     I_stream, Q_stream = declare_stream(), declare_stream()
+    n_st = declare_stream()  # stream for the number of completed scans
 
     with for_(average, 0, average < n_avg, average + 1):
         # initialising variables
@@ -220,12 +229,17 @@ with program() as spiral_scan:
         align(x_element, y_element, measured_element)
         # ramp_to_zero(x_element, duration=ramp_to_zero_duration)
         # ramp_to_zero(y_element, duration=ramp_to_zero_duration)
+        save(average, n_st)
 
     with stream_processing():
         for stream_name, stream in zip(["I", "Q"], [I_stream, Q_stream]):
             stream.buffer(resolution**2).average().save(stream_name)
+            if stream_raw_samples:
+                # raw samples in visit order for the live image assembly, growing as n_avg * number of pixels
+                stream.save_all(stream_name + "_samples")
         x_st.save_all("x")
         y_st.save_all("y")
+        n_st.save("iteration")
 
 
 #####################################
@@ -275,9 +289,9 @@ if simulation is True:
     )
 
     # reshaping the data into the correct order and shape
-    order = spiral_order(np.sqrt(I.size))
-    I = I[order]
-    Q = Q[order]
+    assembler = ImageAssembler(order)
+    I = assembler.assemble(I)
+    Q = assembler.assemble(Q)
 
     # quantifying the robustness of the method against the high-pass filtering effect of the bias-tee
     def butter_highpass_filter(data, tau):
@@ -296,24 +310,33 @@ else:
     qm = qmm.open_qm(config)
     # Execute the QUA program
     job = qm.execute(spiral_scan)
-    # fetch the data
-    results = fetching_tool(job, ["I", "Q", "iteration"], mode="live")
+    # assemble the images from the data acquired in visit order
+    assembler = ImageAssembler(order, nb_of_channels=2)
+    if stream_raw_samples:
+        handles = [job.result_handles.get("I_samples"), job.result_handles.get("Q_samples")]
+    else:
+        results = fetching_tool(job, ["I", "Q", "iteration"], mode="live")
+    start_time = time.time()
     # Live plot
     fig = plt.figure()
     interrupt_on_close(fig, job)
 
-    while results.is_processing():
-        # Fetch results
-        I, Q, iteration = results.fetch_all()
+    while job.result_handles.is_processing():
+        if stream_raw_samples:
+            # Fetch the new samples, only the pixels measured since the last refresh being updated
+            assembler.fetch(*handles)
+            iteration = assembler.iteration
+            I, Q = assembler.image[..., 0], assembler.image[..., 1]
+        else:
+            # Fetch the averaged buffers and reorder them from the visit order to the grid
+            I, Q, iteration = results.fetch_all()
+            I, Q = assembler.assemble(I), assembler.assemble(Q)
         # Progress bar
-        progress_counter(iteration, n_avg, start_time=results.start_time)
-        # reshaping the data into the correct order and shape
-        order = spiral_order(np.sqrt(I.size))
-        I = I[order]
-        Q = Q[order]
+        progress_counter(iteration, n_avg, start_time=start_time)
         # Plot results
         plt.cla()
         plt.pcolor(x_axis, y_axis, np.sqrt(I**2 + Q**2))
         plt.title("Stability diagram with spiral scan")
         plt.xlabel(x_element + "_scan [V]")
         plt.ylabel(y_element + "_scan [V]")
+        plt.pause(0.1)
@@ -22,9 +22,10 @@ https://docs.quantum-machines.co/0.1/qm-qua-sdk/docs/Guides/output_filter/?h=fil
 The protocol is inspired from https://doi.org/10.1063/1.5133894, which contains more details about the sequence and
 the post-processing of the data.
 
-This version sweeps the flux pulse duration using the baking tool, which means that the flux pulse can be scanned with
-a 1ns resolution, but must be shorter than ~260ns. If you want to measure longer flux pulse, you can either reduce the
-resolution (do 2ns steps instead of 1ns) or use the 4ns version (cryoscope_4ns.py).
+This version sweeps the flux pulse duration with a 1ns resolution using the baking tool. Only the pulses shorter than
+32ns and the 4 sub-cycle remainders are baked, the longer pulses being played as a real-time stretched constant pulse
+followed by the baked remainder (see play_square_pulse_1ns() in macros.py). The waveform memory thus doesn't depend on
+the flux pulse duration, which can be scanned up to several microseconds.
 
 Prerequisites:
     - Having found the resonance frequency of the resonator coupled to the qubit under study (resonator_spectroscopy).
@@ -41,87 +42,19 @@ from qm import SimulationConfig
 from configuration import *
 from qualang_tools.results import progress_counter, fetching_tool
 from qualang_tools.plot import interrupt_on_close
-from qualang_tools.bakery import baking
-from macros import ge_averaged_measurement
-from scipy import signal, optimize
+from macros import ge_averaged_measurement, bake_square_pulse_1ns, play_square_pulse_1ns
+from scipy import signal
 import matplotlib.pyplot as plt
-
-
-####################
-# Helper functions #
-####################
-def exponential_decay(x, a, t):
-    """Exponential decay defined as 1 + a * np.exp(-x / t).
-
-    :param x: numpy array for the time vector in ns
-    :param a: float for the exponential amplitude
-    :param t: float for the exponential decay time in ns
-    :return: numpy array for the exponential decay
-    """
-    return 1 + a * np.exp(-x / t)
-
-
-def exponential_correction(A, tau, Ts=1e-9):
-    """Derive FIR and IIR filter taps based on the exponential coefficients A and tau from 1 + a * np.exp(-x / t).
-
-    :param A: amplitude of the exponential decay.
-    :param tau: decay time of the exponential decay
-    :param Ts: sampling period. Default is 1e-9
-    :return: FIR and IIR taps
-    """
-    tau = tau * Ts
-    k1 = Ts + 2 * tau * (A + 1)
-    k2 = Ts - 2 * tau * (A + 1)
-    c1 = Ts + 2 * tau
-    c2 = Ts - 2 * tau
-    feedback_tap = k2 / k1
-    feedforward_taps = np.array([c1, c2]) / k1
-    return feedforward_taps, feedback_tap
-
-
-def filter_calc(exponential):
-    """Derive FIR and IIR filter taps based on a list of exponential coefficients.
-
-    :param exponential: exponential coefficients defined as [(A1, tau1), (A2, tau2)]
-    :return: FIR and IIR taps as [fir], [iir]
-    """
-    # Initialization based on the number of exponential coefficients
-    b = np.zeros((2, len(exponential)))
-    feedback_taps = np.zeros(len(exponential))
-    # Derive feedback tap for each set of exponential coefficients
-    for i, (A, tau) in enumerate(exponential):
-        b[:, i], feedback_taps[i] = exponential_correction(A, tau)
-    # Derive feedback tap for each set of exponential coefficients
-    feedforward_taps = b[:, 0]
-    for i in range(len(exponential) - 1):
-        feedforward_taps = np.convolve(feedforward_taps, b[:, i + 1])
-    # feedforward taps are bounded to +/- 2
-    if np.abs(max(feedforward_taps)) >= 2:
-        feedforward_taps = 2 * feedforward_taps / max(feedforward_taps)
-
-    return feedforward_taps, feedback_taps
-
-
-def baked_waveform(waveform, pulse_duration):
-    pulse_segments = []  # Stores the baking objects
-    # Create the different baked sequences, each one corresponding to a different truncated duration
-    for i in range(0, pulse_duration + 1):
-        with baking(config, padding_method="right") as b:
-            if i == 0:  # Otherwise, the baking will be empty and will not be created
-                wf = [0.0] * 16
-            else:
-                wf = waveform[:i].tolist()
-            b.add_op("flux_pulse", "flux_line", wf)
-            b.play("flux_pulse", "flux_line")
-        # Append the baking object in the list to call it from the QUA program
-        pulse_segments.append(b)
-    return pulse_segments
+from filter_functions import identify_flux_filters, multi_expdecay
 
 
 ###################
 # The QUA program #
 ###################
 n_avg = 10_000  # Number of averages
+# Number of exponential decays and of additional FIR taps used to derive the filters (see filter_functions.py)
+nb_of_exponentials = 1
+nb_of_fir_taps = 0
 # Flag to set to True if state discrimination is calibrated (where the qubit state is inferred from the 'I' quadrature).
 # Otherwise, a preliminary sequence will be played to measure the averaged I and Q values when the qubit is in |g> and |e>.
 state_discrimination = False
@@ -134,15 +67,17 @@ total_zeros = zeros_after_pulse + zeros_before_pulse
 flux_waveform = np.array([0.0] * zeros_before_pulse + [const_flux_amp] * const_flux_len + [0.0] * zeros_after_pulse)
 
 # Baked flux pulse segments with 1ns resolution
-square_pulse_segments = baked_waveform(flux_waveform, len(flux_waveform))
+square_pulse_segments = bake_square_pulse_1ns(config, "flux_line", const_flux_amp)
 step_response_th = (
     [0.0] * zeros_before_pulse + [1.0] * (const_flux_len + 1) + [0.0] * zeros_after_pulse
 )  # Perfect step response (square)
 xplot = np.arange(0, len(flux_waveform) + 1, 1)  # x-axis for plotting - Must be in ns.
+pulse = slice(zeros_before_pulse, zeros_before_pulse + const_flux_len)  # Samples during the flux pulse
 
 with program() as cryoscope:
     n = declare(int)  # QUA variable for the averaging loop
     segment = declare(int)  # QUA variable for the flux pulse segment index
+    duration = declare(int)  # QUA variable for the duration of the square part of the truncated flux pulse
     flag = declare(bool)  # QUA boolean to switch between x90 and y90
     I = declare(fixed)  # QUA variable for the measured 'I' quadrature
     Q = declare(fixed)  # QUA variable for the measured 'Q' quadrature
@@ -164,6 +99,13 @@ with program() as cryoscope:
     with for_(n, 0, n < n_avg, n + 1):
         # Loop over the truncated flux pulse
         with for_(segment, 0, segment <= const_flux_len + total_zeros, segment + 1):
+            # The flux pulse truncated after 'segment' ns is made of zeros followed by a square pulse
+            with if_(segment <= zeros_before_pulse):
+                assign(duration, 0)
+            with elif_(segment >= zeros_before_pulse + const_flux_len):
+                assign(duration, const_flux_len)
+            with else_():
+                assign(duration, segment - zeros_before_pulse)
             # Alternate between X/2 and Y/2 pulses
             with for_each_(flag, [True, False]):
                 # Play first X/2
@@ -172,10 +114,8 @@ with program() as cryoscope:
                 align("qubit", "flux_line")
                 # Wait some time to ensure that the flux pulse will arrive after the x90 pulse
                 wait(20 * u.ns)
-                with switch_(segment):
-                    for j in range(0, len(flux_waveform) + 1):
-                        with case_(j):
-                            square_pulse_segments[j].run()
+                wait(zeros_before_pulse * u.ns, "flux_line")
+                play_square_pulse_1ns(square_pulse_segments, duration, "flux_line")
                 # Wait for the idle time set slightly above the maximum flux pulse duration to ensure that the 2nd x90
                 # pulse arrives after the longest flux pulse
                 wait((len(flux_waveform) + 20) * u.ns, "qubit")
@@ -318,31 +258,33 @@ else:
         plt.tight_layout()
         plt.pause(0.1)
 
-    ## Fit step response with exponential
-    [A, tau], _ = optimize.curve_fit(
-        exponential_decay,
-        xplot,
-        step_response_volt,
+    ## Fit step response with exponential decays and derive the IIR and FIR corrections
+    # The time axis of the fit starts at the rising edge of the flux pulse
+    filters = identify_flux_filters(
+        xplot[pulse] - zeros_before_pulse, step_response_volt[pulse], nb_of_exponentials, nb_of_fir_taps
     )
+    A, tau = filters["amplitudes"][0], filters["taus"][0]
+    fir, iir = filters["feedforward"][0], filters["feedback"][0]
     print(f"A: {A}\ntau: {tau}")
-
-    ## Derive IIR and FIR corrections
-    fir, iir = filter_calc(exponential=[(A, tau)])
     print(f"FIR: {fir}\nIIR: {iir}")
+    print(
+        f"RMS deviation from the ideal step: {filters['rms_error_before'][0]:.4f} without filter, "
+        f"{filters['rms_error_after'][0]:.4f} with filter"
+    )
 
     ## Derive responses and plots
     # Response without filter
-    no_filter = exponential_decay(xplot, A, tau)
-    # Response with filters
-    with_filter = no_filter * signal.lfilter(fir, [1, iir[0]], step_response_th)  # Output filter , DAC Output
+    no_filter = multi_expdecay(xplot[pulse] - zeros_before_pulse, A, tau, filters["gain"][0])
+    # Measured response corrected by the filters
+    with_filter = filters["corrected"][0]
 
     # Plot all data
     plt.rcParams.update({"font.size": 13})
     plt.figure()
     plt.suptitle("Cryoscope with filter implementation")
     plt.plot(xplot, step_response_volt, "o-", label="Experimental data")
-    plt.plot(xplot, no_filter, label="Fitted response without filter")
-    plt.plot(xplot, with_filter, label="Fitted response with filter")
+    plt.plot(xplot[pulse], no_filter, label="Fitted response without filter")
+    plt.plot(xplot[pulse], with_filter, label="Measured response with filter")
     plt.plot(xplot, step_response_th, label="Ideal WF")  # pulse
     plt.text(
         max(xplot) // 2,
@@ -353,7 +295,7 @@ else:
     plt.text(
         max(xplot) // 4,
         max(step_response_volt) / 2,
-        f"A = {A:.2f}\ntau = {tau:.2f}",
+        f"A = {np.round(A, 2)}\ntau = {np.round(tau, 2)}",
         bbox=dict(boxstyle="round", facecolor="wheat", alpha=0.5),
     )
     plt.xlabel("Flux pulse duration [ns]")
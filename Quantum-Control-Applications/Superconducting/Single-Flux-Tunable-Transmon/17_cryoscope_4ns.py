@@ -43,69 +43,18 @@ from qualang_tools.results import progress_counter, fetching_tool
 from qualang_tools.plot import interrupt_on_close
 from qualang_tools.loops import from_array
 from macros import ge_averaged_measurement
-from scipy import signal, optimize
+from scipy import signal
 import matplotlib.pyplot as plt
-
-
-####################
-# Helper functions #
-####################
-def exponential_decay(x, a, t):
-    """Exponential decay defined as 1 + a * np.exp(-x / t).
-
-    :param x: numpy array for the time vector in ns
-    :param a: float for the exponential amplitude
-    :param t: float for the exponential decay time in ns
-    :return: numpy array for the exponential decay
-    """
-    return 1 + a * np.exp(-x / t)
-
-
-def exponential_correction(A, tau, Ts=1e-9):
-    """Derive FIR and IIR filter taps based on the exponential coefficients A and tau from 1 + a * np.exp(-x / t).
-
-    :param A: amplitude of the exponential decay.
-    :param tau: decay time of the exponential decay.
-    :param Ts: sampling period. Default is 1e-9.
-    :return: FIR and IIR taps.
-    """
-    tau = tau * Ts
-    k1 = Ts + 2 * tau * (A + 1)
-    k2 = Ts - 2 * tau * (A + 1)
-    c1 = Ts + 2 * tau
-    c2 = Ts - 2 * tau
-    feedback_tap = k2 / k1
-    feedforward_taps = np.array([c1, c2]) / k1
-    return feedforward_taps, feedback_tap
-
-
-def filter_calc(exponential):
-    """Derive FIR and IIR filter taps based on a list of exponential coefficients.
-
-    :param exponential: exponential coefficients defined as [(A1, tau1), (A2, tau2)]
-    :return: FIR and IIR taps as [fir], [iir]
-    """
-    # Initialization based on the number of exponential coefficients
-    b = np.zeros((2, len(exponential)))
-    feedback_taps = np.zeros(len(exponential))
-    # Derive feedback tap for each set of exponential coefficients
-    for i, (A, tau) in enumerate(exponential):
-        b[:, i], feedback_taps[i] = exponential_correction(A, tau)
-    # Derive feedback tap for each set of exponential coefficients
-    feedforward_taps = b[:, 0]
-    for i in range(len(exponential) - 1):
-        feedforward_taps = np.convolve(feedforward_taps, b[:, i + 1])
-    # feedforward taps are bounded to +/- 2
-    if np.abs(max(feedforward_taps)) >= 2:
-        feedforward_taps = 2 * feedforward_taps / max(feedforward_taps)
-
-    return feedforward_taps, feedback_taps
+from filter_functions import identify_flux_filters, multi_expdecay
 
 
 ###################
 # The QUA program #
 ###################
 n_avg = 10_000  # Number of averages
+# Number of exponential decays and of additional FIR taps used to derive the filters (see filter_functions.py)
+nb_of_exponentials = 1
+nb_of_fir_taps = 0
 # Flag to set to True if state discrimination is calibrated (where the qubit state is inferred from the 'I' quadrature).
 # Otherwise, a preliminary sequence will be played to measure the averaged I and Q values when the qubit is in |g> and |e>.
 state_discrimination = True
@@ -291,23 +240,23 @@ else:
         plt.tight_layout()
         plt.pause(0.1)
 
-    ## Fit step response with exponential
-    [A, tau], _ = optimize.curve_fit(
-        exponential_decay,
-        xplot,
-        step_response_volt,
-    )
+    ## Fit step response with exponential decays and derive the IIR and FIR corrections
+    # The time axis of the fit starts at the rising edge of the flux pulse
+    filters = identify_flux_filters(xplot, step_response_volt, nb_of_exponentials, nb_of_fir_taps)
+    A, tau = filters["amplitudes"][0], filters["taus"][0]
+    fir, iir = filters["feedforward"][0], filters["feedback"][0]
     print(f"A: {A}\ntau: {tau}")
-
-    ## Derive IIR and FIR corrections
-    fir, iir = filter_calc(exponential=[(A, tau)])
     print(f"FIR: {fir}\nIIR: {iir}")
+    print(
+        f"RMS deviation from the ideal step: {filters['rms_error_before'][0]:.4f} without filter, "
+        f"{filters['rms_error_after'][0]:.4f} with filter"
+    )
 
     ## Derive responses and plots
     # Response without filter
-    no_filter = exponential_decay(xplot, a=A, t=tau)
-    # Response with filters
-    with_filter = no_filter * signal.lfilter(fir, [1, iir[0]], step_response_th)  # Output filter , DAC Output
+    no_filter = multi_expdecay(xplot, A, tau, filters["gain"][0])
+    # Measured response corrected by the filters
+    with_filter = filters["corrected"][0]
 
     # Plot all data
     plt.rcParams.update({"font.size": 13})
@@ -315,7 +264,7 @@ else:
     plt.suptitle("Cryoscope with filter implementation")
     plt.plot(xplot, step_response_volt, "o-", label="Experimental data")
     plt.plot(xplot, no_filter, label="Fitted response without filter")
-    plt.plot(xplot, with_filter, label="Fitted response with filter")
+    plt.plot(xplot, with_filter, label="Measured response with filter")
     plt.plot(xplot, step_response_th, label="Ideal WF")  # pulse
     plt.text(
         max(durations) // 2,
@@ -326,7 +275,7 @@ else:
     plt.text(
         max(durations) // 4,
         max(step_response_volt) / 2,
-        f"A = {A:.2f}\ntau = {tau:.2f}",
+        f"A = {np.round(A, 2)}\ntau = {np.round(tau, 2)}",
         bbox=dict(boxstyle="round", facecolor="wheat", alpha=0.5),
     )
     plt.xlabel("Flux pulse duration [ns]")
@@ -2,7 +2,7 @@
 cryoscope.py: template for performing the cryoscope protocol.
 """
 
-import scipy.io
+import scipy.signal
 from qm.qua import *
 from qm import QuantumMachinesManager
 from qm import SimulationConfig, LoopbackInterface
@@ -12,6 +12,7 @@ import numpy as np
 from qualang_tools.bakery import baking
 from qualang_tools.plot import interrupt_on_close
 from scipy import signal
+from cryoscope_data import load_reference
 
 ###################
 # The QUA program #
@@ -22,17 +23,20 @@ cooldown_time = 50000 // 4 * 0 + 4  # Cooldown time between sequences in clock c
 
 # FLux pulse waveform generation
 flux_eleph_amp = 0.07
-Data = scipy.io.loadmat(
-    "C:\\Users\\TheoQM\\Documents\\2_Customers\\6_Paraoanu\\2_Paraoanu_QUA\\OnSite\\cryoscope image\\elephant.mat"
-)
-flux_waveform = np.transpose(Data["sig2"])
-flux_waveform = np.concatenate(flux_waveform)
-flux_waveform = flux_waveform / np.max(flux_waveform)
-flux_waveform = np.sqrt(flux_waveform)
-flux_waveform = flux_waveform * -flux_eleph_amp
-flux_waveform = flux_waveform[25:]
-for k in range(const_flux_len - len(flux_waveform)):
-    flux_waveform = np.append(flux_waveform, -0.25)
+
+
+def elephant_waveform(reference, amplitude, length):
+    """Flux waveform giving a qubit detuning proportional to the reference signal, padded to the flux pulse length."""
+    flux_waveform = np.ravel(reference)
+    flux_waveform = flux_waveform / np.max(flux_waveform)
+    flux_waveform = np.sqrt(flux_waveform)
+    flux_waveform = flux_waveform * -amplitude
+    flux_waveform = flux_waveform[25:]
+    return np.concatenate([flux_waveform, [-0.25] * (length - len(flux_waveform))])
+
+
+# The MATLAB file is located next to this script, it is only parsed once and then loaded from the cache folder
+flux_waveform = elephant_waveform(load_reference("elephant.mat", "sig2"), flux_eleph_amp, const_flux_len)
 # signal.triang(const_flux_len)
 # np.cos(2 * np.pi * 10e6 * np.arange(0,const_flux_len)*1e-9)**2
 
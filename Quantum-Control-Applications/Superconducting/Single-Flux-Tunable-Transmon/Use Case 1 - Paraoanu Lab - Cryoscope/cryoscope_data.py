@@ -0,0 +1,152 @@
+"""
+cryoscope_data.py: access layer for the reference waveforms and the measured cryoscope datasets.
+
+* The paths are resolved relative to this folder, so that the scripts run from any working directory and any OS.
+* The MATLAB files are parsed only once: each variable is converted to a .npy file stored in the cache folder, under a
+  name derived from the hash of the MATLAB file content, and then memory-mapped on the following runs.
+* The measured datasets are stored as one .npy file per array and are memory-mapped when loaded.
+* The results of the derived quantities (normalized waveforms, filtered responses...) can be cached on disk with the
+  `disk_cache` decorator, keyed by the hash of the code of the function and of the input arrays and parameters.
+"""
+
+import functools
+import hashlib
+import os
+from pathlib import Path
+import numpy as np
+import scipy.io
+
+DATA_DIR = Path(__file__).resolve().parent
+CACHE_DIR = DATA_DIR / ".cryoscope_cache"
+
+
+def resolve_path(path):
+    """Resolve a data file path, relative paths being taken from the folder of this module.
+
+    :param path: absolute path or path relative to this folder
+    :return: the absolute path as a pathlib.Path
+    """
+    path = Path(path).expanduser()
+    return path if path.is_absolute() else DATA_DIR / path
+
+
+def _cache_dir():
+    if not CACHE_DIR.exists():
+        CACHE_DIR.mkdir(parents=True)
+        # Keep the cached files out of version control
+        (CACHE_DIR / ".gitignore").write_text("*\n")
+    return CACHE_DIR
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """Hash of the content of a file.
+
+    :param path: path of the file (see resolve_path)
+    :param chunk_size: number of bytes read at once
+    :return: hexadecimal sha1 digest
+    """
+    digest = hashlib.sha1()
+    with open(resolve_path(path), "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _save_npy(path, array):
+    # Write then rename so that an interrupted run never leaves a truncated file in the cache
+    tmp = path.with_name(f"{path.stem}.{os.getpid()}.tmp.npy")
+    np.save(tmp, np.ascontiguousarray(array))
+    os.replace(tmp, path)
+
+
+def load_reference(filename="elephant.mat", variable="sig2"):
+    """Load a variable of a MATLAB file, parsing the file only the first time and memory-mapping it afterwards.
+
+    :param filename: path of the MATLAB file (see resolve_path)
+    :param variable: name of the MATLAB variable
+    :return: read-only numpy array (memory-mapped)
+    """
+    path = resolve_path(filename)
+    cached = _cache_dir() / f"{path.stem}_{file_hash(path)[:16]}_{variable}.npy"
+    if not cached.exists():
+        data = scipy.io.loadmat(str(path), variable_names=[variable])
+        if variable not in data:
+            raise KeyError(f"Variable '{variable}' not found in {path}.")
+        _save_npy(cached, data[variable])
+    return np.load(cached, mmap_mode="r")
+
+
+def save_dataset(name, **arrays):
+    """Save a measured dataset as one .npy file per array, in the folder `name` (see resolve_path).
+
+    :param name: dataset folder
+    :param arrays: arrays to save, e.g. I=I, Q=Q
+    :return: the path of the dataset folder
+    """
+    folder = resolve_path(name)
+    folder.mkdir(parents=True, exist_ok=True)
+    for key, array in arrays.items():
+        _save_npy(folder / f"{key}.npy", np.asarray(array))
+    return folder
+
+
+def load_dataset(name, keys=None):
+    """Load a measured dataset saved with save_dataset, the arrays being memory-mapped and thus only read when used.
+
+    :param name: dataset folder (see resolve_path)
+    :param keys: names of the arrays to load. Default is None which loads all of them
+    :return: dictionary of read-only numpy arrays
+    """
+    folder = resolve_path(name)
+    if keys is None:
+        keys = sorted(p.stem for p in folder.glob("*.npy"))
+    return {key: np.load(folder / f"{key}.npy", mmap_mode="r") for key in keys}
+
+
+def _hash_arguments(digest, value):
+    if isinstance(value, np.ndarray):
+        value = np.ascontiguousarray(value)
+        digest.update(f"ndarray{value.dtype.str}{value.shape}".encode())
+        digest.update(value.tobytes())
+    elif isinstance(value, (list, tuple)):
+        digest.update(f"{type(value).__name__}{len(value)}".encode())
+        for v in value:
+            _hash_arguments(digest, v)
+    elif isinstance(value, dict):
+        for k in sorted(value):
+            digest.update(repr(k).encode())
+            _hash_arguments(digest, value[k])
+    else:
+        digest.update(repr(value).encode())
+
+
+def _hash_code(digest, code):
+    # Bytecode, names and constants of the function and of its nested functions, so that editing the body of the
+    # function invalidates the cache. The line numbers are left out, so that moving the function does not.
+    digest.update(code.co_code)
+    digest.update(repr(code.co_names).encode())
+    for const in code.co_consts:
+        if isinstance(const, type(code)):
+            _hash_code(digest, const)
+        else:
+            _hash_arguments(digest, const)
+
+
+def disk_cache(func):
+    """Decorator caching on disk the array returned by func, keyed by the hash of the function name, code and arguments.
+
+    :param func: function returning a numpy array
+    :return: the decorated function, returning a read-only memory-mapped array
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        digest = hashlib.sha1(func.__qualname__.encode())
+        _hash_code(digest, func.__code__)
+        _hash_arguments(digest, (args, kwargs))
+        cached = _cache_dir() / f"{func.__name__}_{digest.hexdigest()[:16]}.npy"
+        if not cached.exists():
+            _save_npy(cached, np.asarray(func(*args, **kwargs)))
+        return np.load(cached, mmap_mode="r")
+
+    return wrapper
@@ -5,6 +5,7 @@ All the macros below have been written and tested with the basic configuration.
 """
 
 from qm.qua import *
+from qualang_tools.bakery import baking
 
 ##############
 # QUA macros #
@@ -94,3 +95,68 @@ def ge_averaged_measurement(cooldown_time, n_avg):
         save(Q, Qe_st)
 
         return Ig_st, Qg_st, Ie_st, Qe_st
+
+
+def bake_square_pulse_1ns(config, element, amplitude, short_pulse_max=32):
+    """
+    Bake the waveforms needed to play square flux pulses of any duration with 1ns resolution (see play_square_pulse_1ns).
+    Only the pulses shorter than short_pulse_max and the 4 possible sub-cycle remainders are baked, so that the waveform
+    memory does not depend on the maximum pulse duration.
+
+    :param config: the configuration in which the baked waveforms are added.
+    :param element: the flux element playing the pulses.
+    :param amplitude: amplitude of the square pulse in V. Must match the amplitude of the constant operation played with
+        play_square_pulse_1ns.
+    :param short_pulse_max: pulses shorter than this duration in ns are fully baked. Must be at least 32ns so that the
+        real-time stretched part of the longer pulses lasts at least 4 clock cycles.
+    :return: dictionary with the baking objects of the short pulses ("short") and of the remainders ("remainders").
+    """
+    if short_pulse_max < 32:
+        raise ValueError("short_pulse_max must be at least 32ns.")
+    segments = {"short": [], "remainders": []}
+    for i in range(short_pulse_max):
+        with baking(config, padding_method="right") as b:
+            # An empty baking is not created, so the zero duration pulse is replaced by zeros
+            wf = [0.0] * 16 if i == 0 else [amplitude] * i
+            b.add_op("flux_pulse", element, wf)
+            b.play("flux_pulse", element)
+        segments["short"].append(b)
+    for r in range(4):
+        # 16ns + r, padded with zeros at the end to the next clock cycle
+        with baking(config, padding_method="right") as b:
+            b.add_op("flux_pulse", element, [amplitude] * (16 + r))
+            b.play("flux_pulse", element)
+        segments["remainders"].append(b)
+    return segments
+
+
+def play_square_pulse_1ns(segments, duration, element, operation="const", amplitude_scaling=None):
+    """
+    Play a square flux pulse whose duration is given in ns by a QUA variable, with 1ns resolution.
+    The pulses shorter than the baked short pulses are played from the baked library, the longer ones are played as a
+    real-time stretched constant pulse (4ns granularity) followed by the baked remainder, without gap in between.
+
+    :param segments: the baked segments returned by bake_square_pulse_1ns.
+    :param duration: QUA int for the pulse duration in ns.
+    :param element: the flux element playing the pulses.
+    :param operation: the constant operation of the element, with the same amplitude as the baked segments.
+    :param amplitude_scaling: QUA fixed or python float for the amplitude pre-factor. Default is None (no scaling).
+    """
+    cycles = declare(int)
+    remainder = declare(int)
+    short_pulse_max = len(segments["short"])
+    amp_array = None if amplitude_scaling is None else [(element, amplitude_scaling)]
+    pulse = operation if amplitude_scaling is None else operation * amp(amplitude_scaling)
+    with if_(duration < short_pulse_max):
+        with switch_(duration):
+            for j in range(short_pulse_max):
+                with case_(j):
+                    segments["short"][j].run(amp_array=amp_array)
+    with else_():
+        assign(remainder, duration & 3)
+        assign(cycles, (duration - 16 - remainder) >> 2)
+        with switch_(remainder):
+            for r in range(4):
+                with case_(r):
+                    play(pulse, element, duration=cycles)
+                    segments["remainders"][r].run(amp_array=amp_array)
@@ -50,10 +50,8 @@ from macros import qua_declaration, multiplexed_readout
 from qualang_tools.results.data_handler import DataHandler
 from macros import qua_declaration, multiplexed_readout
 from cr_hamiltonian_tomography import (
-    CRHamiltonianTomographyAnalysis,
+    CRHamiltonianTomographySweep,
     plot_cr_duration_vs_scan_param,
-    plot_interaction_coeffs,
-    PAULI_2Q,
 )
 
 
@@ -272,31 +270,21 @@ else:
         for fname, r in zip(fetch_names[1:], res[1:]):
             save_data_dict[fname] = r
 
-        # Perform CR Hamiltonian tomography
-        coeffs = []
-        fig_analyses = []
-        for idx, a in enumerate(amp_scalings):
-            print("-" * 40)
-            print(f"fitting for amp = {a}")
-            try:
-                crht = CRHamiltonianTomographyAnalysis(
-                    ts=ts_ns,
-                    data=bloch_t[idx, ...],  # target data: len(amp_scalings) x len(t_vec_cycle) x 3 x 2
-                )
-                crht.fit_params()
-                coeffs.append(crht.interaction_coeffs_MHz)
+        # Perform CR Hamiltonian tomography, each point being warm started from the fits of the previous ones
+        crht_sweep = CRHamiltonianTomographySweep(
+            ts=ts_ns,
+            data=bloch_t,  # target data: len(amp_scalings) x len(t_vec_cycle) x 3 x 2
+            sweep_values=amp_scalings,
+        ).fit_params()
+        for a, crht in zip(amp_scalings, crht_sweep.analyses):
+            if crht.interaction_coeffs_MHz["IX"] is not None:
                 fig_analysis = crht.plot_fit_result(do_show=False)
                 save_data_dict[f"fig_analysis_amp_scaling={a:5.4f}".replace(".", "-")] = fig_analysis
-            except:
-                print(f"-> failed")
-                crht.interaction_coeffs_MHz = {k: None for k, v in crht.interaction_coeffs_MHz.items()}
-                coeffs.append({p: None for p in PAULI_2Q})
-            finally:
-                save_data_dict[f"ham_tomo_params_fitted_@amp={a:5.4f}"] = crht.params_fitted_dict
-                save_data_dict[f"ham_tomo_interaction_coeffs_MHz_@amp={a:5.4f}"] = crht.interaction_coeffs_MHz
+            save_data_dict[f"ham_tomo_params_fitted_@amp={a:5.4f}"] = crht.params_fitted_dict
+            save_data_dict[f"ham_tomo_interaction_coeffs_MHz_@amp={a:5.4f}"] = crht.interaction_coeffs_MHz
 
         # Plot the estimated interaction coefficients
-        fig_summary = plot_interaction_coeffs(coeffs, amp_scalings, xlabel="cr drive amplitude")
+        fig_summary = crht_sweep.plot_interaction_coeffs(xlabel="cr drive amplitude")
         save_data_dict["fig_summary"] = fig_summary
 
         # Save results
@@ -50,10 +50,8 @@ from macros import qua_declaration, multiplexed_readout
 from qualang_tools.results.data_handler import DataHandler
 from macros import qua_declaration, multiplexed_readout
 from cr_hamiltonian_tomography import (
-    CRHamiltonianTomographyAnalysis,
+    CRHamiltonianTomographySweep,
     plot_cr_duration_vs_scan_param,
-    plot_interaction_coeffs,
-    PAULI_2Q,
 )
 
 
@@ -274,33 +272,21 @@ else:
         for fname, r in zip(fetch_names[1:], res[1:]):
             save_data_dict[fname] = r
 
-        # Perform CR Hamiltonian tomography
-        coeffs = []
-        fig_analyses = []
-        for idx, ph in enumerate(phases):
-            print("-" * 40)
-            print(f"fitting for phase = {ph}")
-            try:
-                crht = CRHamiltonianTomographyAnalysis(
-                    ts=ts_ns,
-                    data=bloch_t[idx, ...],  # target data: len(phases) x len(t_vec_cycle) x 3 x 2
-                )
-                crht.fit_params()
-                coeffs.append(crht.interaction_coeffs_MHz)
+        # Perform CR Hamiltonian tomography, each point being warm started from the fits of the previous ones
+        crht_sweep = CRHamiltonianTomographySweep(
+            ts=ts_ns,
+            data=bloch_t,  # target data: len(phases) x len(t_vec_cycle) x 3 x 2
+            sweep_values=phases,
+        ).fit_params()
+        for ph, crht in zip(phases, crht_sweep.analyses):
+            if crht.interaction_coeffs_MHz["IX"] is not None:
                 fig_analysis = crht.plot_fit_result(do_show=False)
                 save_data_dict[f"fig_analysis_phase={ph:5.4f}".replace(".", "-")] = fig_analysis
-            except:
-                print(f"fitting failed at phase = {ph}")
-                crht.interaction_coeffs_MHz = {k: None for k, v in crht.interaction_coeffs_MHz.items()}
-                coeffs.append({p: None for p in PAULI_2Q})
-            finally:
-                # plt.show(block=False)
-                # save_data_dict["fig_analysis"] = fig_analysis
-                save_data_dict[f"ham_tomo_params_fitted_@phase={ph:5.4f}"] = crht.params_fitted_dict
-                save_data_dict[f"ham_tomo_interaction_coeffs_MHz_@phase={ph:5.4f}"] = crht.interaction_coeffs_MHz
+            save_data_dict[f"ham_tomo_params_fitted_@phase={ph:5.4f}"] = crht.params_fitted_dict
+            save_data_dict[f"ham_tomo_interaction_coeffs_MHz_@phase={ph:5.4f}"] = crht.interaction_coeffs_MHz
 
         # Plot the estimated interaction coefficients
-        fig_summary = plot_interaction_coeffs(coeffs, phases, xlabel="cr drive phase")
+        fig_summary = crht_sweep.plot_interaction_coeffs(xlabel="cr drive phase")
         save_data_dict["fig_summary"] = fig_summary
 
         # Save results
@@ -89,6 +89,61 @@ class CRHamiltonianTomographyFunctions:
         m = np.sqrt(m2)
         return (+(d**2) + (mx**2 + my**2) * np.cos(m * ts)) / m2
 
+    def _compute_XYZ_with_jacobian(self, ts, d, mx, my):
+        """
+        Calculate the expectation values <X>, <Y>, <Z> together with their analytic derivatives with respect to the
+        parameters, sharing the intermediate terms. The parameters can be arrays of shape (n, 1) to evaluate n sets of
+        parameters at once.
+
+        :param ts: durations of CR drive.
+        :param d: delta.
+        :param mx: omega X.
+        :param my: omega y.
+
+        :return: Two dictionaries with keys 'x', 'y', 'z' containing the expectation values and their derivatives
+            stacked along the last axis in the order of PARAM_NAMES.
+        """
+        m2 = self._compute_omega_squared(d, mx, my)
+        m = np.sqrt(m2)
+        c, s = np.cos(m * ts), np.sin(m * ts)
+        ts_c, ts_s = ts * c, ts * s
+        xyz = {
+            "x": (d * mx * (c - 1) + m * my * s) / m2,
+            "y": (-d * my * (c - 1) - m * mx * s) / m2,
+            "z": (d**2 + (mx**2 + my**2) * c) / m2,
+        }
+        # terms of the derivatives of the numerators proportional to d(omega)/dp = p / omega
+        gx = my * s + m * my * ts_c - d * mx * ts_s
+        gy = d * my * ts_s - mx * s - m * mx * ts_c
+        gz = -(mx**2 + my**2) * ts_s
+        zero = np.zeros_like(d)
+        jac = {bss: [] for bss in TARGET_BASES}
+        for p, ax, bx, ay, by, az, bz in [
+            (d, mx, zero, my, zero, 2 * d, zero),
+            (mx, d, zero, zero, m, zero, 2 * mx),
+            (my, zero, m, d, zero, zero, 2 * my),
+        ]:
+            dm = p / m
+            # quotient rule with d(omega ** 2)/dp = 2p
+            jac["x"].append((ax * (c - 1) + bx * s + dm * gx - 2 * p * xyz["x"]) / m2)
+            jac["y"].append((-ay * (c - 1) - by * s + dm * gy - 2 * p * xyz["y"]) / m2)
+            jac["z"].append((az + bz * c + dm * gz - 2 * p * xyz["z"]) / m2)
+        return xyz, {bss: np.stack(jac[bss], axis=-1) for bss in TARGET_BASES}
+
+    def _compute_XYZ_jacobian(self, ts, d, mx, my):
+        """
+        Calculate the analytic derivatives of the expectation values <X>, <Y>, <Z> with respect to the parameters.
+
+        :param ts: durations of CR drive.
+        :param d: delta.
+        :param mx: omega X.
+        :param my: omega y.
+
+        :return: Dictionary with keys 'x', 'y', 'z' containing the derivatives stacked along the last axis
+            in the order of PARAM_NAMES.
+        """
+        return self._compute_XYZ_with_jacobian(ts, d, mx, my)[1]
+
     def compute_R(self, xyz0, xyz1):
         """
         Compute the root mean square of the sum of two sets of <X>, <Y>, and <Z> data.
@@ -147,6 +202,8 @@ class CRHamiltonianTomographyAnalysis(CRHamiltonianTomographyFunctions):
         self.data_dict = self.rearrange_data_ndarray2dict(data)
         self.params_fitted = {s: [] for s in CONTROL_STATES}
         self.params_fitted_dict = {s: {nm: None for nm in PARAM_NAMES} for s in CONTROL_STATES}
+        self.fit_errors = {s: None for s in CONTROL_STATES}
+        self.multistart_used = {s: None for s in CONTROL_STATES}
         self.interaction_coeffs_MHz = {p: None for p in PAULI_2Q}
 
     def rearrange_data_ndarray2dict(self, data):
@@ -188,6 +245,18 @@ class CRHamiltonianTomographyAnalysis(CRHamiltonianTomographyFunctions):
         xyz = self.compute_XYZ(ts[:ts_len], *[d, mx, my])
         return np.hstack([xyz[c] for c in TARGET_BASES])
 
+    def _bloch_vec_evolution_jacobian(self, ts, d, mx, my):
+        """
+        Calculate the analytic jacobian of _bloch_vec_evolution with respect to the Hamiltonian parameters.
+
+        :param ts: durations of CR drive.
+        :param d, mx, my: Hamiltonian parameters.
+        :return: Array of shape (len(ts), 3) with the derivatives of the 'x', 'y', and 'z' basiss concatenated.
+        """
+        ts_len = len(ts) // len(TARGET_BASES)
+        jac = self._compute_XYZ_jacobian(ts[:ts_len], d, mx, my)
+        return np.vstack([jac[c] for c in TARGET_BASES])
+
     def _fit_bloch_vec_evolution(self, xyz, p0):
         """
         Fit the model to the data using non-linear least squares.
@@ -202,8 +271,53 @@ class CRHamiltonianTomographyAnalysis(CRHamiltonianTomographyFunctions):
             ydata=np.hstack([xyz[c] for c in TARGET_BASES]),
             p0=p0,
             method="trf",
+            jac=self._bloch_vec_evolution_jacobian,
         )
 
+    def _fit_bloch_vec_evolution_batch(self, xyz, p0s, max_iter=200, rtol=1e-8):
+        """
+        Fit the model to the data from all the initial guesses at once, using a Levenberg-Marquardt algorithm
+        vectorized over the initial guesses with the analytic jacobian.
+
+        :param xyz: Measured data for the Bloch vector basiss.
+        :param p0s: Initial guesses for the parameters, array-like of shape (n, 3).
+        :param max_iter: Maximum number of iterations.
+        :param rtol: Relative decrease of the squared error below which a fit is considered converged.
+        :return: Fitted parameters of shape (n, 3) and the corresponding squared errors of shape (n,).
+        """
+        ydata = np.hstack([xyz[c] for c in TARGET_BASES])
+        ps = np.array(p0s, dtype=float)
+        lam = np.full(len(ps), 1e-3)
+
+        def evaluate(params):
+            xyz_fitted, jac = self._compute_XYZ_with_jacobian(self.ts, *params.T[:, :, None])
+            res = np.hstack([xyz_fitted[c] for c in TARGET_BASES]) - ydata
+            return res, (res**2).sum(axis=1), np.concatenate([jac[c] for c in TARGET_BASES], axis=1)
+
+        res, cost, jac = evaluate(ps)
+        # indices of the fits which are still running
+        idx = np.arange(len(ps))
+        for _ in range(max_iter):
+            jac_t = jac[idx].transpose(0, 2, 1)
+            jtj = np.matmul(jac_t, jac[idx])
+            grad = np.matmul(jac_t, res[idx][:, :, None])
+            # Marquardt damping scaled by the diagonal of the approximate hessian
+            damping = lam[idx, None, None] * (np.eye(3) * jtj + 1e-12 * np.eye(3))
+            step = -np.linalg.solve(jtj + damping, grad)[:, :, 0]
+            res_new, cost_new, jac_new = evaluate(ps[idx] + step)
+            accept = cost_new < cost[idx]
+            converged = accept & (cost[idx] - cost_new < rtol * cost[idx])
+            ps[idx[accept]] += step[accept]
+            res[idx[accept]], cost[idx[accept]], jac[idx[accept]] = res_new[accept], cost_new[accept], jac_new[accept]
+            lam[idx] = np.where(accept, lam[idx] / 3, lam[idx] * 4)
+            # a fit whose steps keep being rejected is already at a minimum, and a fit which progresses slowly far above
+            # the best error found so far is not worth pursuing
+            stalled = (cost[idx] > 2 * cost.min()) & ~(cost_new < 0.99 * cost[idx])
+            idx = idx[~converged & (lam[idx] < 1e8) & ~stalled]
+            if len(idx) == 0:
+                break
+        return ps, cost
+
     def _find_dominant_frequency(self, data):
         """
         Identify the dominant frequency in the provided data using Fourier transform.
@@ -240,37 +354,69 @@ class CRHamiltonianTomographyAnalysis(CRHamiltonianTomographyFunctions):
         # omega_init = initial value for sqrt(delta ** 2 + omega_x ** 2 + omega_y ** 2)
         return [2 * np.pi * freq_init * p0 for p0 in P0s]
 
-    def fit_params(self, params_init=None, do_print=True):
+    def _fit_from_inits(self, xyz, p0s, method):
         """
-        Fit the Hamiltonian parameters for each state and compute interaction rates.
+        Fit the model to the data from each of the initial values and keep the best fit.
 
-        :param params_init: Initial parameter estimates (optional).
-        :param _print: Boolean flag to control the printing of fitting results.
-        :return: Self.
+        :param xyz: Measured data for the Bloch vector basiss.
+        :param p0s: Initial guesses for the parameters, array-like of shape (n, 3).
+        :param method: "batch" or "sequential", see fit_params.
+        :return: Best fitted parameters and the corresponding squared error.
         """
-        for st in CONTROL_STATES:
-            # prepare a set of initial values
-            p0s = self._pick_params_inits(xyz=self.data_dict[st])
-
-            # fit the model
+        if method == "batch":
+            params_fitted_list, errs = self._fit_bloch_vec_evolution_batch(xyz=xyz, p0s=p0s)
+        else:
             errs = []
             params_fitted_list = []
             for p0 in p0s:
                 params_fitted, _ = self._fit_bloch_vec_evolution(
-                    xyz=self.data_dict[st],
+                    xyz=xyz,
                     p0=p0,
                 )
                 crqst_fitted_dict = self.compute_XYZ(self.ts, *params_fitted)
                 # squared error
-                err = np.array(
-                    [((crqst_fitted_dict[bss] - self.data_dict[st][bss]) ** 2).sum() for bss in TARGET_BASES]
-                ).sum()
+                err = np.array([((crqst_fitted_dict[bss] - xyz[bss]) ** 2).sum() for bss in TARGET_BASES]).sum()
                 errs.append(err)
                 params_fitted_list.append(params_fitted)
 
-            # pick the best fitted (minimal error)
-            idx_best_fit = np.argmin(np.array(errs))
-            self.params_fitted[st] = params_fitted_list[idx_best_fit]
+        # pick the best fitted (minimal error)
+        idx_best_fit = np.argmin(np.array(errs))
+        return np.array(params_fitted_list[idx_best_fit]), errs[idx_best_fit]
+
+    def fit_params(self, params_init=None, do_print=True, method="batch", max_errors=None):
+        """
+        Fit the Hamiltonian parameters for each state and compute interaction rates.
+
+        :param params_init: Initial parameter estimates (optional). Dictionary mapping each control state to one or
+            several sets of (delta, omega_x, omega_y). The fit then starts from these values only and falls back to the
+            full set of initial values if it fails or if its squared error exceeds max_errors.
+        :param _print: Boolean flag to control the printing of fitting results.
+        :param method: "batch" to fit from all the initial values at once with a vectorized Levenberg-Marquardt,
+            or "sequential" to run curve_fit from each initial value one after the other.
+        :param max_errors: Dictionary mapping each control state to the largest squared error accepted for a fit
+            started from params_init (optional).
+        :return: Self.
+        """
+        if method not in ["batch", "sequential"]:
+            raise ValueError(f"method must be 'batch' or 'sequential', got {method}")
+
+        for st in CONTROL_STATES:
+            fitted = None
+            if params_init is not None:
+                try:
+                    fitted = self._fit_from_inits(self.data_dict[st], np.atleast_2d(params_init[st]), method)
+                except RuntimeError:
+                    # curve_fit did not converge
+                    fitted = None
+                if fitted is not None and max_errors is not None and fitted[1] > max_errors[st]:
+                    fitted = None
+            self.multistart_used[st] = fitted is None
+            if fitted is None:
+                # prepare a set of initial values and fit the model from each of them
+                p0s = self._pick_params_inits(xyz=self.data_dict[st])
+                fitted = self._fit_from_inits(self.data_dict[st], p0s, method)
+
+            self.params_fitted[st], self.fit_errors[st] = fitted
             # for clarity
             self.params_fitted_dict[st] = {nm: p for nm, p in zip(PARAM_NAMES, self.params_fitted[st])}
 
@@ -420,6 +566,108 @@ class CRHamiltonianTomographyAnalysis(CRHamiltonianTomographyFunctions):
         return fig
 
 
+class CRHamiltonianTomographySweep:
+    def __init__(self, ts, data, sweep_values):
+        """
+        CR Hamiltonian Tomography over a sweep of the CR drive (amplitude, phase, ...).
+
+        The fit of each sweep point is warm started from the solutions of the previous points (last solution and its
+        linear extrapolation), and the global multistart of CRHamiltonianTomographyAnalysis is only used for the first
+        point, after a failed point, or when the squared error of the warm started fit degrades.
+
+        :param ts: durations of CR drive.
+        :params data (np.ndarray):
+            A 4-dimensional numpy array (len(sweep_values) x len(ts) x len(TARGET_BASES) x len(CONTROL_STATES)).
+        :param sweep_values: values of the swept parameter.
+        """
+        if data.ndim != 4 or data.shape[0] != len(sweep_values):
+            raise ValueError("Input data must be a 4-dimensional array with len(sweep_values) as first dimension.")
+        self.ts = ts
+        self.data = data
+        self.sweep_values = np.asarray(sweep_values)
+        self.analyses = [None for _ in self.sweep_values]
+        self.interaction_coeffs_MHz = [{p: None for p in PAULI_2Q} for _ in self.sweep_values]
+
+    def _warm_start_inits(self, previous):
+        """
+        Build the initial values of the next sweep point from the fitted parameters of the previous points.
+
+        :param previous: List of the fitted parameters dictionaries of the previous successful points (most recent last).
+        :return: Dictionary mapping each control state to an array of initial values.
+        """
+        params_init = {}
+        for st in CONTROL_STATES:
+            p0s = [previous[-1][st]]
+            if len(previous) > 1:
+                p0s.append(2 * previous[-1][st] - previous[-2][st])
+            params_init[st] = np.array(p0s)
+        return params_init
+
+    def fit_params(self, error_ratio=2.0, method="batch", do_print=True):
+        """
+        Fit the Hamiltonian parameters at every sweep point and compute the interaction rates.
+
+        :param error_ratio: A warm started fit is rejected if its squared error exceeds error_ratio times the squared
+            error of the previous point, in which case the global multistart is used instead.
+        :param method: "batch" or "sequential", see CRHamiltonianTomographyAnalysis.fit_params.
+        :param do_print: Boolean flag to control the printing of fitting results.
+        :return: Self.
+        """
+        previous = []
+        max_errors = None
+        for idx, value in enumerate(self.sweep_values):
+            crht = CRHamiltonianTomographyAnalysis(ts=self.ts, data=self.data[idx, ...])
+            self.analyses[idx] = crht
+            try:
+                crht.fit_params(
+                    params_init=self._warm_start_inits(previous) if previous else None,
+                    do_print=False,
+                    method=method,
+                    max_errors=max_errors,
+                )
+            except Exception as e:
+                # restart the next point from the global multistart
+                print(f"fitting failed at sweep value = {value}: {e}")
+                previous = []
+                max_errors = None
+                continue
+            self.interaction_coeffs_MHz[idx] = crht.interaction_coeffs_MHz
+            previous = previous[-1:] + [crht.params_fitted]
+            max_errors = {st: error_ratio * crht.fit_errors[st] for st in CONTROL_STATES}
+            if do_print:
+                coeffs = ", ".join([f"{op} = {crht.interaction_coeffs_MHz[op]:.3f}" for op in PAULI_2Q])
+                print(f"sweep value = {value}: {coeffs} MHz")
+
+        if do_print:
+            n_multistart = sum([crht.multistart_used[st] for crht in self.analyses if crht for st in CONTROL_STATES])
+            print(
+                f"global multistart used for {n_multistart} out of {len(CONTROL_STATES) * len(self.sweep_values)} fits"
+            )
+
+        return self
+
+    def get_interaction_coeffs(self):
+        """
+        Get the interaction rates of the whole sweep, in the format expected by plot_interaction_coeffs.
+        The coefficients of the failed sweep points are set to nan.
+
+        :return: List of dictionaries of interaction coefficients and the array of sweep values.
+        """
+        coeffs = [
+            {p: np.nan if coeff[p] is None else coeff[p] for p in PAULI_2Q} for coeff in self.interaction_coeffs_MHz
+        ]
+        return coeffs, self.sweep_values
+
+    def plot_interaction_coeffs(self, xlabel="amplitude", fig=None):
+        """
+        Plot the sweep values vs interaction rates.
+
+        :return: The matplotlib figure object containing the plots.
+        """
+        coeffs, xaxis = self.get_interaction_coeffs()
+        return plot_interaction_coeffs(coeffs, xaxis, xlabel=xlabel, fig=fig)
+
+
 def plot_interaction_coeffs(coeffs, xaxis, xlabel="amplitude", fig=None):
     """
     Plot the xaxis (amplitudes or phase) vs interaction rates.
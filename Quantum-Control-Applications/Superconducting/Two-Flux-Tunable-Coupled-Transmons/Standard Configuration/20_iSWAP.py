@@ -33,6 +33,7 @@ from qualang_tools.plot import interrupt_on_close
 from qualang_tools.results import progress_counter
 import numpy as np
 from macros import qua_declaration, multiplexed_readout
+from chevron_analysis import fit_chevron
 
 
 ###################
@@ -150,4 +151,22 @@ else:
     # Close the quantum machines at the end in order to put all flux biases to 0 so that the fridge doesn't heat-up
     qm.close()
 
+    # Fit the chevrons of both qubits jointly to extract the iSWAP gate parameters
+    fit = fit_chevron(4 * ts, amps * const_flux_amp + flux_bias, [I1.T, I2.T], gate="iswap")
+    print(
+        f"iSWAP gate: flux pulse amplitude = {fit['amplitude'] - flux_bias:.5f} +/- {fit['amplitude_err']:.1e} V, "
+        f"duration = {fit['duration']:.1f} +/- {fit['duration_err']:.1f} ns"
+    )
+    plt.figure()
+    plt.suptitle(f"iSWAP chevron fit - flux on qubit {qubit_to_flux_tune}")
+    for i, (data, model) in enumerate(zip([I1.T, I2.T], fit["model"])):
+        for j, (title, values) in enumerate([("data", data), ("fit", model)]):
+            plt.subplot(2, 2, 2 * i + j + 1)
+            plt.pcolor(amps * const_flux_amp + flux_bias, 4 * ts, values.T)
+            plt.plot(fit["amplitude"], fit["duration"], "rx", ms=10)
+            plt.title(f"q{i + 1} - I [V] - {title}")
+            plt.xlabel("Flux amplitude (V)")
+            plt.ylabel("Interaction time (ns)")
+    plt.tight_layout()
+
     # np.savez(save_dir / 'iswap', I1=I1, Q1=Q1, I2=I2, ts=ts, amps=amps)
@@ -9,9 +9,10 @@ By scanning the flux pulse amplitude and duration, the CZ chevron can be obtaine
 CZ gate parameters corresponding to a single oscillation period such that |11> pick up an overall phase of pi (flux
 pulse amplitude and interation time).
 
-This version sweeps the flux pulse duration using the baking tool, which means that the flux pulse can be scanned with
-a 1ns resolution, but must be shorter than ~260ns. If you want to measure longer flux pulse, you can either reduce the
-resolution (do 2ns steps instead of 1ns) or use the 4ns version (CZ.py).
+This version sweeps the flux pulse duration with a 1ns resolution using the baking tool. Only the pulses shorter than
+32ns and the 4 sub-cycle remainders are baked, the longer pulses being played as a real-time stretched constant pulse
+followed by the baked remainder (see play_square_pulse_1ns() in macros.py). The waveform memory thus doesn't depend on
+the flux pulse duration, which can be scanned up to several microseconds.
 
 Prerequisites:
     - Having found the resonance frequency of the resonator coupled to the qubit under study (resonator_spectroscopy).
@@ -33,27 +34,8 @@ from qualang_tools.results import fetching_tool
 from qualang_tools.plot import interrupt_on_close
 from qualang_tools.results import progress_counter
 import numpy as np
-from macros import qua_declaration, multiplexed_readout
-from qualang_tools.bakery import baking
-
-
-##########
-# baking #
-##########
-def baked_waveform(waveform, pulse_duration, flux_qubit):
-    pulse_segments = []  # Stores the baking objects
-    # Create the different baked sequences, each one corresponding to a different truncated duration
-    for i in range(0, pulse_duration + 1):
-        with baking(config, padding_method="right") as b:
-            if i == 0:  # Otherwise, the baking will be empty and will not be created
-                wf = [0.0] * 16
-            else:
-                wf = waveform[:i].tolist()
-            b.add_op("flux_pulse", f"q{flux_qubit}_z", wf)
-            b.play("flux_pulse", f"q{flux_qubit}_z")
-        # Append the baking object in the list to call it from the QUA program
-        pulse_segments.append(b)
-    return pulse_segments
+from macros import qua_declaration, multiplexed_readout, bake_square_pulse_1ns, play_square_pulse_1ns
+from chevron_analysis import fit_chevron
 
 
 ###################
@@ -65,11 +47,8 @@ qubit_to_flux_tune = 1  # Qubit number to flux-tune
 n_avg = 1300  # The number of averages
 amps = np.arange(-0.015, -0.008, 0.0001) / const_flux_amp  # The flux amplitude pre-factor
 
-# FLux pulse waveform generation
-# The variable const_flux_len is defined in the configuration
-flux_waveform = np.array([const_flux_amp] * const_flux_len)
-# Baked flux pulse segments
-square_pulse_segments = baked_waveform(flux_waveform, const_flux_len, qubit_to_flux_tune)
+# Baked flux pulse segments, the maximum flux pulse duration const_flux_len is defined in the configuration
+square_pulse_segments = bake_square_pulse_1ns(config, f"q{qubit_to_flux_tune}_z", const_flux_amp)
 # Flux offset
 flux_bias = config["controllers"]["con1"]["analog_outputs"][
     config["elements"][f"q{qubit_to_flux_tune}_z"]["singleInput"]["port"][1]
@@ -93,10 +72,7 @@ with program() as cz:
                 wait(20 * u.ns)
                 # Play a flux pulse on the qubit with the highest frequency to bring it close to the excited qubit while
                 # varying its amplitude and duration in order to observe the SWAP chevron with 1ns resolution.
-                with switch_(segment):
-                    for j in range(0, const_flux_len + 1):
-                        with case_(j):
-                            square_pulse_segments[j].run(amp_array=[(f"q{qubit_to_flux_tune}_z", a)])
+                play_square_pulse_1ns(square_pulse_segments, segment, f"q{qubit_to_flux_tune}_z", amplitude_scaling=a)
                 align()
                 # Wait some time to ensure that the flux pulse will end before the readout pulse
                 wait(20 * u.ns)
@@ -181,4 +157,22 @@ else:
     # Close the quantum machines at the end in order to put all flux biases to 0 so that the fridge doesn't heat-up
     qm.close()
 
+    # Fit the chevrons of both qubits jointly to extract the CZ gate parameters
+    fit = fit_chevron(xplot, amps * const_flux_amp + flux_bias, [I1, I2], gate="cz")
+    print(
+        f"CZ gate: flux pulse amplitude = {fit['amplitude'] - flux_bias:.5f} +/- {fit['amplitude_err']:.1e} V, "
+        f"duration = {fit['duration']:.1f} +/- {fit['duration_err']:.1f} ns"
+    )
+    plt.figure()
+    plt.suptitle(f"CZ chevron fit - flux on qubit {qubit_to_flux_tune}")
+    for i, (data, model) in enumerate(zip([I1, I2], fit["model"])):
+        for j, (title, values) in enumerate([("data", data), ("fit", model)]):
+            plt.subplot(2, 2, 2 * i + j + 1)
+            plt.pcolor(amps * const_flux_amp + flux_bias, xplot, values.T)
+            plt.plot(fit["amplitude"], fit["duration"], "rx", ms=10)
+            plt.title(f"q{i + 1} - I [V] - {title}")
+            plt.xlabel("Flux amplitude (V)")
+            plt.ylabel("Interaction time (ns)")
+    plt.tight_layout()
+
     # np.savez(save_dir/'cz', I1=I1, Q1=Q1, I2=I2, Q2=Q2, ts=ts, amps=amps)
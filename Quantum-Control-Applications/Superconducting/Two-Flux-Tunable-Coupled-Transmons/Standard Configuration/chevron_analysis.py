@@ -0,0 +1,165 @@
+"""
+Fit of the iSWAP and CZ chevrons to extract the two-qubit gate parameters.
+
+Close to the avoided crossing, the population exchanged between the two coupled levels follows the chevron model
+    P(a, t) = c + A * J^2 / f^2 * (1 - exp(-gamma * t) * cos(2 * pi * f * (t + t0))) / 2,
+    with f(a) = sqrt(J^2 + (kappa * (a - a0))^2),
+where a is the flux pulse amplitude, t the flux pulse duration, a0 the amplitude of the resonance, J the exchange
+frequency on resonance, kappa the detuning slope versus flux amplitude, t0 a timing offset (pulse rise and fall) and
+gamma a decay rate.
+
+The oscillation frequency and contrast of every amplitude row are first estimated at once with a zero-padded FFT, and
+a parabolic fit of f(a)^2 seeds a0, kappa and J. All the measured maps (e.g. I1 and I2) are then fitted jointly with a
+single nonlinear least-squares solve using the analytic Jacobian, the maps sharing the chevron parameters and having
+their own offset c and contrast A.
+The iSWAP gate corresponds to a full exchange (t = 1 / (2J) - t0) and the CZ gate to a full oscillation
+(t = 1 / J - t0) at the resonance amplitude a0.
+"""
+
+import numpy as np
+from scipy.optimize import least_squares
+
+# Number of exchange half-periods needed for each gate
+GATE_HALF_PERIODS = {"iswap": 1, "cz": 2}
+_SHARED = ["a0", "kappa", "J", "t0", "gamma"]
+
+
+def chevron_model(ts, amps, a0, kappa, J, t0=0.0, gamma=0.0, c=0.0, A=1.0):
+    """Chevron model defined as c + A * J^2 / f^2 * (1 - exp(-gamma * t) * cos(2 * pi * f * (t + t0))) / 2.
+
+    :param ts: flux pulse durations in ns (1D array)
+    :param amps: flux pulse amplitudes in V (1D array)
+    :param a0: amplitude of the resonance in V
+    :param kappa: detuning slope in GHz/V
+    :param J: exchange frequency on resonance in GHz
+    :param t0: timing offset in ns
+    :param gamma: decay rate in 1/ns
+    :param c: offset
+    :param A: contrast
+    :return: numpy array of shape (len(amps), len(ts))
+    """
+    detuning = kappa * (np.asarray(amps)[:, None] - a0)
+    f2 = J**2 + detuning**2
+    ts = np.asarray(ts)[None, :]
+    return c + A * J**2 / f2 * (1 - np.exp(-gamma * ts) * np.cos(2 * np.pi * np.sqrt(f2) * (ts + t0))) / 2
+
+
+def _fft_seed(ts, amps, data, oversampling=8):
+    """Seed the chevron parameters from the dominant frequency and contrast of every amplitude row of every map."""
+    dt = ts[1] - ts[0]
+    rows = data - data.mean(axis=-1, keepdims=True)
+    n_fft = oversampling * 2 ** int(np.ceil(np.log2(len(ts))))
+    spectrum = np.abs(np.fft.rfft(rows * np.hanning(len(ts)), n=n_fft, axis=-1))
+    spectrum[..., 0] = 0
+    # Spectra of all the maps are summed, the chevron being common to all of them
+    power = np.sum(spectrum**2, axis=0)
+    freqs = np.fft.rfftfreq(n_fft, dt)[np.argmax(power, axis=-1)]
+    weights = np.sqrt(power.max(axis=-1))
+    # f(a)^2 = kappa^2 * a^2 - 2 * kappa^2 * a0 * a + kappa^2 * a0^2 + J^2
+    p = np.polyfit(amps, freqs**2, 2, w=weights)
+    best = np.argmax(weights)
+    if p[0] > 0 and amps.min() <= -p[1] / (2 * p[0]) <= amps.max():
+        a0 = -p[1] / (2 * p[0])
+        kappa = np.sqrt(p[0])
+        J = np.sqrt(max(np.polyval(p, a0), freqs[best] ** 2 / 4))
+    else:
+        a0, kappa, J = amps[best], 1 / (np.ptp(amps) * dt), freqs[best]
+    # Offset from the first points and contrast from the mean of the resonant row of each map
+    row = np.argmin(np.abs(amps - a0))
+    c = data[:, row, :2].mean(axis=-1)
+    A = 2 * (data[:, row].mean(axis=-1) - c)
+    return np.concatenate([[a0, kappa, J, 0.0, 0.0], c, A])
+
+
+def _residuals_and_jacobian(p, ts, amps, data):
+    n_maps = len(data)
+    a0, kappa, J, t0, gamma = p[:5]
+    c, A = p[5 : 5 + n_maps, None, None], p[5 + n_maps :, None, None]
+    da = amps[:, None] - a0
+    d = kappa * da
+    f2 = J**2 + d**2
+    f = np.sqrt(f2)
+    r = J**2 / f2
+    tt = ts[None, :] + t0
+    phi = 2 * np.pi * f * tt
+    e = np.exp(-gamma * ts)[None, :]
+    g = (1 - e * np.cos(phi)) / 2
+    res = c + A * r * g - data
+    # Derivatives of the normalized chevron r * g
+    dg_df = np.pi * tt * e * np.sin(phi)
+    dJ = 2 * J * d**2 / f2**2 * g + r * dg_df * J / f
+    dd = -2 * J**2 * d / f2**2 * g + r * dg_df * d / f
+    shared = np.stack(
+        [-kappa * dd, da * dd, dJ, r * np.pi * f * e * np.sin(phi), r * ts * e * np.cos(phi) / 2], axis=-1
+    )
+    jac = np.zeros(data.shape + (len(p),))
+    jac[..., :5] = A[..., None] * shared
+    for i in range(n_maps):
+        jac[i, ..., 5 + i] = 1
+        jac[i, ..., 5 + n_maps + i] = r * g
+    return res.ravel(), jac.reshape(res.size, len(p))
+
+
+def fit_chevron(ts, amps, data, gate="cz"):
+    """Fit one or several chevron maps jointly and derive the gate parameters with their uncertainties.
+
+    :param ts: flux pulse durations in ns (1D array with a constant step)
+    :param amps: flux pulse amplitudes in V (1D array)
+    :param data: chevron map of shape (len(amps), len(ts)), or list of maps fitted jointly (e.g. [I1, I2])
+    :param gate: "cz" or "iswap", to derive the gate duration from the exchange frequency
+    :return: dictionary with the gate "amplitude" and "duration" and their uncertainties "amplitude_err" and
+        "duration_err", the fitted "params" and their "errors" (dictionaries), the fitted "model" (same shape as data)
+        and the root mean square of the residuals "rms_residuals"
+    """
+    ts = np.asarray(ts, dtype=float)
+    amps = np.asarray(amps, dtype=float)
+    data = np.asarray(data, dtype=float)
+    single_map = data.ndim == 2
+    data = data[None] if single_map else data
+    if data.shape[1:] != (len(amps), len(ts)):
+        raise ValueError(f"The chevron maps must have the shape (len(amps), len(ts)) = {(len(amps), len(ts))}.")
+    # Amplitudes are centered and scaled internally so that all the parameters are of order one
+    center, scale = amps.mean(), np.ptp(amps) / 2
+    x = (amps - center) / scale
+    p0 = _fft_seed(ts, x, data)
+
+    def fun(p):
+        return _residuals_and_jacobian(p, ts, x, data)[0]
+
+    def jac(p):
+        return _residuals_and_jacobian(p, ts, x, data)[1]
+
+    sol = least_squares(fun, p0, jac=jac, method="lm", x_scale="jac")
+    p = sol.x
+    p[1:3] = np.abs(p[1:3])  # the model only depends on kappa^2 and J^2
+    # Covariance of the parameters from the Jacobian at the optimum
+    dof = max(sol.fun.size - len(p), 1)
+    cov = np.linalg.pinv(sol.jac.T @ sol.jac) * np.sum(sol.fun**2) / dof
+    # Back to the physical amplitude units
+    units = np.ones(len(p))
+    units[0], units[1] = scale, 1 / scale
+    p_phys = p * units
+    p_phys[0] += center
+    cov = cov * np.outer(units, units)
+    err = np.sqrt(np.diag(cov))
+
+    n_maps = len(data)
+    names = _SHARED + [f"c{i}" for i in range(n_maps)] + [f"A{i}" for i in range(n_maps)]
+    n_half = GATE_HALF_PERIODS[gate.lower()]
+    J, t0 = p_phys[2], p_phys[3]
+    duration = n_half / (2 * J) - t0
+    grad = np.zeros(len(p))
+    grad[2], grad[3] = -n_half / (2 * J**2), -1
+    model = np.stack(
+        [chevron_model(ts, amps, *p_phys[:5], p_phys[5 + i], p_phys[5 + n_maps + i]) for i in range(n_maps)]
+    )
+    return {
+        "amplitude": p_phys[0],
+        "amplitude_err": err[0],
+        "duration": duration,
+        "duration_err": np.sqrt(grad @ cov @ grad),
+        "params": dict(zip(names, p_phys)),
+        "errors": dict(zip(names, err)),
+        "model": model[0] if single_map else model,
+        "rms_residuals": np.sqrt(np.mean(sol.fun**2)),
+    }
@@ -7,6 +7,7 @@ from scipy import signal
 import scipy.optimize
 from qualang_tools.bakery import baking
 from filter_functions import expdecay, filter_calc
+from streaming_cryoscope import StreamingCryoscope
 
 ##############################
 # Program-specific variables #
@@ -58,6 +59,11 @@ step_response = [1.0] * const_flux_len
 xplot = np.arange(0, total_len + 0.1, 1)
 # Number of averages
 n_avg = 1e3
+# Number of averages per chunk sent to the streaming analysis
+n_chunk = 50
+# The acquisition stops once the fitted filter parameters vary by less than rtol during `patience` consecutive chunks
+rtol = 0.02
+patience = 3
 
 ###################
 # The QUA program #
@@ -121,7 +127,9 @@ with program() as cryoscope:
         save(n, n_st)
 
     with stream_processing():
-        state_st.boolean_to_int().buffer(2).buffer(total_len + 1).average().save("state")
+        state_st.boolean_to_int().buffer(2).buffer(total_len + 1).buffer(n_chunk).map(FUNCTIONS.average(0)).save_all(
+            "state"
+        )
         n_st.save("iteration")
 
 #####################################
@@ -133,50 +141,65 @@ qm = qmm.open_qm(config)
 # Execute QUA program
 job = qm.execute(cryoscope)
 # Get results from QUA program
-results = fetching_tool(job, data_list=["state", "iteration"], mode="live")
+results = fetching_tool(job, data_list=["iteration"], mode="live")
+state_handle = job.result_handles.get("state")
+# Streaming analysis of the chunks of averaged states
+pulse_samples = slice(zeros_before_pulse, zeros_before_pulse + const_flux_len)
+t_pulse = xplot[pulse_samples] - zeros_before_pulse  # Time from the rising edge of the flux pulse
+cryoscope_analysis = StreamingCryoscope(pulse_samples, rtol=rtol, patience=patience, min_shots=4 * n_chunk)
 # Live plotting
 fig = plt.figure()
 interrupt_on_close(fig, job)  # Interrupts the job when closing the figure
-while results.is_processing():
-    # Fetch results
-    state, iteration = results.fetch_all()
+while results.is_processing() or cryoscope_analysis.nb_of_chunks < state_handle.count_so_far():
+    # Fetch the new chunks
+    iteration = results.fetch_all()[0]
+    nb_of_chunks = state_handle.count_so_far()
+    if nb_of_chunks == cryoscope_analysis.nb_of_chunks:
+        plt.pause(0.1)
+        continue
+    for state in state_handle.fetch(slice(cryoscope_analysis.nb_of_chunks, nb_of_chunks))["value"]:
+        # Bloch vector projections along X and Y
+        cryoscope_analysis.add_chunk(state[:, 0] * 2 - 1, state[:, 1] * 2 - 1, n_chunk)
     # Progress bar
     progress_counter(iteration, n_avg, start_time=results.get_start_time())
+    # Stop the acquisition once the filter parameters have converged
+    if cryoscope_analysis.done and results.is_processing():
+        job.halt()
+        print(f"\nFilter parameters converged after {cryoscope_analysis.nb_of_shots} averages")
     # Derive results
-    Sxx = state[:, 0] * 2 - 1  # Bloch vector projection along X
-    Syy = state[:, 1] * 2 - 1  # Bloch vector projection along Y
-    S = Sxx + 1j * Syy  # Bloch vector
-    # Qubit phase
-    phase = np.unwrap(np.angle(S))
-    phase = phase - phase[-1]
-    # Qubit detuning
-    detuning = signal.savgol_filter(
-        phase[zeros_before_pulse : const_flux_len + zeros_before_pulse] / 2 / np.pi, 21, 2, deriv=1, delta=0.001
-    )
-    # Step response
-    step_response_freq = detuning / np.average(detuning[-int(const_flux_len / 4)])
-    step_response_volt = np.sqrt(detuning / np.average(detuning[-int(const_flux_len / 4)]))
+    (Sxx, Syy), (dSxx, dSyy) = cryoscope_analysis.bloch_vector[:, 0], cryoscope_analysis.bloch_vector_err[:, 0]
+    detuning, ddetuning = [x[0] for x in cryoscope_analysis.detuning]
+    step_response_volt, dstep_response_volt = [x[0] for x in cryoscope_analysis.step_response]
     # plot results
     plt.subplot(121)
     plt.cla()
-    plt.plot(xplot, Sxx, ".-", label="Sxx")
-    plt.plot(xplot, Syy, ".-", label="Syy")
+    plt.errorbar(xplot, Sxx, dSxx, fmt=".-", label="Sxx")
+    plt.errorbar(xplot, Syy, dSyy, fmt=".-", label="Syy")
     plt.xlabel("Flux pulse duration [ns]")
     plt.ylabel("Bloch vector components")
-    plt.title("Cryoscope")
+    plt.title(f"Cryoscope - {cryoscope_analysis.nb_of_shots} averages")
     plt.legend()
     plt.subplot(122)
     plt.cla()
-    plt.plot(xplot[zeros_before_pulse : const_flux_len + zeros_before_pulse], detuning, ".-", label="Pulse")
+    plt.errorbar(xplot[pulse_samples], detuning, ddetuning, fmt=".-", label="Pulse")
     plt.title("Square pulse response")
     plt.xlabel("Flux pulse duration [ns]")
     plt.ylabel("Qubit detuning [MHz]")
     plt.legend()
+    plt.pause(0.1)
 
 
+if cryoscope_analysis.nb_of_chunks == 0:
+    raise RuntimeError("The job ended before the first chunk of averages was received, there is no data to fit.")
+
 ## Fit step response with exponential
+# The streaming fit is used as initial guess and the points are weighted by their uncertainties
 [A, tau], _ = scipy.optimize.curve_fit(
-    expdecay, xplot[zeros_before_pulse : const_flux_len + zeros_before_pulse], step_response_volt
+    expdecay,
+    t_pulse,
+    step_response_volt / cryoscope_analysis.fit["gain"][0],
+    p0=[cryoscope_analysis.fit["amplitudes"][0, 0], cryoscope_analysis.fit["taus"][0, 0]],
+    sigma=dstep_response_volt,
 )
 print(f"A: {A}\ntau: {tau}")
 
@@ -188,17 +211,17 @@ print(f"FIR: {fir}\nIIR: {iir}")
 # Ideal response
 pulse = np.array([1.0] * const_flux_len)
 # Response without filter
-no_filter = expdecay(xplot, a=A, t=tau)
-# Response with filters
-with_filter = no_filter * signal.lfilter(fir, [1, iir[0]], pulse)  # Output filter , DAC Output
+no_filter = expdecay(t_pulse, a=A, t=tau)
+# Response with filters, the IIR tap having the OPX sign convention y[n] = x[n] + iir * y[n - 1]
+with_filter = no_filter * signal.lfilter(fir, [1, -iir[0]], pulse)  # Output filter , DAC Output
 
 # Plot all data
 plt.rcParams.update({"font.size": 13})
 plt.figure()
 plt.suptitle("Cryoscope with filter implementation")
 plt.subplot(121)
-plt.plot(xplot, step_response_volt, "o-", label="Data")
-plt.plot(xplot, expdecay(xplot, A, tau), label="Fit")
+plt.errorbar(t_pulse, step_response_volt, dstep_response_volt, fmt="o-", label="Data")
+plt.plot(t_pulse, expdecay(t_pulse, A, tau), label="Fit")
 plt.text(100, 0.95, f"A = {A:.2f}\ntau = {tau:.2f}", bbox=dict(boxstyle="round", facecolor="wheat", alpha=0.5))
 plt.axhline(y=1.01)
 plt.axhline(y=0.99)
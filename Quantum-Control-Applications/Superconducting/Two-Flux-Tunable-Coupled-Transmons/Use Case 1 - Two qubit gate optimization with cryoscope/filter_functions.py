@@ -1,4 +1,31 @@
+"""
+Identification of the OPX digital filters (IIR and FIR) compensating the distortions of the flux lines.
+
+The step responses measured with the cryoscope protocol are fitted with a multi-exponential model
+s * (1 + a1 * exp(-t / tau1) + ... + an * exp(-t / taun)) in a single vectorized least-squares solve over all the flux
+lines: the decay times are first picked on a grid for which the amplitudes are linear, then refined with a batched
+Levenberg-Marquardt. Each exponential is compensated by one IIR (feedback) tap and two FIR (feedforward) taps, and the
+remaining short time distortions can be corrected with additional FIR taps fitted by linear least-squares.
+The taps are then quantized and truncated according to the OPX constraints and validated by simulating the corrected
+step responses.
+
+The feedback taps follow the OPX convention, where each tap b implements y[n] = x[n] + b * y[n - 1], the different
+taps being cascaded, as in qualang_tools.digital_filters.
+"""
+
+import itertools
+import warnings
 import numpy as np
+from scipy import signal
+
+# Constraints of the OPX digital filters
+OPX_FILTER_CONSTRAINTS = {
+    "feedforward_max": 2 - 2**-16,
+    "feedback_max": 1 - 2**-20,
+    "feedforward_resolution": 2**-16,
+    "feedback_resolution": 2**-20,
+    "feedforward_length": lambda nb_of_feedback_taps: 44 - 7 * nb_of_feedback_taps,
+}
 
 
 # Exponential decay
@@ -17,6 +44,9 @@ def expdecay(x, a, t):
 def exponential_correction(A, tau, Ts=1e-9):
     """Derive FIR and IIR filter taps based on a the exponential coefficients A and tau from 1 + a * np.exp(-x / t).
 
+    The IIR tap follows the OPX convention y[n] = x[n] + b * y[n - 1], as exponential_filter_taps, so that it can be
+    used as is in the configuration. The corresponding scipy.signal.lfilter denominator is [1, -b].
+
     :param A: amplitude of the exponential decay
     :param tau: decay time of the exponential decay
     :param Ts: sampling period. Default is 1e-9
@@ -27,7 +57,7 @@ def exponential_correction(A, tau, Ts=1e-9):
     k2 = Ts - 2 * tau * (A + 1)
     c1 = Ts + 2 * tau
     c2 = Ts - 2 * tau
-    feedback_tap = k2 / k1
+    feedback_tap = -k2 / k1
     feedforward_taps = np.array([c1, c2]) / k1
     return feedforward_taps, feedback_tap
 
@@ -37,7 +67,7 @@ def filter_calc(exponential):
     """Derive FIR and IIR filter taps based on a list of exponential coefficients.
 
     :param exponential: exponential coefficients defined as [(A1, tau1), (A2, tau2)]
-    :return: FIR and IIR taps as [fir], [iir]
+    :return: FIR and IIR taps as [fir], [iir], the IIR taps following the OPX convention (see exponential_correction)
     """
     # Initialization based on the number of exponential coefficients
     b = np.zeros((2, len(exponential)))
@@ -54,3 +84,226 @@ def filter_calc(exponential):
         feedforward_taps = 2 * feedforward_taps / max(feedforward_taps)
 
     return feedforward_taps, feedback_taps
+
+
+###########################
+# Batch filter estimation #
+###########################
+def multi_expdecay(x, amplitudes, taus, gain=1.0):
+    """Multi-exponential decay defined as gain * (1 + a1 * np.exp(-x / t1) + ... + an * np.exp(-x / tn)).
+
+    :param x: numpy array for the time vector in ns
+    :param amplitudes: exponential amplitudes, array of shape (..., n)
+    :param taus: exponential decay times in ns, array of shape (..., n)
+    :param gain: gain of the step response, float or array of shape (...)
+    :return: numpy array of shape (..., len(x)) for the multi-exponential decay
+    """
+    amplitudes = np.asarray(amplitudes, dtype=float)[..., None]
+    taus = np.asarray(taus, dtype=float)[..., None]
+    return np.asarray(gain)[..., None] * (1 + np.sum(amplitudes * np.exp(-x / taus), axis=-2))
+
+
+def fit_multi_exponential(ts, step_responses, nb_of_exponentials=1, tau_grid=None, max_iter=50):
+    """Fit the step responses of several flux lines with a multi-exponential decay (see multi_expdecay).
+
+    :param ts: numpy array for the time vector in ns, starting at the rising edge of the step
+    :param step_responses: step responses, array of shape (nb_of_lines, len(ts)) or (len(ts),)
+    :param nb_of_exponentials: number of exponential decays per flux line
+    :param tau_grid: decay times in ns used to initialize the fit. Default is 40 values log-spaced over the time window
+    :param max_iter: maximum number of Levenberg-Marquardt iterations
+    :return: dictionary with the fitted "gain" (nb_of_lines,), "amplitudes" and "taus" (nb_of_lines, nb_of_exponentials)
+        and the root mean square of the residuals "rms_residuals" (nb_of_lines,)
+    """
+    ts = np.asarray(ts, dtype=float)
+    y = np.atleast_2d(np.asarray(step_responses, dtype=float))
+    n_exp = nb_of_exponentials
+    if tau_grid is None:
+        dt = np.min(np.diff(ts))
+        tau_grid = np.geomspace(dt, 2 * (ts[-1] - ts[0]), 40)
+    # Grid initialization: for fixed decay times, the model c0 + sum(ck * exp(-t / tauk)) is linear
+    combos = np.array(list(itertools.combinations(tau_grid, n_exp)))
+    basis = np.concatenate([np.ones((len(combos), len(ts), 1)), np.exp(-ts[None, :, None] / combos[:, None, :])], 2)
+    coeffs = np.matmul(np.linalg.pinv(basis), y.T)  # (combos, 1 + n_exp, lines)
+    costs = ((np.matmul(basis, coeffs) - y.T) ** 2).sum(axis=1)  # (combos, lines)
+    best = np.argmin(costs, axis=0)
+    lines = np.arange(len(y))
+    # Parameters: c0, c1..cn, log(tau1)..log(taun)
+    params = np.concatenate([coeffs[best, :, lines], np.log(combos[best])], axis=1)
+
+    def evaluate(p):
+        c0, c, taus = p[:, :1], p[:, 1 : n_exp + 1], np.exp(p[:, n_exp + 1 :])
+        decays = np.exp(-ts[None, None, :] / taus[:, :, None])  # (lines, n_exp, T)
+        res = c0 + np.sum(c[:, :, None] * decays, axis=1) - y[: len(p)]
+        jac = np.concatenate(
+            [np.ones((len(p), 1, len(ts))), decays, c[:, :, None] * decays * ts / taus[:, :, None]], axis=1
+        )
+        return res, (res**2).sum(axis=1), jac
+
+    # Batched Levenberg-Marquardt refinement
+    log_tau_mid = np.log(np.sqrt(tau_grid[0] * tau_grid[-1]))
+    log_tau_span = np.log(np.sqrt(tau_grid[-1] / tau_grid[0]))
+    res, cost, jac = evaluate(params)
+    lam = np.full(len(y), 1e-3)
+    for _ in range(max_iter):
+        jtj = np.matmul(jac, jac.transpose(0, 2, 1))
+        grad = np.matmul(jac, res[:, :, None])
+        damping = lam[:, None, None] * (np.eye(len(params[0])) * jtj + 1e-12 * np.eye(len(params[0])))
+        step = -np.linalg.solve(jtj + damping, grad)[:, :, 0]
+        res_new, cost_new, jac_new = evaluate(params + step)
+        # the decay times are kept within the range of the grid to avoid degenerate fits
+        accept = (cost_new < cost) & np.all(
+            np.abs(params[:, n_exp + 1 :] + step[:, n_exp + 1 :] - log_tau_mid) < log_tau_span, axis=1
+        )
+        params[accept] += step[accept]
+        res[accept], cost[accept], jac[accept] = res_new[accept], cost_new[accept], jac_new[accept]
+        lam = np.where(accept, lam / 3, lam * 4)
+        if np.all(lam > 1e8):
+            break
+
+    gain = params[:, 0]
+    order = np.argsort(params[:, n_exp + 1 :], axis=1)
+    return {
+        "gain": gain,
+        "amplitudes": np.take_along_axis(params[:, 1 : n_exp + 1] / gain[:, None], order, axis=1),
+        "taus": np.take_along_axis(np.exp(params[:, n_exp + 1 :]), order, axis=1),
+        "rms_residuals": np.sqrt(cost / len(ts)),
+    }
+
+
+def exponential_filter_taps(amplitudes, taus, Ts=1):
+    """Derive the FIR and IIR taps compensating multi-exponential decays, for several flux lines at once.
+
+    :param amplitudes: exponential amplitudes, array of shape (nb_of_lines, nb_of_exponentials)
+    :param taus: exponential decay times in ns, array of shape (nb_of_lines, nb_of_exponentials)
+    :param Ts: sampling period in ns. Default is 1
+    :return: feedforward taps of shape (nb_of_lines, nb_of_exponentials + 1) and feedback taps of shape
+        (nb_of_lines, nb_of_exponentials)
+    """
+    amplitudes = np.atleast_2d(amplitudes)
+    taus = np.atleast_2d(taus)
+    k1 = Ts + 2 * taus * (amplitudes + 1)
+    k2 = Ts - 2 * taus * (amplitudes + 1)
+    feedback = -k2 / k1
+    feedforward = np.ones((len(taus), 1))
+    for i in range(taus.shape[1]):
+        b = np.stack([Ts + 2 * taus[:, i], Ts - 2 * taus[:, i]], axis=1) / k1[:, i : i + 1]
+        # Polynomial product of the feedforward taps of each line
+        feedforward = np.stack([np.convolve(f, bb) for f, bb in zip(feedforward, b)])
+    return feedforward, feedback
+
+
+def apply_filter_taps(responses, feedforward, feedback):
+    """Simulate the OPX digital filters on the given responses (or waveforms) of several flux lines.
+
+    :param responses: responses to filter, array of shape (nb_of_lines, nb_of_samples)
+    :param feedforward: feedforward taps of each line, array-like of shape (nb_of_lines, nb_of_feedforward_taps)
+    :param feedback: feedback taps of each line, array-like of shape (nb_of_lines, nb_of_feedback_taps)
+    :return: filtered responses of shape (nb_of_lines, nb_of_samples)
+    """
+    filtered = np.array(np.atleast_2d(responses), dtype=float)
+    for i in range(len(filtered)):
+        filtered[i] = signal.lfilter(feedforward[i], [1.0], filtered[i])
+        for b in feedback[i]:
+            filtered[i] = signal.lfilter([1.0], [1.0, -b], filtered[i])
+    return filtered
+
+
+def fit_fir_taps(corrected_responses, nb_of_taps, regularization=1e-6):
+    """Fit the FIR taps bringing partially corrected step responses to an ideal unit step, by linear least-squares.
+
+    :param corrected_responses: step responses normalized to 1 at long times, array of shape (nb_of_lines, nb_of_samples)
+    :param nb_of_taps: number of FIR taps
+    :param regularization: Tikhonov regularization relative to the trace of the normal matrix
+    :return: FIR taps of shape (nb_of_lines, nb_of_taps)
+    """
+    r = np.atleast_2d(corrected_responses)
+    n = r.shape[1]
+    # Convolution matrices R[line, t, j] = r[line, t - j]
+    idx = np.arange(n)[:, None] - np.arange(nb_of_taps)[None, :]
+    conv = np.where(idx >= 0, r[:, np.clip(idx, 0, None)], 0.0)
+    conv_t = conv.transpose(0, 2, 1)
+    normal = np.matmul(conv_t, conv)
+    normal += regularization * np.trace(normal, axis1=1, axis2=2)[:, None, None] / nb_of_taps * np.eye(nb_of_taps)
+    return np.linalg.solve(normal, conv_t.sum(axis=2)[:, :, None])[:, :, 0]
+
+
+def quantize_filter_taps(feedforward, feedback, constraints=None):
+    """Format the filter taps of one flux line according to the OPX constraints: the feedforward taps are truncated
+    to the maximum length, scaled down if they exceed the maximum value, and both sets of taps are rounded to the
+    hardware resolution.
+
+    :param feedforward: feedforward taps (1D array)
+    :param feedback: feedback taps (1D array)
+    :param constraints: dictionary of constraints, default is OPX_FILTER_CONSTRAINTS
+    :return: feedforward taps, feedback taps and the scaling applied to the feedforward taps (the flux pulse amplitude
+        is reduced by this factor)
+    """
+    constraints = OPX_FILTER_CONSTRAINTS if constraints is None else constraints
+    feedback = np.clip(feedback, -constraints["feedback_max"], constraints["feedback_max"])
+    max_length = constraints["feedforward_length"](len(feedback))
+    if len(feedforward) > max_length:
+        removed = np.abs(np.sum(feedforward[max_length:])) / np.abs(np.sum(feedforward))
+        if removed > 0.02:
+            warnings.warn(f"{removed * 100:.1f}% of the feedforward taps sum removed to fit in {max_length} taps.")
+        feedforward = feedforward[:max_length]
+    scaling = min(1.0, constraints["feedforward_max"] / np.max(np.abs(feedforward)))
+    # With feedback taps close to 1, the DC gain is very sensitive to the sum of the feedforward taps, so the rounding
+    # error of each tap is carried over to the next one to keep the sum unchanged
+    scaled = feedforward * scaling / constraints["feedforward_resolution"]
+    feedforward = np.round(np.cumsum(scaled))
+    feedforward = np.diff(feedforward, prepend=0.0) * constraints["feedforward_resolution"]
+    feedback = np.round(feedback / constraints["feedback_resolution"]) * constraints["feedback_resolution"]
+    return feedforward, feedback, scaling
+
+
+def identify_flux_filters(ts, step_responses, nb_of_exponentials=1, nb_of_fir_taps=0, constraints=None):
+    """Derive the OPX digital filters compensating the measured step responses of several flux lines at once.
+
+    The step responses are fitted with a multi-exponential decay, each exponential being compensated by an IIR tap.
+    Optional FIR taps then correct the remaining distortions of the measured responses. The taps are formatted
+    according to the OPX constraints and validated by filtering the measured step responses.
+
+    :param ts: numpy array for the time vector in ns (integers), starting at the rising edge of the step
+    :param step_responses: step responses, array of shape (nb_of_lines, len(ts)) or (len(ts),)
+    :param nb_of_exponentials: number of exponential decays per flux line
+    :param nb_of_fir_taps: number of additional FIR taps fitted on the measured responses (0 to disable)
+    :param constraints: dictionary of constraints, default is OPX_FILTER_CONSTRAINTS
+    :return: dictionary with, for each flux line, the "feedforward" and "feedback" taps (lists), the fitted "gain",
+        "amplitudes" and "taus", the "scaling" of the feedforward taps, the "corrected" step responses and the root mean
+        square deviation from the ideal step before ("rms_error_before") and after ("rms_error_after") correction
+    """
+    ts = np.asarray(ts, dtype=float)
+    y = np.atleast_2d(np.asarray(step_responses, dtype=float))
+    fit = fit_multi_exponential(ts, y, nb_of_exponentials)
+    feedforward, feedback = exponential_filter_taps(fit["amplitudes"], fit["taus"])
+    # The filters are applied from the rising edge with a 1ns sampling period, so the responses are interpolated if
+    # sampled more coarsely and completed with the fitted model if they start after the rising edge
+    ts_1ns = np.arange(0, ts[-1] + 1)
+    model = multi_expdecay(ts_1ns, fit["amplitudes"], fit["taus"])
+    normalized = np.stack([np.interp(ts_1ns, ts, line) for line in y / fit["gain"][:, None]])
+    normalized[:, ts_1ns < ts[0]] = model[:, ts_1ns < ts[0]]
+    if nb_of_fir_taps > 0:
+        fir = fit_fir_taps(apply_filter_taps(normalized, feedforward, feedback), nb_of_fir_taps)
+        feedforward = np.stack([np.convolve(f, h) for f, h in zip(feedforward, fir)])
+
+    results = {key: [] for key in ["feedforward", "feedback", "scaling"]}
+    for ff, fb in zip(feedforward, feedback):
+        for key, value in zip(results, quantize_filter_taps(ff, fb, constraints)):
+            results[key].append(value)
+    corrected = apply_filter_taps(normalized, results["feedforward"], results["feedback"])
+    corrected = corrected[:, np.searchsorted(ts_1ns, ts)] / np.array(results["scaling"])[:, None]
+    rms_error_before = np.sqrt(np.mean((y / fit["gain"][:, None] - 1) ** 2, axis=1))
+    rms_error_after = np.sqrt(np.mean((corrected - 1) ** 2, axis=1))
+    for line in np.flatnonzero(rms_error_after > rms_error_before):
+        warnings.warn(f"The filters derived for the step response {line} do not improve it.")
+    return {
+        "feedforward": [[float(x) for x in ff] for ff in results["feedforward"]],
+        "feedback": [[float(x) for x in fb] for fb in results["feedback"]],
+        "scaling": np.array(results["scaling"]),
+        "gain": fit["gain"],
+        "amplitudes": fit["amplitudes"],
+        "taus": fit["taus"],
+        "corrected": corrected * fit["gain"][:, None],
+        "rms_error_before": rms_error_before,
+        "rms_error_after": rms_error_after,
+    }
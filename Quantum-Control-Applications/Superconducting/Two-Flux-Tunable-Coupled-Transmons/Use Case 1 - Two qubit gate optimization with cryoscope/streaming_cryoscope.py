@@ -0,0 +1,160 @@
+"""
+Incremental cryoscope analysis.
+
+Instead of waiting for all the averages, the cryoscope data is consumed chunk by chunk while the QUA program is running.
+After each chunk, the Bloch vector, the qubit phase, the detuning and the step response are updated together with their
+statistical uncertainties, and the step response is fitted with the multi-exponential model of filter_functions.py.
+The acquisition can be stopped as soon as the fitted filter parameters of all the flux lines have stopped moving.
+
+The chunks are averages over a number of shots of the Bloch vector projections along X and Y. With state
+discrimination (projective=True), the uncertainty of each projection follows from its mean value; with demodulated I/Q
+data normalized to Bloch projections (projective=False), it is estimated from the spread between the chunks.
+"""
+
+import numpy as np
+from scipy import signal
+from filter_functions import fit_multi_exponential
+
+
+class StreamingCryoscope:
+    def __init__(
+        self,
+        pulse,
+        nb_of_exponentials=1,
+        window_length=21,
+        polyorder=2,
+        projective=True,
+        rtol=0.02,
+        patience=3,
+        min_shots=100,
+    ):
+        """Incremental cryoscope analyzer for one or several flux lines.
+
+        :param pulse: slice selecting the samples, along the flux pulse duration axis, during which the flux pulse is on
+        :param nb_of_exponentials: number of exponential decays fitted on the step response of each flux line
+        :param window_length: window length of the Savitzky-Golay derivative of the phase
+        :param polyorder: polynomial order of the Savitzky-Golay derivative of the phase
+        :param projective: True if the data comes from state discrimination, False for normalized I/Q data
+        :param rtol: relative change of the fitted parameters between two chunks below which a flux line is stable
+        :param patience: number of consecutive stable chunks after which a flux line has converged
+        :param min_shots: minimum number of shots before declaring convergence
+        """
+        self.pulse = pulse
+        self.nb_of_exponentials = nb_of_exponentials
+        self.window_length = window_length
+        self.polyorder = polyorder
+        self.projective = projective
+        self.rtol = rtol
+        self.patience = patience
+        self.min_shots = min_shots
+        # delta = 0.001 gives the detuning in MHz for a time axis in ns
+        self._savgol = dict(window_length=window_length, polyorder=polyorder, deriv=1, delta=0.001)
+        self.nb_of_chunks = 0
+        self.nb_of_shots = 0
+        self._sums = None
+        self.fit = None
+        self.fit_history = []
+        self.stable_chunks = None
+
+    def add_chunk(self, sxx, syy, nb_of_shots):
+        """Add a chunk of data and update all the estimates.
+
+        :param sxx: Bloch vector projection along X averaged over the chunk, array of shape (nb_of_lines, nb_of_points)
+            or (nb_of_points,)
+        :param syy: Bloch vector projection along Y averaged over the chunk, same shape as sxx
+        :param nb_of_shots: number of shots averaged in the chunk
+        :return: the analyzer itself
+        """
+        chunk = np.stack([np.atleast_2d(sxx), np.atleast_2d(syy)]).astype(float)
+        if self._sums is None:
+            self._sums = np.zeros((2,) + chunk.shape)
+            self.stable_chunks = np.zeros(chunk.shape[1], dtype=int)
+        # Weighted running sums of the chunk averages and of their squares
+        self._sums[0] += nb_of_shots * chunk
+        self._sums[1] += nb_of_shots * chunk**2
+        self.nb_of_chunks += 1
+        self.nb_of_shots += nb_of_shots
+        self._update_fit()
+        return self
+
+    @property
+    def bloch_vector(self):
+        """Averaged Bloch vector projections along X and Y, array of shape (2, nb_of_lines, nb_of_points)."""
+        if self._sums is None:
+            raise RuntimeError("No cryoscope data has been added yet, call add_chunk() first.")
+        return self._sums[0] / self.nb_of_shots
+
+    @property
+    def bloch_vector_err(self):
+        """Standard errors of the Bloch vector projections, array of shape (2, nb_of_lines, nb_of_points)."""
+        mean = self.bloch_vector
+        if self.projective:
+            # Each shot is a +/-1 outcome, so the single shot variance is 1 - <S>^2
+            variance = 1 - mean**2
+        elif self.nb_of_chunks > 1:
+            # Single shot variance estimated from the spread of the chunk averages
+            variance = (self._sums[1] - self.nb_of_shots * mean**2) / (self.nb_of_chunks - 1)
+        else:
+            return np.full(mean.shape, np.inf)
+        # The variance is floored to the resolution of one shot, so that the projections measured without spread (e.g.
+        # all the shots in the same state) keep a finite weight instead of a null uncertainty
+        return np.sqrt(np.clip(variance, 1 / self.nb_of_shots, None) / self.nb_of_shots)
+
+    @property
+    def phase(self):
+        """Unwrapped qubit phase in rad, referenced to the last point, with its standard error."""
+        (sx, sy), (dsx, dsy) = self.bloch_vector, self.bloch_vector_err
+        phase = np.unwrap(np.arctan2(sy, sx), axis=-1)
+        phase -= phase[:, -1:]
+        norm2 = np.clip(sx**2 + sy**2, 1e-12, None)
+        return phase, np.sqrt(sy**2 * dsx**2 + sx**2 * dsy**2) / norm2
+
+    @property
+    def detuning(self):
+        """Qubit detuning in MHz during the flux pulse, with its standard error."""
+        phase, dphase = self.phase
+        detuning = signal.savgol_filter(phase[:, self.pulse] / 2 / np.pi, axis=-1, **self._savgol)
+        # The derivative is a linear filter, the variances propagate with the squared coefficients (ignoring the
+        # polynomial fit used by savgol_filter at the edges)
+        coeffs = signal.savgol_coeffs(use="dot", **self._savgol) ** 2
+        pad = self.window_length // 2
+        variance = np.pad((dphase[:, self.pulse] / 2 / np.pi) ** 2, ((0, 0), (pad, pad)), mode="edge")
+        variance = np.stack([np.convolve(v, coeffs[::-1], mode="valid") for v in variance])
+        return detuning, np.sqrt(variance)
+
+    @property
+    def step_response(self):
+        """Flux step response (square root of the normalized detuning) with its standard error."""
+        detuning, ddetuning = self.detuning
+        # Normalization to the detuning averaged over the last quarter of the pulse
+        final = np.mean(detuning[:, -max(detuning.shape[1] // 4, 1) :], axis=1, keepdims=True)
+        response = np.sqrt(np.clip(detuning / final, 0, None))
+        error = ddetuning / np.abs(final) / 2 / np.clip(response, 1e-3, None)
+        # Floor of the uncertainties used as fit weights, in case of a null spread of the derivative
+        return response, np.clip(error, 1e-6, None)
+
+    @property
+    def converged(self):
+        """Boolean array telling for each flux line if the fitted filter parameters have converged."""
+        if self.stable_chunks is None:
+            return np.array([], dtype=bool)
+        return (self.stable_chunks >= self.patience) & (self.nb_of_shots >= self.min_shots)
+
+    @property
+    def done(self):
+        """True once the fitted filter parameters of all the flux lines have converged."""
+        return self.nb_of_chunks > 0 and bool(np.all(self.converged))
+
+    def _parameters(self, fit):
+        return np.concatenate([fit["gain"][:, None], fit["amplitudes"], fit["taus"]], axis=1)
+
+    def _update_fit(self):
+        response, _ = self.step_response
+        ts = np.arange(response.shape[1])
+        fit = fit_multi_exponential(ts, response, self.nb_of_exponentials)
+        if self.fit is not None:
+            new, old = self._parameters(fit), self._parameters(self.fit)
+            stable = np.all(np.abs(new - old) <= self.rtol * np.abs(old), axis=1)
+            self.stable_chunks = np.where(stable, self.stable_chunks + 1, 0)
+        self.fit = fit
+        self.fit_history.append(fit)